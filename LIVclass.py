@@ -1,10 +1,14 @@
 import os
-import pandas as pd
 from pathlib import Path
 import numpy as np
 import matplotlib.pyplot as plt
 import threshold as thresh
+import threshold_engine
+from scylla_parser import read_scylla_rows, LIV_TERMS
 import scipy.io
+import parse_cache
+from render import FigureSpec, InlineRenderer
+from summary_index import summary_row, POWER_CURRENTS
 
 """ 
     LIV class for processing probe station measurement files with no wavelength data. Processes raw measurement csvs, organizes data 
@@ -14,105 +18,154 @@ import scipy.io
             - LI curve (dBm)
             - Second and third derivatives of LI curve
             - VI curve
-            - I * dV/dI curve (differential resistance) - with fit
+            - I * dV/dI curve (differential resistance) - smoothed, with the threshold marked
 
     Computed Values:
-            - Threshold current for each channel
+            - Threshold current for each channel (second derivative), plus the estimate of every threshold_engine
+              estimator and their consensus (chN_threshold_<estimator>, chN_threshold_consensus)
             - Peak Power in channel 1
             - Voltage at peak power in channel 1
             - Current at peak power in channel 1
+            - Series resistance (ohm) and turn-on voltage (V) from the high-current part of the IV curve
+            - I*dV/dI kink at the channel 1 threshold (V)
 """
 
+# Bump when the saved results would change (threshold algorithms, IV analysis, saved variables): files processed with
+# an older version are processed again (processing_ledger.py)
+ANALYSIS_VERSION = 1
+# Settings that the results depend on, recorded per file in the processing ledger
+ANALYSIS_PARAMS = {"parser": parse_cache.PARSE_CACHE_VERSION, "threshold_estimators": sorted(threshold_engine.ESTIMATORS)}
+
+
+def load_rows(path, use_parse_cache=True):
+    """Parsed rows {label: array or None} of a raw LIV csv, from the parse cache if use_parse_cache."""
+    if use_parse_cache:
+        return parse_cache.load_or_parse(path, "liv", lambda: read_scylla_rows(path, LIV_TERMS))
+    return read_scylla_rows(path, LIV_TERMS)
+
+
+def liv_sweep(rows):
+    """
+    (current (mA), voltage (V), channels present, index of the data channel) of parsed LIV rows, as taken by
+    batch_analysis; None if the file has no current, voltage, temperature or channel data.
+    """
+    if rows["current"] is None or rows["voltage"] is None or rows["temperature"] is None:
+        return None
+    channels = [rows[f"channel {i}"] for i in range(4) if rows[f"channel {i}"] is not None]
+    if not channels:
+        return None
+    return rows["current"] * 1000, rows["voltage"], channels, 1 if rows["channel 0"] is not None else 0
+
+
+def batch_analysis(sweeps):
+    """
+    Thresholds and IV analysis of several LIV files in one vectorized pass (multi_LIV analyses the files of each
+    worker's chunk together; a single file is a batch of one).
+
+    Parameters
+    ----------
+    sweeps : list of tuple
+        (current (mA), voltage (V), list of channel powers (mW), index of the data channel) of each file (liv_sweep).
+
+    Returns
+    -------
+    results : list of dict
+        For each file, one value per channel in
+            - thresholds_2nd, thresholds_1st: thresh.batch_thresholds
+            - estimators: {name: thresholds} from threshold_engine.estimate_thresholds
+        and iv: thresh.batch_iv_analysis at the data channel threshold (arrays trimmed to the sweep).
+    """
+    points = max(len(current) for current, *_ in sweeps)
+    n_channels = max(len(channels) for _, _, channels, _ in sweeps)
+    current = thresh.stack_padded([current for current, *_ in sweeps], points)
+    voltage = thresh.stack_padded([voltage for _, voltage, *_ in sweeps], points)
+    # (files, channels, points); channels missing from a file are all NaN
+    power = np.stack([thresh.stack_padded([channels[c] if c < len(channels) else [] for _, _, channels, _ in sweeps],
+                                          points) for c in range(n_channels)], axis=1)
+
+    thresholds_2nd, thresholds_1st = thresh.batch_thresholds(current, power)
+    estimators = threshold_engine.estimate_thresholds(current, power)
+    data_thresholds = [thresholds_2nd[d, data] if data < len(channels) else np.nan
+                       for d, (_, _, channels, data) in enumerate(sweeps)]
+    iv = thresh.batch_iv_analysis(current, voltage, thresholds=data_thresholds)
+
+    results = []
+    for d, (I, _, channels, _) in enumerate(sweeps):
+        n, c = len(I), len(channels)
+        results.append({
+            "thresholds_2nd": thresholds_2nd[d, :c],
+            "thresholds_1st": thresholds_1st[d, :c],
+            "estimators": {name: values[d, :c] for name, values in estimators.items()},
+            "iv": {name: values[d, :n] if np.ndim(values) == 2 else values[d] for name, values in iv.items()},
+        })
+    return results
+
+
 class LIVclass:
-    def __init__(self, path, output_folder=None):
+    def __init__(self, path, output_folder=None, use_parse_cache=True, render_plots=True, renderer=None, rows=None,
+                 analysis=None):
         plt.close('all')  # Close all plots to free up memory
         self.path = Path(path)
         if not self.path.exists():
             raise FileNotFoundError(f"Cannot find input CSV: {self.path}")
         
         self.base_name = self.path.stem
+        self.use_parse_cache = use_parse_cache
+        self.render_plots = render_plots  # False: metrics only (thresholds, peak power and .mat), no per-device figures
+        self.renderer = renderer if renderer is not None else InlineRenderer()  # where figure specs are sent
         
-        # Load the CSV file
-        self.extract_data(output_folder=output_folder) # also computed thresholds, max power, and plots ALL LI curves and differential resistance
-        self.plot_iv()
+        # Load the CSV file (rows: already parsed; analysis: this file's entry of a batch_analysis over many files)
+        self.extract_data(output_folder=output_folder, rows=rows, analysis=analysis) # also computed thresholds, max power, and plots ALL LI curves and differential resistance
+        if self.render_plots:
+            self.plot_iv()
         #plt.show()
         return
 
     def plot_iv(self):
-        fig2, ax2 = plt.subplots()
+        base_name = self.base_name
+
+        # save svg and png
+        fig2 = FigureSpec([os.path.join(self.save_dir, base_name + "_IVcurve.svg"),
+                           os.path.join(self.save_dir, base_name + "_IVcurve.png")])
+        ax2 = fig2.axes[0]
         ax2.plot(self.current, self.voltage, color='black', marker='o', label="IV Curve")
         ax2.set_title(f"Current vs Voltage")
         ax2.set_xlabel("Current (mA)")
         ax2.set_ylabel("Voltage (V)")
         ax2.grid(True)
 
-        base_name = self.base_name
-
-        #save svg
-        svg_filename2 = base_name + f"_IVcurve.svg"
-        save_path_svg2 = os.path.join(self.save_dir, svg_filename2)
-        fig2.savefig(save_path_svg2, format="svg", bbox_inches="tight")
-        print(f"Saved IV curve svg to {save_path_svg2}")
-        #save png
-        png_filename2 = base_name + f"_IVcurve.png"
-        save_path_png2 = os.path.join(self.save_dir, png_filename2)
-        fig2.savefig(save_path_png2, format="png", bbox_inches="tight")
-        print(f"Saved IV curve png to {save_path_png2}") 
-
+        self.renderer.submit(fig2)
         return
 
-    def extract_data(self, output_folder=None):
-        df = pd.read_csv(self.path, header=None, on_bad_lines="skip", engine="python", skiprows=24)
-
-        # Define search terms for each target row
-        search_terms = {
-            "current": "Current",
-            "voltage": "Voltage",
-            "temperature": "Temperature",
-            "channel 0": "0",
-            "channel 1": "1",
-            "channel 2": "2",
-            "channel 3": "3"
-        }
-
+    def extract_data(self, output_folder=None, rows=None, analysis=None):
+        if rows is None:
+            rows = load_rows(self.path, self.use_parse_cache)
 
-        # Find indices where these terms occur
-        indices = {}
-        for key, term in search_terms.items():
-            matches = df[0].str.contains(term, case=False, na=False)
-            if matches.any():
-                indices[key] = matches.idxmax()
-            else:
-                indices[key] = None
-        #print("Indices found:", indices)
-        # Remove the first column (used for matching)
-        del df[0]
-
-        # Extract data rows from the DataFrame
-        current = df.loc[indices["current"]] if indices["current"] is not None else None
-        if indices["current"] is not None:
-            self.current = pd.to_numeric(df.loc[indices["current"]], errors='coerce') * 1000
+        # Extract data rows (None if the label was not found)
+        current = rows["current"]
+        if current is not None:
+            self.current = current * 1000
         else:
             print("No current data found for LIV, aborting file...")
             return
 
         print("Current data extracted")
         # Extract voltage and temperature data - make None if not found to handle errors
-        voltage = df.loc[indices["voltage"]] if indices["voltage"] is not None else None
-        temperature = df.loc[indices["temperature"]] if indices["temperature"] is not None else None
+        voltage = rows["voltage"]
+        temperature = rows["temperature"]
         if voltage is not None and temperature is not None:
-            self.voltage = pd.to_numeric(df.loc[indices["voltage"]], errors='coerce')
-            self.temperature = pd.to_numeric(df.loc[indices["temperature"]], errors='coerce')
+            self.voltage = voltage
+            self.temperature = temperature
         else:
             print("No Voltage, and/or Temperature data found. Invalid File.")
             return
         print("Voltage and Temperature data extracted")
 
 
-        ch0 = pd.to_numeric(df.loc[indices["channel 0"]],errors='coerce') if indices["channel 0"] is not None else None
-        ch1 = pd.to_numeric(df.loc[indices["channel 1"]],errors='coerce') if indices["channel 1"] is not None else None
-        ch2 = pd.to_numeric(df.loc[indices["channel 2"]],errors='coerce')  if indices["channel 2"] is not None else None
-        ch3 = pd.to_numeric(df.loc[indices["channel 3"]],errors='coerce')  if indices["channel 3"] is not None else None
+        ch0 = rows["channel 0"]
+        ch1 = rows["channel 1"]
+        ch2 = rows["channel 2"]
+        ch3 = rows["channel 3"]
 
         ch0_log = 10 * np.log10(ch0) if ch0 is not None else None
         ch1_log = 10 * np.log10(ch1) if ch1 is not None else None
@@ -132,9 +185,10 @@ class LIVclass:
 
         # Formulate comparison data (Max power of data channel and assoc current)
         if ch1_idx is not None:
-            self.peak_power = channels[ch1_idx].max()
-            self.peak_power_I = current[channels[ch1_idx].idxmax()]
-            self.peak_power_V = voltage[channels[ch1_idx].idxmax()]
+            peak_idx = np.nanargmax(channels[ch1_idx])
+            self.peak_power = channels[ch1_idx][peak_idx]
+            self.peak_power_I = current[peak_idx]
+            self.peak_power_V = voltage[peak_idx]
         else:
             print("No valid data channel found for peak power calculation.")
 
@@ -147,30 +201,36 @@ class LIVclass:
         if not os.path.exists(self.save_dir):
             os.makedirs(self.save_dir)
 
-        # Get thresholds
-        # PLOT differential resistance (dV/dI vs I)   
-        thresh.fit_idvdi(self.current, self.voltage, self.base_name, self.save_dir)
-
-
         #plotting LI curves + finding threshold
         # Initialize threshold variables for each channel
         ch0_threshold = np.nan
         ch1_threshold = np.nan
         ch2_threshold = np.nan
         ch3_threshold = np.nan
+        estimator_thresholds = {}
 
         print("plotting LI curve and finding threshold for each channel")
         num_valid = len(channels)
         if num_valid == 0:
             print("No valid channels to plot.")
         else:
+            # Thresholds of all channels, all registered threshold estimators (and their consensus) and the IV
+            # analysis in one vectorized pass, unless this file was analysed in a batch with others
+            if analysis is None:
+                analysis = batch_analysis([(self.current, self.voltage, channels, ch1_idx)])[0]
+            thresholds_2nd, thresholds_1st = analysis["thresholds_2nd"], analysis["thresholds_1st"]
+            for name, values in analysis["estimators"].items():
+                for i, value in enumerate(values):
+                    estimator_thresholds[f"ch{i}_threshold_{name}"] = value
+
             for (i, ch) in enumerate(channels):
                 print(f"Processing Channel {i} with {len(ch)} data points.")
+                ch_threshold = thresholds_2nd[i]
 
-                # Plot all LIV curves (+derivative) and find threshold
-                ch_threshold = thresh.run_liv(self.current, ch, self.base_name, self.save_dir, i)
-                if ch_threshold is None:
-                    ch_threshold = np.nan
+                # Plot all LIV curves (+derivative) with the threshold
+                if self.render_plots:
+                    thresh.run_liv(self.current, ch, self.base_name, self.save_dir, i, renderer=self.renderer,
+                                   thresholds=(thresholds_2nd[i], thresholds_1st[i]))
 
                 # Save threshold to the corresponding variable
                 if i == 0:
@@ -184,6 +244,11 @@ class LIVclass:
 
                 print(f"Channel {i} threshold: {ch_threshold} mA")
 
+        # Differential resistance (I*dV/dI vs I): series resistance, turn-on voltage and the kink at the data channel threshold
+        data_threshold = thresholds_2nd[ch1_idx] if ch1_idx < num_valid else None
+        iv_results = thresh.fit_idvdi(self.current, self.voltage, self.base_name, self.save_dir, render_plots=self.render_plots,
+                                      renderer=self.renderer, threshold=data_threshold, iv=analysis["iv"])
+
         data_dict = {
             "current": self.current,
             "voltage": self.voltage,
@@ -202,7 +267,9 @@ class LIVclass:
             "ch3_threshold": ch3_threshold,
             "peak_power": self.peak_power,
             "peak_power_I": self.peak_power_I,
-            "peak_power_V": self.peak_power_V
+            "peak_power_V": self.peak_power_V,
+            **iv_results,
+            **estimator_thresholds
         }
 
 
@@ -210,6 +277,8 @@ class LIVclass:
         mat_filename = self.base_name + ".mat"
         self.save_path_mat = os.path.join(self.save_dir, mat_filename)
         scipy.io.savemat(self.save_path_mat, data_dict)
+        self.data_dict = data_dict  # kept for the campaign store (multi_LIV)
+        self.summary = summary_row(data_dict, power_currents=POWER_CURRENTS)  # row of the LIV summary index
         print(f"Data dictionary saved to {self.save_path_mat}")
 
 
@@ -2,6 +2,12 @@ import pandas as pd
 from pathlib import Path
 import numpy as np
 import matplotlib.pyplot as plt
+from scylla_parser import read_osa_sweeps
+import parse_cache
+from osa_file import OSAFile
+from render import FigureSpec, InlineRenderer, AXES_COORDS, minmax_decimate
+from summary_index import summary_row
+from filename_meta import parse_filename
 
 """ 
     OSA class for processing Optical Spectrum Analyzer (OSA) files. Processes raw OSA measurement csvs, organizes data 
@@ -16,10 +22,126 @@ import matplotlib.pyplot as plt
             - Peak Power (dBm) for each sweep
             - Wavelength (nm) at peak power for each sweep
             - 2nd and 3rd degree polynomial fit coefficients for Current vs Peak Wavelength across sweeps
+
+    Spectra are reduced to a min/max envelope of about SPECTRUM_PLOT_POINTS points per sweep before plotting (peaks are
+    kept exactly); the .mat output always holds the full traces. With rasterize_spectra=True the spectrum lines are
+    embedded in the .svg as an image, which keeps the file small for dense sweeps.
+
+    The spectra are saved as dense arrays (one contiguous read per device, no cell arrays):
+            - optical_power_dBm: n_sweeps x n_points matrix, NaN padded past the end of shorter sweeps
+            - wavelength_nm: one shared axis (n_points,) when every sweep has the same wavelength grid, otherwise an
+              n_sweeps x n_points matrix like optical_power_dBm
+            - sweep_lengths: number of valid points of each sweep
+    spectral_map() turns the loaded variables (or those of .mat files saved as per-sweep lists) back into matrices.
+
+    With stream_sweeps=True the csv is read through OSAFile instead of being parsed whole (and the parse cache is not
+    used): one sweep at a time is decoded from the memory-mapped file, its peak taken and its trace drawn, and its
+    spectrum written into the saved matrices. Only the optical_power_dBm matrix is held, and a wavelength matrix only
+    if the sweeps do not share a grid; the saved results are the same as without streaming.
 """
 
+# Points kept per sweep in the spectrum plot (min/max envelope); None plots every raw point
+SPECTRUM_PLOT_POINTS = 2000
+# Resolution of rasterized spectrum lines inside the .svg
+RASTER_DPI = 200
+# Bump when the saved results would change (peaks, fits, saved variables): files processed with an older version are
+# processed again
+ANALYSIS_VERSION = 3
+ANALYSIS_PARAMS = {"parser": parse_cache.PARSE_CACHE_VERSION}
+
+
+def shared_axis(wavelength):
+    """The common row of an n_sweeps x n_points wavelength matrix (NaN padding included), or None if rows differ."""
+    if len(wavelength) == 0 or not np.array_equal(wavelength, np.broadcast_to(wavelength[0], wavelength.shape),
+                                                  equal_nan=True):
+        return None
+    return wavelength[0]
+
+
+def spectral_map(data, copy=True):
+    """
+    Spectra of one device as matrices, from its OSA data (the dict saved to .mat or loaded with scipy.io.loadmat).
+
+    Parameters
+    ----------
+    data : mapping
+        With optical_power_dBm and wavelength_nm, and sweep_lengths if saved (older .mat files hold one list per sweep,
+        loaded as a matrix or as a cell array when the sweeps differ in length).
+    copy : bool
+        False: a shared wavelength axis is returned as a read-only broadcast view (stride 0 along the sweeps) instead
+        of being repeated in memory.
+
+    Returns
+    -------
+    wavelength, power : ndarray
+        n_sweeps x n_points, NaN padded past each sweep's length (a shared wavelength axis is repeated for every sweep)
+    lengths : ndarray of int
+        Number of valid points of each sweep.
+    """
+    power = np.asarray(data["optical_power_dBm"])
+    wavelength = np.asarray(data["wavelength_nm"])
+    if power.dtype == object:
+        # Per-sweep cells of different lengths
+        rows = [[np.asarray(row, dtype=float).ravel() for row in array.ravel()] for array in (wavelength, power)]
+        n_points = max((len(row) for row in rows[1]), default=0)
+        wavelength, power = (np.full((len(rows[1]), n_points), np.nan) for _ in range(2))
+        for k, (wl, pw) in enumerate(zip(*rows)):
+            wavelength[k, :len(wl)] = wl
+            power[k, :len(pw)] = pw
+        return wavelength, power, np.array([len(pw) for pw in rows[1]])
+
+    power = np.atleast_2d(power.astype(float))
+    wavelength = wavelength.astype(float)
+    if wavelength.ndim == 1 or wavelength.shape[0] == 1:
+        wavelength = np.broadcast_to(wavelength.ravel(), power.shape)
+        if copy:
+            wavelength = wavelength.copy()
+    if "sweep_lengths" in data:
+        lengths = np.asarray(data["sweep_lengths"], dtype=int).ravel()
+    else:
+        lengths = np.full(power.shape[0], power.shape[1])
+    return wavelength, power, lengths
+
+
+class SpectrumMatrices:
+    """
+    The saved spectra of a device, filled one sweep at a time: the optical_power_dBm matrix, the sweep lengths, and the
+    wavelength axis, which becomes an n_sweeps x n_points matrix only once a sweep's grid differs from the first one.
+    """
+
+    def __init__(self, n_sweeps, n_points):
+        self.power = np.full((n_sweeps, n_points), np.nan)
+        self.lengths = np.zeros(n_sweeps, dtype=int)
+        self._axis = None  # shared wavelength row (NaN padded), while every sweep so far has it
+        self._wavelength = None  # n_sweeps x n_points once the grids differ
+
+    def add(self, k, wavelength, power):
+        n = len(power)
+        self.power[k, :n] = power
+        self.lengths[k] = n
+        row = np.full(self.power.shape[1], np.nan)
+        row[:n] = wavelength
+        if self._wavelength is None:
+            if self._axis is None:
+                self._axis = row
+                return
+            if np.array_equal(row, self._axis, equal_nan=True):
+                return
+            self._wavelength = np.full(self.power.shape, np.nan)
+            self._wavelength[:k] = self._axis
+        self._wavelength[k] = row
+
+    def wavelength_nm(self):
+        """The shared wavelength axis, or the n_sweeps x n_points matrix if the sweeps differ (as saved to .mat)."""
+        if self._wavelength is not None:
+            return self._wavelength
+        return self._axis if self._axis is not None else np.full(self.power.shape, np.nan)
+
+
 class OSAclass:
-    def __init__(self, path, output_folder=None):
+    def __init__(self, path, output_folder=None, use_parse_cache=True, render_plots=True, renderer=None,
+                 plot_max_points=SPECTRUM_PLOT_POINTS, rasterize_spectra=False, archive=None,
+                 idtag=None, stream_sweeps=False):
         plt.close('all')  # Close all existing plots to avoid clutter
         self.path = Path(path)
         if not self.path.exists():
@@ -27,6 +149,15 @@ class OSAclass:
 
         self.base_name = self.path.stem
         self.output_folder = output_folder
+        self.use_parse_cache = use_parse_cache
+        self.render_plots = render_plots  # False: metrics only (peaks, fits and .mat), no spectrum/peak figures
+        self.renderer = renderer if renderer is not None else InlineRenderer()  # where figure specs are sent
+        self.plot_max_points = plot_max_points
+        self.rasterize_spectra = rasterize_spectra
+        self.archive = archive  # SpectralArchive the spectra are appended to (None: .mat only)
+        self.stream_sweeps = stream_sweeps  # True: decode one sweep at a time from the memory-mapped csv (OSAFile)
+        # IDtag saved in the .mat: given by multi_OSA (unique among the files it processes), else from the filename
+        self.idtag = idtag if idtag is not None else self.get_IDtag(self.path.name)
 
         # Process the file and generate outputs
         self.sweep_osa()
@@ -37,125 +168,112 @@ class OSAclass:
         import numpy as np
         import os
 
-        # Load the file as a CSV
-        df = pd.read_csv(self.path, header=None, skiprows=24, on_bad_lines="skip", engine="python")
-
-        # Organize into sweeps
-        df["Sweep"] = df.index // 2
-
-        # Re-read file for longer data rows
-        df2 = pd.read_csv(self.path, header=None, skiprows=26, on_bad_lines="skip", engine="python")
-
-        # Filter rows to extract the desired titles
-        extract = ["Wavelength (nm)", "Optical power (dBm)"]
-        df2 = df2[df2[0].isin(extract)]
-
-        # Group rows in sequential pairs
-        df2["Sweep"] = df2.index // 2
-        df2["Sweep"] = df2["Sweep"].rank(method="dense").astype(int) - 1
-
-        waves = df2[df2[0] == "Wavelength (nm)"].copy()
-        pows = df2[df2[0] == "Optical power (dBm)"].copy()
-
-        waves["Property"] = "Wavelength (nm)"
-        pows["Property"] = "Optical power (dBm)"
-
-        # Combine wavelength and power frames
-        combined_rows = pd.concat([waves, pows])
-        del combined_rows[0]
-
-        # Reshape the dataframe into a long format
-        df_long = combined_rows.melt(id_vars=["Sweep", "Property"], value_name="Value")
-
-        # Pivot the data to get each property as a column for each sweep
-        pivot_df = df_long.pivot_table(index=["Sweep"], columns="Property", values="Value", aggfunc=list)
-
-        # Extract "Current (A)" and "Temperature (C)" rows from df
-        currents = ["Current (A)"]
-        temperatures = ["Temperature (C)"]
-        curr = df[df[0].isin(currents)].reset_index(drop=True)
-        temp = df[df[0].isin(temperatures)].reset_index(drop=True)
-        curr[1] = curr[1].astype(float) * 1000  # Convert current from A to mA
-
-        # Combine current and temperature data into one DataFrame
-        conditions = pd.DataFrame({
-            "Sweep": range(len(curr)),
-            "Current (mA)": curr[1].values,
-            "Temperature (C)": temp[1].values
-        })
-
-        # Merge pivot data with conditions based on "Sweep"
-        df2_merged = pivot_df.merge(conditions, on="Sweep")
-        df2_merged.set_index("Sweep", inplace=True)
+        # Sweeps as (current in A, temperature in C, wavelength, power), either decoded one at a time from the
+        # memory-mapped csv (the saved spectra are then filled in sweep by sweep) or read in one pass as
+        # n_sweeps x n_points matrices, NaN padded
+        osa_file = None
+        if self.stream_sweeps:
+            osa_file = OSAFile(self.path)
+            n_sweeps = len(osa_file)
+            spectra = SpectrumMatrices(n_sweeps, osa_file.width)
+            sweep_rows = ((s.current, s.temperature, s.wavelength, s.power) for s in osa_file)
+        else:
+            if self.use_parse_cache:
+                sweeps = parse_cache.load_or_parse(self.path, "osa", lambda: read_osa_sweeps(self.path))
+            else:
+                sweeps = read_osa_sweeps(self.path)
+            n_sweeps = len(sweeps["current"])
+            spectra = None
+            sweep_rows = ((sweeps["current"][k], sweeps["temperature"][k], sweeps["wavelength"][k, :n],
+                           sweeps["power"][k, :n]) for k, n in enumerate(sweeps["n_points"]))
+        currents_mA = np.empty(n_sweeps)
+        temperatures_C = np.empty(n_sweeps)
 
-        # Rename and reorder columns for clarity
-        df2_merged.columns = ["Optical Power (dBm)", "Wavelength (nm)", "Current (mA)", "Temperature (C)"]
-        df2_merged = df2_merged[["Current (mA)", "Temperature (C)", "Optical Power (dBm)", "Wavelength (nm)"]]
+        save_dir = self.output_folder if self.output_folder else self.path.parent
+        if not os.path.exists(save_dir):
+            os.makedirs(save_dir)
 
-        OSA_df = df2_merged
+        # Generate plots (each saved as both PNG and SVG formats)
+        render = self.render_plots
+        if render:
+            cmap = plt.get_cmap('inferno')
+            colors = cmap(np.linspace(0.2, 0.9, n_sweeps))
 
-        # Generate plots
-        cmap = plt.get_cmap('inferno')
-        colors = cmap(np.linspace(0.2, 0.9, len(OSA_df.index)))
+            def figure(suffix, raster_dpi=None):
+                return FigureSpec([os.path.join(save_dir, f"{self.base_name}_new_{suffix}.png"),
+                                   os.path.join(save_dir, f"{self.base_name}_new_{suffix}.svg")], raster_dpi=raster_dpi)
 
-        fig1, ax1 = plt.subplots()  # Spectrum figure
-        fig2, ax2 = plt.subplots()  # Peak power vs wavelength
-        fig3, ax3 = plt.subplots()  # Peak power vs current
-        fig4, ax4 = plt.subplots()  # Peak wavelength vs current
+            fig1 = figure("spectrum", raster_dpi=RASTER_DPI if self.rasterize_spectra else None)  # Spectrum figure
+            fig2 = figure("WLpeaks")  # Peak power vs wavelength
+            fig3 = figure("Ipeaks")  # Peak power vs current
+            fig4 = figure("WLpeaks2")  # Peak wavelength vs current
+            ax1, ax2, ax3, ax4 = (fig.axes[0] for fig in (fig1, fig2, fig3, fig4))
 
         peak_pows = []
         peak_wls = []
         currents = []
 
-        for sweep in OSA_df.index:
-            wavelength = OSA_df.at[sweep, "Wavelength (nm)"]
-            power = OSA_df.at[sweep, "Optical Power (dBm)"]
-            current = OSA_df.at[sweep, "Current (mA)"]
-            temperatures = OSA_df.at[sweep, "Temperature (C)"]
-
-            max_power = max(power)
-            peak_pows.append(max_power)
-            max_wavelength = wavelength[power.index(max_power)]
-            peak_wls.append(max_wavelength)
-            currents.append(current)
-
-            # Always plot spectrum (ax1) for all sweeps
-            ax1.plot(wavelength, power, label=f"{current} / {temperatures}", color=colors[sweep])
-
-            # Only plot current-dependent plots (ax2, ax3, ax4) starting from 25mA (skip first sweep at 20mA)
-            if current >= 25:
-                ax2.scatter(current, max_wavelength, label=f"{current}mA", color=colors[sweep])
-                ax3.scatter(current, max_power, label=f"{current}mA", color=colors[sweep])
-                ax4.scatter(current, max_wavelength, label=f"{current}mA", color=colors[sweep])
+        try:
+            for sweep, (current_A, temperatures, wavelength, power) in enumerate(sweep_rows):
+                current = current_A * 1000  # Convert current from A to mA
+                currents_mA[sweep] = current
+                temperatures_C[sweep] = temperatures
+                if spectra is not None:
+                    spectra.add(sweep, wavelength, power)
+
+                peak_idx = np.nanargmax(power)
+                max_power = power[peak_idx]
+                peak_pows.append(max_power)
+                max_wavelength = wavelength[peak_idx]
+                peak_wls.append(max_wavelength)
+                currents.append(current)
+
+                if not render:
+                    continue
+
+                # Always plot spectrum (ax1) for all sweeps (min/max envelope of the trace, peak kept exactly)
+                plot_wl, plot_pow = minmax_decimate(wavelength, power, self.plot_max_points)
+                ax1.plot(plot_wl, plot_pow, label=f"{current} / {temperatures}", color=colors[sweep],
+                         rasterized=self.rasterize_spectra)
+
+                # Only plot current-dependent plots (ax2, ax3, ax4) starting from 25mA (skip first sweep at 20mA)
+                if current >= 25:
+                    ax2.scatter(current, max_wavelength, label=f"{current}mA", color=colors[sweep])
+                    ax3.scatter(current, max_power, label=f"{current}mA", color=colors[sweep])
+                    ax4.scatter(current, max_wavelength, label=f"{current}mA", color=colors[sweep])
+        finally:
+            if osa_file is not None:
+                osa_file.close()
 
         # Set plot titles and labels
-        idtag = self.get_IDtag(self.path.name)
-        ax1.set_xlabel('Wavelength (nm)')
-        ax1.set_ylabel('Optical Power (dBm)')
-        ax1.set_title(f'OSA Spectrum vs Wavelength - {idtag}')
-        ax1.grid(True, alpha=0.3)
-        ax1.legend()
+        if render:
+            idtag = self.idtag
+            ax1.set_xlabel('Wavelength (nm)')
+            ax1.set_ylabel('Optical Power (dBm)')
+            ax1.set_title(f'OSA Spectrum vs Wavelength - {idtag}')
+            ax1.grid(True, alpha=0.3)
+            ax1.legend()
         
-        ax2.set_xlabel('Current (mA)')
-        ax2.set_ylabel('Peak Wavelength (nm)')
-        ax2.set_title(f'Peak Wavelength vs Current (with 2nd Order Fit) - {idtag}')
-        ax2.grid(True, alpha=0.3)
-        ax2.legend()
-        ax2.set_xlim(left=25)  # Start x-axis from 25mA
+            ax2.set_xlabel('Current (mA)')
+            ax2.set_ylabel('Peak Wavelength (nm)')
+            ax2.set_title(f'Peak Wavelength vs Current (with 2nd Order Fit) - {idtag}')
+            ax2.grid(True, alpha=0.3)
+            ax2.legend()
+            ax2.set_xlim(left=25)  # Start x-axis from 25mA
         
-        ax3.set_xlabel('Current (mA)')
-        ax3.set_ylabel('Peak Power (dBm)')
-        ax3.set_title(f'Peak Power vs Current - {idtag}')
-        ax3.grid(True, alpha=0.3)
-        ax3.legend()
-        ax3.set_xlim(left=25)  # Start x-axis from 25mA
+            ax3.set_xlabel('Current (mA)')
+            ax3.set_ylabel('Peak Power (dBm)')
+            ax3.set_title(f'Peak Power vs Current - {idtag}')
+            ax3.grid(True, alpha=0.3)
+            ax3.legend()
+            ax3.set_xlim(left=25)  # Start x-axis from 25mA
         
-        ax4.set_xlabel('Current (mA)')
-        ax4.set_ylabel('Peak Wavelength (nm)')
-        ax4.set_title(f'Peak Wavelength vs Current (with 3rd Order Fit) - {idtag}')
-        ax4.grid(True, alpha=0.3)
-        ax4.legend()
-        ax4.set_xlim(left=25)  # Start x-axis from 25mA
+            ax4.set_xlabel('Current (mA)')
+            ax4.set_ylabel('Peak Wavelength (nm)')
+            ax4.set_title(f'Peak Wavelength vs Current (with 3rd Order Fit) - {idtag}')
+            ax4.grid(True, alpha=0.3)
+            ax4.legend()
+            ax4.set_xlim(left=25)  # Start x-axis from 25mA
             
         # Polynomial fits: 2nd and 3rd degree fit for peak wavelength vs current
         if len(currents) > 3:  # Need at least 4 points for a 3rd degree fit
@@ -192,48 +310,44 @@ class OSAclass:
             fit_y_vals = poly_func(fit_x_vals)
             fit_y_vals2 = poly_func2(fit_x_vals)
             
-            ax2.plot(fit_x_vals, fit_y_vals, 'k--', linewidth=2, label="2nd Deg. Fit")
-            ax4.plot(fit_x_vals, fit_y_vals2, 'k--', linewidth=2, label="3rd Deg. Fit")
-            
-            # Update legends to include fit lines
-            ax2.legend()
-            ax4.legend()
-            
-            # Annotate polynomial equations
-            eq_text = f"Fit: y = {poly_coeffs[0]:.3e}x² + {poly_coeffs[1]:.3e}x + {poly_coeffs[2]:.3f}"
-            eq_text2 = (f"Fit: y = {poly_coeffs2[0]:.3e}x³ + {poly_coeffs2[1]:.3e}x² + "
-                        f"{poly_coeffs2[2]:.3e}x + {poly_coeffs2[3]:.3f}")
-            
-            ax2.text(0.05, 0.95, eq_text, transform=ax2.transAxes, fontsize=9, 
-                     verticalalignment='top', bbox=dict(boxstyle='round', facecolor='white', alpha=0.6))
-            ax4.text(0.05, 0.95, eq_text2, transform=ax4.transAxes, fontsize=9, 
-                     verticalalignment='top', bbox=dict(boxstyle='round', facecolor='white', alpha=0.6))
+            if render:
+                ax2.plot(fit_x_vals, fit_y_vals, 'k--', linewidth=2, label="2nd Deg. Fit")
+                ax4.plot(fit_x_vals, fit_y_vals2, 'k--', linewidth=2, label="3rd Deg. Fit")
+                
+                # Update legends to include fit lines
+                ax2.legend()
+                ax4.legend()
+                
+                # Annotate polynomial equations
+                eq_text = f"Fit: y = {poly_coeffs[0]:.3e}x² + {poly_coeffs[1]:.3e}x + {poly_coeffs[2]:.3f}"
+                eq_text2 = (f"Fit: y = {poly_coeffs2[0]:.3e}x³ + {poly_coeffs2[1]:.3e}x² + "
+                            f"{poly_coeffs2[2]:.3e}x + {poly_coeffs2[3]:.3f}")
+                
+                ax2.text(0.05, 0.95, eq_text, transform=AXES_COORDS, fontsize=9, 
+                         verticalalignment='top', bbox=dict(boxstyle='round', facecolor='white', alpha=0.6))
+                ax4.text(0.05, 0.95, eq_text2, transform=AXES_COORDS, fontsize=9, 
+                         verticalalignment='top', bbox=dict(boxstyle='round', facecolor='white', alpha=0.6))
 
         # Save plots
-        save_dir = self.output_folder if self.output_folder else self.path.parent
-        if not os.path.exists(save_dir):
-            os.makedirs(save_dir)
+        if render:
+            self.renderer.submit_all([fig1, fig2, fig3, fig4])
 
-        # Save as both PNG and SVG formats
-        fig1.savefig(os.path.join(save_dir, f"{self.base_name}_new_spectrum.png"), bbox_inches="tight")
-        fig2.savefig(os.path.join(save_dir, f"{self.base_name}_new_WLpeaks.png"), bbox_inches="tight")
-        fig3.savefig(os.path.join(save_dir, f"{self.base_name}_new_Ipeaks.png"), bbox_inches="tight")
-        fig4.savefig(os.path.join(save_dir, f"{self.base_name}_new_WLpeaks2.png"), bbox_inches="tight")
-        
-        fig1.savefig(os.path.join(save_dir, f"{self.base_name}_new_spectrum.svg"), bbox_inches="tight")
-        fig2.savefig(os.path.join(save_dir, f"{self.base_name}_new_WLpeaks.svg"), bbox_inches="tight")
-        fig3.savefig(os.path.join(save_dir, f"{self.base_name}_new_Ipeaks.svg"), bbox_inches="tight")
-        fig4.savefig(os.path.join(save_dir, f"{self.base_name}_new_WLpeaks2.svg"), bbox_inches="tight")
-
-        # Save data to .mat file
+        # Save data to .mat file (spectra as dense matrices; one wavelength axis if all sweeps share the grid)
+        if spectra is not None:
+            optical_power, wavelength_nm, n_points = spectra.power, spectra.wavelength_nm(), spectra.lengths
+        else:
+            wavelength_axis = shared_axis(sweeps["wavelength"])
+            optical_power, n_points = sweeps["power"], sweeps["n_points"]
+            wavelength_nm = wavelength_axis if wavelength_axis is not None else sweeps["wavelength"]
         d_OSA = {
-            "IDtag": self.get_IDtag(self.path.name),  # Add IDtag for multi_osa compatibility
+            "IDtag": self.idtag,  # Add IDtag for multi_osa compatibility
             "peak_power": peak_pows,
             "peak_wavelength": peak_wls,
-            "current_mA": OSA_df["Current (mA)"].tolist(),
-            "temperature_C": OSA_df["Temperature (C)"].tolist(),
-            "optical_power_dBm": OSA_df["Optical Power (dBm)"].tolist(),
-            "wavelength_nm": OSA_df["Wavelength (nm)"].tolist()
+            "current_mA": currents_mA.tolist(),
+            "temperature_C": temperatures_C.tolist(),
+            "optical_power_dBm": optical_power,
+            "wavelength_nm": wavelength_nm,
+            "sweep_lengths": n_points
         }
         
         # Add polynomial fit data if available
@@ -242,30 +356,25 @@ class OSAclass:
             d_OSA["polyfit_peakWL_vs_I_deg3_coeffs"] = poly_coeffs2.tolist()
             
         # Save with _new suffix for compatibility with multi_osa.py
-        sio.savemat(os.path.join(save_dir, f"{self.base_name}_new.mat"), d_OSA, appendmat=True)
+        mat_path = os.path.join(save_dir, f"{self.base_name}_new.mat")
+        sio.savemat(mat_path, d_OSA, appendmat=True)
+        if self.archive is not None:
+            self.archive.append(d_OSA["IDtag"], d_OSA, source=mat_path)
+        self.data_dict = d_OSA  # kept for the campaign store (multi_OSA)
+        self.summary = summary_row(d_OSA)  # row of the OSA summary index (the polynomial fit coefficients)
 
         print(f"Outputs saved in: {save_dir}")
         #print(d_OSA)
-        print(OSA_df)
+        print(pd.DataFrame({
+            "Current (mA)": currents_mA,
+            "Temperature (C)": temperatures_C,
+            "Peak Power (dBm)": peak_pows,
+            "Peak Wavelength (nm)": peak_wls
+        }))
         
     def get_IDtag(self, filename: str) -> str:
-        """Extract IDtag from filename using same method as multi_LIV"""
-        import re
-        from pathlib import Path
-        
-        base = Path(filename).stem
-        # Expanded regex to handle more variations, including '_clad' and other suffixes
-        match = re.search(r"Chip\w+_R\d+(_clad)?", base)
-        if match:
-            id_tag = match.group(0)  # Retain '_clad' if present
-        else:
-            id_tag = "Unknown_ID"
-
-        # Detailed logging for debugging
-        print(f"Debug: OSAclass - Filename: {filename}, Base: {base}, Extracted ID Tag: {id_tag}")
-        return id_tag
-    
-
+        """IDtag of a file: chip, device and cladding from its name, as multi_OSA (see filename_meta.py)."""
+        return parse_filename(filename).idtag()
 
 
 if __name__ == "__main__":
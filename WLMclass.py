@@ -1,11 +1,14 @@
 
 import os
-import pandas as pd
 from pathlib import Path
 import numpy as np
 import matplotlib.pyplot as plt
 #import threshold as thresh
+from scylla_parser import read_scylla_rows, WLM_TERMS
 import scipy.io
+import parse_cache
+from render import FigureSpec, InlineRenderer
+from summary_index import summary_row
 
 """ 
     WLM class for processing Wavelength Meter measurement files (LIV-type files with additional wavelength data). Processes raw measurement csvs, 
@@ -24,50 +27,54 @@ import scipy.io
             - Wavelength at peak power in channel 1
 """
 
+# Bump when the saved results would change: files processed with an older version are processed again
+ANALYSIS_VERSION = 1
+ANALYSIS_PARAMS = {"parser": parse_cache.PARSE_CACHE_VERSION}
+
 class WLMclass:
-    def __init__(self, path, output_folder=None):
+    def __init__(self, path, output_folder=None, use_parse_cache=True, render_plots=True, renderer=None):
         plt.close('all')  # Close all plots to free up memory
         self.path = Path(path)
         if not self.path.exists():
             raise FileNotFoundError(f"Cannot find input CSV: {self.path}")
         
         self.base_name = self.path.stem
+        self.use_parse_cache = use_parse_cache
+        self.render_plots = render_plots  # False: metrics only (peak values and .mat), no per-device figures
+        self.renderer = renderer if renderer is not None else InlineRenderer()  # where figure specs are sent
         
         # Extract and process data and plot LI curve
         self.extract_data(output_folder=output_folder)
 
         #Plot IV curve and rest of WLM plots
-        self.plot_iv()
-        self.plot_li()
-        self.plot_wl_vs_temp()
-        self.plot_wl_vs_current()
+        if self.render_plots:
+            self.plot_iv()
+            self.plot_li()
+            self.plot_wl_vs_temp()
+            self.plot_wl_vs_current()
         #plt.show()
         return
 
     def plot_iv(self):
-        fig2, ax2 = plt.subplots()
+        # save svg and png
+        fig2 = FigureSpec([os.path.join(self.save_dir, self.base_name + "_IVcurve.svg"),
+                           os.path.join(self.save_dir, self.base_name + "_IVcurve.png")])
+        ax2 = fig2.axes[0]
         ax2.plot(self.current*1000, self.voltage, color='black', marker='o', label="IV Curve")
         ax2.set_title(f"Current vs Voltage")
         ax2.set_xlabel("Current (mA)")
         ax2.set_ylabel("Voltage (V)")
         ax2.grid(True)
 
-        #save svg
-        svg_filename2 = self.base_name + f"_IVcurve.svg"
-        save_path_svg2 = os.path.join(self.save_dir, svg_filename2)
-        fig2.savefig(save_path_svg2, format="svg", bbox_inches="tight")
-        print(f"Saved IV curve svg to {save_path_svg2}")
-        #save png
-        png_filename2 = self.base_name + f"_IVcurve.png"
-        save_path_png2 = os.path.join(self.save_dir, png_filename2)
-        fig2.savefig(save_path_png2, format="png", bbox_inches="tight")
-        print(f"Saved IV curve png to {save_path_png2}") 
-
+        self.renderer.submit(fig2)
         return
     
 
     def plot_wl_vs_temp(self):
-        fig, ax = plt.subplots()
+        # Save the WL vs Temp plot as SVG and PNG files in the output folder
+        fig = FigureSpec([os.path.join(self.save_dir, self.base_name + "_Temp_vs_WL.svg"),
+                          os.path.join(self.save_dir, self.base_name + "_WL_vs_Temp.png")])
+        ax = fig.axes[0]
         mask = self.wavelength > 1000
         ax.scatter(self.wavelength[mask], self.temperature[mask], color='black', marker='o')
         ax.set_title("Temperature vs Wavelength")
@@ -75,22 +82,15 @@ class WLMclass:
         ax.set_xlabel("Wavelength (nm)")
         ax.grid(True)
 
-        # Save the WL vs Temp plot as an SVG file in the output folder
-        wl_temp_filename = self.base_name + "_Temp_vs_WL.svg"
-        save_path_wl_temp = os.path.join(self.save_dir, wl_temp_filename)
-        fig.savefig(save_path_wl_temp, format="svg", bbox_inches="tight")
-        print(f"Saved Temperature vs Wavelength plot to {save_path_wl_temp}")
-        
-         # Save the WL vs Temp plot as an SVG file in the output folder
-        wl_temp_filename1 = self.base_name + "_WL_vs_Temp.png"
-        save_path_wl_temp1 = os.path.join(self.save_dir, wl_temp_filename1)
-        fig.savefig(save_path_wl_temp1, format="png", bbox_inches="tight")
-        print(f"Saved Temperature vs Wavelength plot to {save_path_wl_temp1}")
+        self.renderer.submit(fig)
         return
 
     # WL vs current plot
     def plot_wl_vs_current(self):
-        fig, ax = plt.subplots()
+        # Save the WL vs current plot as SVG and PNG files in the output folder
+        fig = FigureSpec([os.path.join(self.save_dir, self.base_name + "_WL_vs_Current.svg"),
+                          os.path.join(self.save_dir, self.base_name + "_WL_vs_Current.png")])
+        ax = fig.axes[0]
         mask = self.wavelength > 1000
         ax.scatter(self.current[mask]*1000, self.wavelength[mask], color='black', marker='o')
         ax.set_title("Wavelength vs Current")
@@ -98,17 +98,7 @@ class WLMclass:
         ax.set_ylabel("Wavelength (nm)")
         ax.grid(True)
 
-        # Save the WL vs current plot as an SVG file in the output folder
-        wl_current_filename = self.base_name + "_WL_vs_Current.svg"
-        save_path_wl_current = os.path.join(self.save_dir, wl_current_filename)
-        fig.savefig(save_path_wl_current, format="svg", bbox_inches="tight")
-        print(f"Saved Wavelength vs Current plot to {save_path_wl_current}")
-
-        wl_current_filename1 = self.base_name + "_WL_vs_Current.png"
-        save_path_wl_current1 = os.path.join(self.save_dir, wl_current_filename1)
-        fig.savefig(save_path_wl_current1, format="png", bbox_inches="tight")
-        print(f"Saved  Wavelength vs Current plot to {save_path_wl_current1}")
-
+        self.renderer.submit(fig)
         return
     
     def plot_li(self):
@@ -116,10 +106,14 @@ class WLMclass:
         I = self.current
 
         for ch_i, channel in enumerate([self.ch0, self.ch1, self.ch2, self.ch3], start=0):
-            if channel is None or channel.empty:
+            if channel is None or channel.size == 0:
                 continue  # Skip if channel data is not available
 
-            fig_combined, (ax2, ax3) = plt.subplots(1, 2, figsize=(14, 6))
+            # Save the channel plot as SVG and PNG files in the output folder
+            fig_combined = FigureSpec([os.path.join(self.save_dir, self.base_name + f"_LI_ch{ch_i}.svg"),
+                                       os.path.join(self.save_dir, self.base_name + f"_LI_ch{ch_i}.png")],
+                                      ncols=2, figsize=(14, 6), tight_layout=True)
+            ax2, ax3 = fig_combined.axes
 
             L = channel
             log = np.log(channel)
@@ -138,61 +132,28 @@ class WLMclass:
             #ax3.legend()
             ax3.grid(True)
 
-            fig_combined.tight_layout()
-
-            # Save the channel plot as an SVG file in the output folder
-            svg_filename = self.base_name + f"_LI_ch{ch_i}.svg"
-            save_path_svg = os.path.join(self.save_dir, svg_filename)
-            fig_combined.savefig(save_path_svg, format="svg", bbox_inches="tight")
-            print(f"Saved channel {ch_i} plot to {save_path_svg}")
-
-            # Save the channel plot as an PNG file in the output folder
-            png_filename = self.base_name + f"_LI_ch{ch_i}.png"
-            save_path_png = os.path.join(self.save_dir, png_filename)
-            fig_combined.savefig(save_path_png, format="png", bbox_inches="tight")
-            print(f"Saved channel {ch_i} plot to {save_path_png}")
+            self.renderer.submit(fig_combined)
 
         return
 
     def extract_data(self, output_folder=None):
-        df = pd.read_csv(self.path, header=None, on_bad_lines="skip", engine="python", skiprows=24)
-
-        # Define search terms for each target row
-        search_terms = {
-            "current": "Current",
-            "voltage": "Voltage",
-            "temperature": "Temperature",
-            "wavelength": "Wavelength",
-            "channel 0": "0",
-            "channel 1": "1",
-            "channel 2": "2",
-            "channel 3": "3"
-        }
+        if self.use_parse_cache:
+            rows = parse_cache.load_or_parse(self.path, "wlm", lambda: read_scylla_rows(self.path, WLM_TERMS))
+        else:
+            rows = read_scylla_rows(self.path, WLM_TERMS)
 
-        # Find indices where these terms occur
-        indices = {}
-        for key, term in search_terms.items():
-            matches = df[0].str.contains(term, case=False, na=False)
-            if matches.any():
-                indices[key] = matches.idxmax()
-            else:
-                indices[key] = None
-        print("Indices found:", indices)
-        # Remove the first column (used for matching)
-        del df[0]
-
-        # Extract data rows from the DataFrame
-        current = df.loc[indices["current"]] if indices["current"] is not None else None
-        if indices["current"] is not None:
-            self.current = pd.to_numeric(df.loc[indices["current"]], errors='coerce') 
+        # Extract data rows (None if the label was not found)
+        current = rows["current"]
+        if current is not None:
+            self.current = current
             #print(current)
         else:
             print("No current data found, aborting file...")
             return
 
-        wavelength = df.loc[indices["wavelength"]] if indices["wavelength"] is not None else None
+        wavelength = rows["wavelength"]
         if wavelength is not None:
-            self.wavelength = pd.to_numeric(df.loc[indices["wavelength"]], errors='coerce')
+            self.wavelength = wavelength
             print("Wavelength data extracted")
         else:
             print("No Wavelength data found. Invalid File.")
@@ -200,27 +161,27 @@ class WLMclass:
         
         # Extract voltage and temperature data - make None if not found to handle errors
         # Extract voltage data
-        voltage = df.loc[indices["voltage"]] if indices["voltage"] is not None else None
+        voltage = rows["voltage"]
         if voltage is not None:
-            self.voltage = pd.to_numeric(df.loc[indices["voltage"]], errors='coerce')
+            self.voltage = voltage
             print("Voltage data extracted")
         else:
             print("No Voltage data found. Invalid File.")
             return
 
         # Extract temperature data
-        temperature = df.loc[indices["temperature"]] if indices["temperature"] is not None else None
+        temperature = rows["temperature"]
         if temperature is not None:
-            self.temperature = pd.to_numeric(df.loc[indices["temperature"]], errors='coerce')
+            self.temperature = temperature
             print("Temperature data extracted")
         else:
             print("No Temperature data found. Invalid File.")
             return
 
-        ch0 = pd.to_numeric(df.loc[indices["channel 0"]],errors='coerce') if indices["channel 0"] is not None else None
-        ch1 = pd.to_numeric(df.loc[indices["channel 1"]],errors='coerce') if indices["channel 1"] is not None else None
-        ch2 = pd.to_numeric(df.loc[indices["channel 2"]],errors='coerce')  if indices["channel 2"] is not None else None
-        ch3 = pd.to_numeric(df.loc[indices["channel 3"]],errors='coerce')  if indices["channel 3"] is not None else None
+        ch0 = rows["channel 0"]
+        ch1 = rows["channel 1"]
+        ch2 = rows["channel 2"]
+        ch3 = rows["channel 3"]
 
         ch0_log = np.log(ch0) if ch0 is not None else None
         ch1_log = np.log(ch1) if ch1 is not None else None
@@ -240,10 +201,11 @@ class WLMclass:
 
         # Formulate comparison data (Max power of data channel and assoc current)
         if ch1_idx is not None:
-            self.peak_power = channels[ch1_idx].max()
-            self.peak_power_I = current[channels[ch1_idx].idxmax()]
-            self.peak_power_V = voltage[channels[ch1_idx].idxmax()]
-            self.peak_power_wl = wavelength[channels[ch1_idx].idxmax()]
+            peak_idx = np.nanargmax(channels[ch1_idx])
+            self.peak_power = channels[ch1_idx][peak_idx]
+            self.peak_power_I = current[peak_idx]
+            self.peak_power_V = voltage[peak_idx]
+            self.peak_power_wl = wavelength[peak_idx]
         else:
             print("No valid data channel found for peak power calculation.")
 
@@ -313,6 +275,8 @@ class WLMclass:
         mat_filename = self.base_name + ".mat"
         save_path_mat = os.path.join(self.save_dir, mat_filename)
         scipy.io.savemat(save_path_mat, data_dict)
+        self.data_dict = data_dict  # kept for the campaign store (multi_WLM)
+        self.summary = summary_row(data_dict)  # row of the WLM summary index (current is in A here)
         print(f"Data dictionary saved to {save_path_mat}")
             
 
@@ -10,12 +10,15 @@ import matplotlib.pyplot as plt
 import matplotlib.cm as cm
 import numpy as np
 import time
+from measurement_catalog import LIV, WLM, OSA
+from processing_ledger import ProcessingLedger
 
 """
     Script for processing and comparing CSV files for either OSA or LIV/WLM data. Allows user to select a parent folder,
     then either sweep through all files in that folder or select specific files to run. 
-    If a file has been processed previously (a .mat exists with the same name), it will skip processing that file. (To re-process that file, either 
-    delete the existing .mat file or run process_csv.py on it.)
+    If a file has been processed previously, it will skip processing that file unless the processing ledger (see
+    processing_ledger.py) shows that its content or the analysis changed, or its .mat is missing. (To re-process that
+    file anyway, choose to overwrite existing files or run process_csv.py on it.)
 
     If user chooses to compare files, it will extract relevant data from the processed files and plot either current vs peak power and wavelength vs peak power for OSA data,
     or current vs peak power and threshold current for LIV/WLM data. The plots will be saved in the parent folder as PNG and SVG files.
@@ -52,12 +55,19 @@ def plot_scatter(data1, data2, x_label, y_label, title, save_title, parent_path=
         print("Error: parent_path is None. Cannot save the plot.")
     plt.show()
 
-def mat_file_exists_anywhere(parent_path, file_base_name):
-    mat_filename = f"{file_base_name}.mat"
-    for current_root, dirs, files in os.walk(parent_path):
-        if mat_filename in files:
-            return True
-    return False
+# Ledger entries of the process_csv pipeline: its own version and parameters, so that files it processed are
+# processed again by the multi_* drivers (and the other way round)
+LEDGER_KINDS = {"osa": OSA, "liv": LIV, "wlm": WLM}
+ANALYSIS_VERSION = 0
+ANALYSIS_PARAMS = {"pipeline": "process_csv"}
+
+def mat_output_path(file_path, parent_path):
+    """.mat written by process_csv.process_file for a csv (in the output folder of process_csv.create_output_folder)."""
+    directory = os.path.dirname(file_path)
+    base_name = os.path.splitext(os.path.basename(file_path))[0]
+    if os.path.normpath(directory) == os.path.normpath(parent_path):
+        directory = os.path.join(directory, base_name)
+    return os.path.join(directory, f"{base_name}.mat")
         
 
 def main():
@@ -132,6 +142,8 @@ def main():
             files_to_run = []
         
         if processALL:
+            ledger = ProcessingLedger(parent_path)
+            kind = LEDGER_KINDS[process_mode]
             for current_root, dirs, files in os.walk(parent_path):
                 for file in files:
                     if file.endswith(".csv"):
@@ -144,13 +156,19 @@ def main():
                             print(f"Skipping file (unselected):  {file_base_name}")
                         else:
                             try:
-                                if mat_file_exists_anywhere(parent_path, file_base_name) and not overwrite_existing:
-                                    print(f"Skipping existing file: {file_base_name}.mat (found in subdirectory)")
+                                outputs = [mat_output_path(file_path, parent_path)]
+                                reason = "overwrite requested" if overwrite_existing else ledger.stale_reason(
+                                    file_path, kind, ANALYSIS_VERSION, ANALYSIS_PARAMS, outputs, render_plots=True)
+                                if reason is None:
+                                    print(f"Skipping existing file: {file_base_name}.mat (up to date)")
                                     continue
+                                print(f"Processing {file_base_name}: {reason}")
                                 process_csv.process_file(file_path, process_mode, base_folder=parent_path)
+                                ledger.record(file_path, kind, ANALYSIS_VERSION, ANALYSIS_PARAMS, outputs, render_plots=True)
                             except Exception as e:
                                 # Print the full file name and a summary of the error, then continue.
                                 print(f"Failed processing file: {file_path}\nReason: {str(e)}\n")
+            ledger.save()
         else:
             for current_root, dirs, files in os.walk(parent_path):
                 for file in files:
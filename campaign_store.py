@@ -0,0 +1,267 @@
+import os
+import json
+import math
+import mmap
+import struct
+import warnings
+import zipfile
+from collections.abc import Mapping
+from pathlib import Path
+import numpy as np
+
+"""
+    Consolidated store of the processed data of a whole measurement campaign, as an alternative to reopening one small
+    .mat per device. All devices of one measurement type live in a single '<kind>_campaign.zip' in the parent folder,
+    an uncompressed zip archive:
+            - every device is one member '<IDtag>.bin' holding its arrays back to back (raw, 8-byte aligned)
+            - the member '__index__.json' lists the devices and, per variable, its offset, dtype and shape, plus the
+              .mat each device came from
+            - writes are appended to the end of the file; a device written again replaces the earlier copy, which stays
+              in the file until compact() is called
+            - reads are lazy: the file is memory-mapped and only the variables that are asked for are copied out, so
+              e.g. one threshold of 2000 devices is read without touching their arrays
+
+    Usage:
+        store = CampaignStore(store_path(parent_dir, "LIV"))
+        store.append(idtag, data_dict, source=mat_path)
+        thresholds = store.read_many("ch1_threshold")      # {IDtag: array}
+        device = store.device(idtag)                       # lazy {variable: array}
+
+    [Author: Rhiannon H Evans]
+"""
+
+STORE_VERSION = 1
+
+_INDEX = "__index__.json"
+_ALIGN = 8
+_LOCAL_HEADER = struct.Struct("<4s22xHH")  # signature ... file name length, extra field length (30 bytes)
+
+
+def store_path(parent_path, kind):
+    """Campaign store of one measurement type (e.g. "LIV", "WLM", "OSA") in the parent folder."""
+    return Path(parent_path) / f"{kind}_campaign.zip"
+
+
+def _as_array(value):
+    # None (e.g. an unused channel) is stored as an empty array, like scipy.io.savemat does; ragged lists of sweeps
+    # become a NaN padded float matrix
+    if value is None:
+        return np.empty(0)
+    try:
+        array = np.asarray(value)
+    except ValueError:
+        array = None
+    if array is None or array.dtype == object:
+        rows = [np.asarray(row, dtype=float).ravel() for row in value]
+        array = np.full((len(rows), max((len(r) for r in rows), default=0)), np.nan)
+        for k, row in enumerate(rows):
+            array[k, :len(row)] = row
+    return array
+
+
+def _pack(variables):
+    # Raw bytes of all arrays of a device and {name: [offset, dtype, shape]}; keys starting with '__' (the header
+    # entries of scipy.io.loadmat) are skipped
+    blobs, layout, offset = [], {}, 0
+    for name, value in variables.items():
+        if name.startswith("__"):
+            continue
+        array = _as_array(value)
+        pad = -offset % _ALIGN
+        blobs.append(b"\0" * pad)
+        offset += pad
+        layout[name] = [offset, array.dtype.str, list(array.shape)]
+        blobs.append(array.tobytes())
+        offset += array.nbytes
+    return b"".join(blobs), layout
+
+
+def file_stamp(path):
+    """[size, modification time (ns)] of a file, to tell whether it has changed since it was stored."""
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+class DeviceRecord(Mapping):
+    """Read-only {variable: array} view of one device in a CampaignStore; each variable is read when it is accessed."""
+
+    def __init__(self, store, idtag):
+        self.store = store
+        self.idtag = idtag
+
+    def __getitem__(self, name):
+        return self.store.read(self.idtag, name)
+
+    def __contains__(self, name):
+        return self.store.has(self.idtag, name)
+
+    def __iter__(self):
+        return iter(self.store.variables(self.idtag))
+
+    def __len__(self):
+        return len(self.store.variables(self.idtag))
+
+
+class CampaignStore:
+    def __init__(self, path):
+        self.path = Path(path)
+        self._writer = None
+        self._file = None
+        self._map = None
+        self._starts = {}  # IDtag: file offset of its data
+        self._index = self._read_index()
+
+    def _read_index(self):
+        if not self.path.exists():
+            return {}
+        try:
+            with zipfile.ZipFile(self.path) as zf:
+                index = json.loads(zf.read(_INDEX))
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+            print(f"Ignoring unreadable campaign store {self.path}: {e}")
+            return {}
+        if index.get("version") != STORE_VERSION:
+            print(f"Ignoring campaign store {self.path} written by another version")
+            return {}
+        return index["devices"]
+
+    def _index_json(self):
+        return json.dumps({"version": STORE_VERSION, "devices": self._index})
+
+    # --- index ---
+    def idtags(self):
+        return list(self._index)
+
+    def __contains__(self, idtag):
+        return idtag in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def variables(self, idtag):
+        return list(self._index[idtag]["variables"])
+
+    def has(self, idtag, name):
+        return name in self._index[idtag]["variables"]
+
+    def source(self, idtag):
+        """Path of the .mat the device was stored from (None if it was not given)."""
+        return self._index[idtag]["source"]
+
+    def is_current(self, idtag, source):
+        """True if the device is stored from source and that file has not changed since."""
+        entry = self._index.get(idtag)
+        if entry is None or entry["source"] != str(source):
+            return False
+        try:
+            return entry["stat"] == file_stamp(source)
+        except OSError:
+            return False
+
+    # --- writing ---
+    def _write_member(self, zf, idtag, data):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)  # "Duplicate name": the index points at the latest copy
+            zf.writestr(f"{idtag}.bin", data)
+        return zf.filelist[-1].header_offset
+
+    def append(self, idtag, variables, source=None):
+        """
+        Add a device (or replace it) with {name: array, list, scalar or None}. Writes go to the open file and the
+        index is written by flush()/close() (or before the next read).
+        """
+        self._close_map()
+        if self._writer is None:
+            # A file without a readable index (foreign or damaged) is started again
+            mode = "a" if self.path.exists() and self._index else "w"
+            self._writer = zipfile.ZipFile(self.path, mode, compression=zipfile.ZIP_STORED, allowZip64=True)
+
+        data, layout = _pack(variables)
+        self._index[idtag] = {
+            "offset": self._write_member(self._writer, idtag, data),
+            "nbytes": len(data),
+            "variables": layout,
+            "source": None if source is None else str(source),
+            "stat": None if source is None else file_stamp(source),
+        }
+
+    def flush(self):
+        """Write the index and close the file after appends."""
+        if self._writer is None:
+            return
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)
+            self._writer.writestr(_INDEX, self._index_json())
+        self._writer.close()
+        self._writer = None
+
+    def compact(self):
+        """Rewrite the file without the replaced copies of devices."""
+        self.flush()
+        tmp = self.path.with_suffix(".tmp")
+        with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+            for idtag, entry in self._index.items():
+                start = self._data_start(idtag)
+                entry["offset"] = self._write_member(zf, idtag, self._map[start:start + entry["nbytes"]])
+            zf.writestr(_INDEX, self._index_json())
+        self._close_map()
+        os.replace(tmp, self.path)
+
+    # --- reading ---
+    def _open_map(self):
+        self.flush()
+        if self._map is None:
+            self._file = open(self.path, "rb")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def _close_map(self):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = self._file = None
+        self._starts = {}
+
+    def _data_start(self, idtag):
+        # Offset of the device data in the file: its zip member starts with a local header of variable length
+        start = self._starts.get(idtag)
+        if start is None:
+            mm = self._open_map()
+            offset = self._index[idtag]["offset"]
+            signature, name_len, extra_len = _LOCAL_HEADER.unpack_from(mm, offset)
+            if signature != b"PK\x03\x04":
+                raise ValueError(f"Campaign store {self.path} is damaged at device {idtag}")
+            start = self._starts[idtag] = offset + _LOCAL_HEADER.size + name_len + extra_len
+        return start
+
+    def read(self, idtag, name):
+        """One variable of one device (a copy, only its bytes are read)."""
+        offset, dtype, shape = self._index[idtag]["variables"][name]
+        start = self._data_start(idtag)
+        count = math.prod(shape)
+        return np.frombuffer(self._map, dtype=dtype, count=count, offset=start + offset).reshape(shape).copy()
+
+    def read_many(self, name, idtags=None):
+        """{IDtag: array} of one variable for the given devices (all devices that have it if None)."""
+        idtags = self.idtags() if idtags is None else idtags
+        return {idtag: self.read(idtag, name) for idtag in idtags if self.has(idtag, name)}
+
+    def device(self, idtag):
+        """Lazy {variable: array} view of one device."""
+        if idtag not in self._index:
+            raise KeyError(idtag)
+        return DeviceRecord(self, idtag)
+
+    def load(self, idtag):
+        """All variables of one device as a dict."""
+        return dict(self.device(idtag))
+
+    def close(self):
+        self.flush()
+        self._close_map()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
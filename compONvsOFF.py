@@ -1,45 +1,101 @@
 # author: sheri and co-pilot
 # date: 2025-05-31
-# Description: This script processes OSA and LIV .mat files to compare benchtop and on-chip laser spectra.
-# It generates a plot of wavelength vs normalized power, annotates FSRs, and saves the plot and data.
-# After the first plot, the user is prompted to perform quality factor (Q) analysis using Lorentzian fits.
-# If accepted, the script overlays Lorentzian fits and Q values for all peaks, and shows residuals.
+# Description: Compares benchtop and on-chip laser spectra from OSA, LIV (eval system) and benchtop .mat files.
+# compare_device finds the peaks of both spectra, their spacings (FSRs, in pm) and Lorentzian Q-factors for one device,
+# and aligns the two spectra as a whole (spectral_align: FFT cross-correlation offset and autocorrelation FSR).
+# run_comparisons does this for a whole manifest of (OSA fit, LIV sweep, benchtop scan) files in parallel and writes
+# one consolidated .mat file (and optionally the comparison plot of each device).
+# Run as a script (main) for the interactive version: Tk dialogs, the comparison plot, and the optional Q analysis
+# plots with Lorentzian fits and residuals.
 #the Q analysis needs to be fine tuned more
 
 
 import os
 from datetime import datetime
-from tkinter import Tk, filedialog, messagebox
+from functools import partial
 import scipy.io
 import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
 from scipy.signal import find_peaks
-import lorentzfit
-print("Using lorentzfit from:", lorentzfit.__file__)
-from lorentzfit import lorentzfit  # Make sure lorentzfit.py is in your PYTHONPATH
-
-def analyze_peak_qfactor(x, y, peak_idx, window=10, color='r', label='Data', plot_title='Lorentzian Fit'):
-    left = max(0, peak_idx - window)
-    right = min(len(x), peak_idx + window + 1)
-    peak_x = x[left:right]
-    peak_y = y[left:right]
-    slope = (peak_y[-1] - peak_y[0]) / (peak_x[-1] - peak_x[0])
-    baseline = slope * (peak_x - peak_x[0]) + peak_y[0]
+import lorentzfit as lorentzfit_module
+from lorentzfit import lorentzfit_batch  # Make sure lorentzfit.py is in your PYTHONPATH
+import spectral_align
+from render import FigureSpec, process_and_render, render_figure, show_figure
+
+# Output folder of the interactive script
+COMPARISON_FOLDER = r"C:\Users\jsheri1\Documents\A_Research\2024-02_Wafer-Scale\20250403_Shuksan_ANT_Light2025_WaferscaleMeasurements\Comparison"
+# On-chip sweep current range used for the comparison (mA)
+CURRENT_RANGE = (20, 50)
+# Peak detection heights (normalised power) and Lorentzian fit windows (points either side of a peak)
+BENCHTOP_PEAK_HEIGHT = 0.4
+ON_CHIP_PEAK_HEIGHT = 0.2
+BENCHTOP_WINDOW = 10
+ON_CHIP_WINDOW = 6
+# Fields of a compare_device result that hold the normalised spectra (and the peak indices into them); run_comparisons
+# only saves them with save_spectra=True
+SPECTRUM_FIELDS = ('wavelengthBenchtopLimited', 'powerBenchtopNormalized', 'benchtopPeakIndices',
+                   'wavelengthOnChip', 'powerFilteredNormalized', 'onChipPeakIndices')
+
+def peak_windows(x, y, peak_indices, window=10):
+    """
+    Cut a window of +-window points around each peak and normalise it: subtract the straight line between the window
+    end points, shift the minimum to 0 and scale the maximum to 1. Windows cut short by the ends of the data are
+    padded with NaN, so all peaks come back as (peaks, 2*window+1) arrays.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    peak_indices = np.asarray(peak_indices, dtype=int).reshape(-1)
+    idx = peak_indices[:, None] + np.arange(-window, window + 1)
+    inside = (idx >= 0) & (idx < len(x))
+    idx_c = np.clip(idx, 0, max(len(x) - 1, 0))
+    peak_x = np.where(inside, x[idx_c], np.nan)
+    peak_y = np.where(inside, y[idx_c], np.nan)
+
+    first = np.argmax(inside, axis=1)
+    last = inside.shape[1] - 1 - np.argmax(inside[:, ::-1], axis=1)
+    rows = np.arange(len(idx))
+    x_first, y_first = peak_x[rows, first], peak_y[rows, first]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (peak_y[rows, last] - y_first) / (peak_x[rows, last] - x_first)
+    baseline = slope[:, None] * (peak_x - x_first[:, None]) + y_first[:, None]
     normalized_curve = peak_y - baseline
-    normalized_curve_lin = normalized_curve - np.min(normalized_curve)
-    if np.max(normalized_curve_lin) > 0:
-        normalized_curve_lin = normalized_curve_lin / np.max(normalized_curve_lin)
-    try:
-        yfit, params, resnorm, residual, jacobian = lorentzfit(
-            peak_x, normalized_curve_lin, nparams='3c'
-        )
-    except Exception as e:
-        print(f"Fit failed: {e}")
+    normalized_curve_lin = normalized_curve - np.nanmin(normalized_curve, axis=1, keepdims=True)
+    peak_max = np.nanmax(normalized_curve_lin, axis=1, keepdims=True)
+    normalized_curve_lin = np.where(peak_max > 0, normalized_curve_lin / np.where(peak_max > 0, peak_max, 1), normalized_curve_lin)
+    return peak_x, normalized_curve_lin
+
+def analyze_peaks_qfactor(x, y, peak_indices, window=10):
+    """
+    Lorentzian ('3c') fits and Q-factors of all peaks of a spectrum at once (lorentzfit_batch).
+
+    Returns a list with one tuple per peak, (peak_x, normalized_curve_lin, yfit, Q_factor, R_sq, residual, params)
+    as from analyze_peak_qfactor_overlay, or a tuple of None where the fit did not converge.
+    """
+    if len(peak_indices) == 0:
+        return []
+    peak_x, normalized = peak_windows(x, y, peak_indices, window)
+    fits = lorentzfit_batch(peak_x, normalized, nparams='3c')
+    results = []
+    for k in range(len(peak_x)):
+        if not fits["converged"][k]:
+            print(f"Fit failed: peak at index {peak_indices[k]} did not converge")
+            results.append((None,) * 7)
+            continue
+        keep = ~np.isnan(peak_x[k])
+        yfit = fits["yfit"][k][keep]
+        results.append((peak_x[k][keep], normalized[k][keep], yfit, fits["Q"][k], fits["R2"][k],
+                        normalized[k][keep] - yfit, fits["params"][k]))
+    return results
+
+def analyze_peak_qfactor(x, y, peak_idx, window=10, color='r', label='Data', plot_title='Lorentzian Fit', fit=None):
+    # fit: this peak's entry from analyze_peaks_qfactor (fitted here if not given)
+    peak_x, normalized_curve_lin, yfit, Q_factor, R_sq, residual, params = (
+        fit if fit is not None else analyze_peak_qfactor_overlay(x, y, peak_idx, window))
+    if peak_x is None:
         return None
-    x0 = params[1]
-    gamma = np.sqrt(params[2]) * 2  # FWHM = 2*sqrt(gamma)
-    Q_factor = x0 / gamma if gamma != 0 else np.nan
-    R_sq = 1 - np.var(normalized_curve_lin - yfit) / np.var(normalized_curve_lin)
+    resnorm = np.sum(residual**2)
+    jacobian = lorentzfit_module.MODELS['3c'][1](peak_x, *params)
     plt.figure(figsize=(7, 6))
     plt.plot(peak_x, normalized_curve_lin, '.', color=color, label=label)
     plt.plot(peak_x, yfit, '-', color='b', label='Lorentz fit')
@@ -64,335 +120,447 @@ def analyze_peak_qfactor(x, y, peak_idx, window=10, color='r', label='Data', plo
     return Q_factor, R_sq, params, resnorm, residual, jacobian
 
 def analyze_peak_qfactor_overlay(x, y, peak_idx, window=10):
-    left = max(0, peak_idx - window)
-    right = min(len(x), peak_idx + window + 1)
-    peak_x = x[left:right]
-    peak_y = y[left:right]
-    slope = (peak_y[-1] - peak_y[0]) / (peak_x[-1] - peak_x[0])
-    baseline = slope * (peak_x - peak_x[0]) + peak_y[0]
-    normalized_curve = peak_y - baseline
-    normalized_curve_lin = normalized_curve - np.min(normalized_curve)
-    if np.max(normalized_curve_lin) > 0:
-        normalized_curve_lin = normalized_curve_lin / np.max(normalized_curve_lin)
+    return analyze_peaks_qfactor(x, y, [peak_idx], window)[0]
+
+def load_on_chip(osa_file, liv_file, current_range=CURRENT_RANGE):
+    """
+    On-chip spectrum of a device: LIV (eval system) power over current_range, with the wavelength of each current from
+    the peak-wavelength polynomial fitted in the OSA .mat file.
+
+    Returns
+    -------
+    wavelengthOnChip, powerFiltered : ndarray
+    """
+    osaData = scipy.io.loadmat(osa_file)
+    if 'polyfit_peakWL_vs_I_deg2_coeffs' not in osaData:
+        raise KeyError(f"FitParams not found in {os.path.basename(osa_file)}.")
+
+    livData = scipy.io.loadmat(liv_file)
+    if 'current' not in livData:
+        raise KeyError(f"'current' data not found in {os.path.basename(liv_file)}.")
+    current = np.array(livData['current']).flatten()  # Current data
+    if 'power4' in livData:
+        channel3 = -np.array(livData['power4']).flatten()  # eval_system power data
+    elif 'channel_3' in livData:
+        channel3 = np.array(livData['channel_3']).flatten()  # probe station LIV power data
+    else:
+        raise KeyError(f"'power4' or 'channel_3' data not found in {os.path.basename(liv_file)}.")
+
+    # Filter current data to the comparison range
+    validIdx = (current >= current_range[0]) & (current <= current_range[1])
+    currentFiltered = current[validIdx]
+    powerFiltered = channel3[validIdx]
+    if len(currentFiltered) == 0:
+        raise ValueError(f"No valid current values found in the range {current_range[0]} mA to {current_range[1]} mA. "
+                         "Please check the data or adjust the range.")
+
+    # Calculate wavelength using the polynomial coefficients
+    polyfit_peakWL_vs_I_deg2_coeffs = osaData['polyfit_peakWL_vs_I_deg2_coeffs'].flatten()
+    wavelengthOnChip = (
+        polyfit_peakWL_vs_I_deg2_coeffs[0] * currentFiltered**2 +
+        polyfit_peakWL_vs_I_deg2_coeffs[1] * currentFiltered +
+        polyfit_peakWL_vs_I_deg2_coeffs[2]
+    )
+    return wavelengthOnChip, powerFiltered
+
+def load_benchtop(benchtop_file):
+    """Benchtop scan: wavelength (nm) and channel 4 power (mW)."""
+    benchtopData = scipy.io.loadmat(benchtop_file)
+    if 'wavelength' not in benchtopData or 'channel_4_mW' not in benchtopData:
+        raise KeyError(f"'wavelength' or 'channel_4_mW' data not found in {os.path.basename(benchtop_file)}.")
+    return np.array(benchtopData['wavelength']).flatten(), np.array(benchtopData['channel_4_mW']).flatten()
+
+def _peak_q_factors(x, y, peak_indices, window):
+    # Q-factor, R² and fitted centre of every peak (NaN where the fit did not converge)
+    fits = analyze_peaks_qfactor(x, y, peak_indices, window)
+    Q = np.array([f[3] if f[0] is not None else np.nan for f in fits], dtype=float)
+    R2 = np.array([f[4] if f[0] is not None else np.nan for f in fits], dtype=float)
+    x0 = np.array([f[6][1] if f[0] is not None else np.nan for f in fits], dtype=float)
+    return Q, R2, x0
+
+def _spectral_comparison(wavelengthBenchtop, powerBenchtop, wavelengthOnChip, powerOnChip):
+    # spectralOffset (pm) and its score, benchtopFSR and onChipFSR (pm) from spectral_align; NaN where it cannot compare
+    result = dict.fromkeys(('spectralOffset', 'spectralOffsetScore', 'benchtopFSR', 'onChipFSR'), np.nan)
     try:
-        yfit, params, resnorm, residual, jacobian = lorentzfit(
-            peak_x, normalized_curve_lin, nparams='3c'
-        )
+        offset, result['spectralOffsetScore'] = spectral_align.spectral_offset(wavelengthBenchtop, powerBenchtop,
+                                                                               wavelengthOnChip, powerOnChip)
+        result['spectralOffset'] = offset * 1e3
+    except ValueError as e:
+        print(f"Spectral offset not computed: {e}")
+    for key, wavelength, power in (('benchtopFSR', wavelengthBenchtop, powerBenchtop),
+                                   ('onChipFSR', wavelengthOnChip, powerOnChip)):
+        try:
+            result[key] = spectral_align.estimate_fsr(wavelength, power)[0] * 1e3
+        except ValueError as e:
+            print(f"{key} not computed: {e}")
+    return result
+
+def compare_device(osa_file, liv_file, benchtop_file, q_analysis=True, current_range=CURRENT_RANGE):
+    """
+    Compare the on-chip and benchtop spectra of one device (no dialogs, no plots).
+
+    Parameters
+    ----------
+    osa_file : str
+        OSA .mat file with polyfit_peakWL_vs_I_deg2_coeffs.
+    liv_file : str
+        LIV / eval system .mat file with current and power4 (or channel_3).
+    benchtop_file : str
+        Benchtop .mat file with wavelength and channel_4_mW.
+    q_analysis : bool
+        Also fit every peak with a Lorentzian and return the Q-factors.
+
+    Returns
+    -------
+    result : dict
+        The normalised spectra, peak indices and wavelengths, peak distances (pm) of both spectra; spectralOffset (pm,
+        on-chip relative to benchtop) and its correlation score, benchtopFSR and onChipFSR (pm) from spectral_align;
+        and with q_analysis benchtopQ, benchtopR2, benchtopFitWavelengths (and the onChip equivalents), NaN where a fit
+        did not converge.
+    """
+    wavelengthOnChip, powerFiltered = load_on_chip(osa_file, liv_file, current_range)
+    wavelengthBenchtop, powerBenchtop = load_benchtop(benchtop_file)
+
+    # Limit Benchtop data to the nearest 0.1 nm range of the on-chip wavelength
+    minWavelength = np.floor(min(wavelengthOnChip) * 10) / 10  # Round down to nearest 0.1 nm
+    maxWavelength = np.ceil(max(wavelengthOnChip) * 10) / 10   # Round up to nearest 0.1 nm
+
+    benchtopIdx = (wavelengthBenchtop >= minWavelength) & (wavelengthBenchtop <= maxWavelength)
+    wavelengthBenchtopLimited = wavelengthBenchtop[benchtopIdx]
+    powerBenchtopLimited = powerBenchtop[benchtopIdx]
+    if len(wavelengthBenchtopLimited) == 0 or len(powerBenchtopLimited) == 0:
+        raise ValueError("No Benchtop data found within the specified wavelength range.")
+
+    # Normalize the power values
+    powerBenchtopNormalized = powerBenchtopLimited / np.max(powerBenchtopLimited)
+    powerFilteredNormalized = powerFiltered / np.max(powerFiltered)
+
+    # Find peaks for Benchtop data
+    benchtopPeaks, _ = find_peaks(powerBenchtopNormalized, height=BENCHTOP_PEAK_HEIGHT)
+    benchtopPeakWavelengths = np.sort(wavelengthBenchtopLimited[benchtopPeaks])  # Extract peak wavelengths, sorted
+    benchtopPeakDistances = np.diff(benchtopPeakWavelengths) * 1e3  # Convert to picometers (pm)
+
+    # Find peaks for On-Chip data
+    onChipPeaks, _ = find_peaks(powerFilteredNormalized, height=ON_CHIP_PEAK_HEIGHT)
+    onChipPeakWavelengths = np.sort(wavelengthOnChip[onChipPeaks])  # Extract peak wavelengths, sorted
+    onChipPeakDistances = np.diff(onChipPeakWavelengths) * 1e3  # Convert to picometers (pm)
+
+    result = {
+        'wavelengthBenchtopLimited': wavelengthBenchtopLimited,
+        'powerBenchtopNormalized': powerBenchtopNormalized,
+        'benchtopPeakIndices': benchtopPeaks,
+        'benchtopPeakWavelengths': benchtopPeakWavelengths,
+        'benchtopPeakDistances': benchtopPeakDistances,
+        'wavelengthOnChip': wavelengthOnChip,
+        'powerFilteredNormalized': powerFilteredNormalized,
+        'onChipPeakIndices': onChipPeaks,
+        'onChipPeakWavelengths': onChipPeakWavelengths,
+        'onChipPeakDistances': onChipPeakDistances,
+        'minWavelength': minWavelength,
+        'maxWavelength': maxWavelength,
+    }
+
+    # Whole-spectrum comparison on a common grid: shift of the on-chip spectrum and the FSR of each spectrum (pm), NaN
+    # where a spectrum has fewer than two distinct wavelengths or the spectra do not overlap
+    result.update(_spectral_comparison(wavelengthBenchtopLimited, powerBenchtopNormalized, wavelengthOnChip,
+                                       powerFilteredNormalized))
+    if q_analysis:
+        result['benchtopQ'], result['benchtopR2'], result['benchtopFitWavelengths'] = _peak_q_factors(
+            wavelengthBenchtopLimited, powerBenchtopNormalized, benchtopPeaks, BENCHTOP_WINDOW)
+        result['onChipQ'], result['onChipR2'], result['onChipFitWavelengths'] = _peak_q_factors(
+            wavelengthOnChip, powerFilteredNormalized, onChipPeaks, ON_CHIP_WINDOW)
+    return result
+
+def comparison_figure(result, title, paths=()):
+    """FigureSpec of the benchtop vs on-chip spectrum plot with the peak distances annotated."""
+    fig = FigureSpec(paths, figsize=(12, 8), bbox_inches=None, dpi=300)
+    ax = fig.axes[0]
+    ax.tick_params(axis='both', which='major', labelsize=16)  # Set axis tick label font size
+    ax.plot(result['wavelengthBenchtopLimited'], result['powerBenchtopNormalized'], color='red', linestyle='--', linewidth=1.5, label='Benchtop Laser')
+    ax.plot(result['wavelengthOnChip'], result['powerFilteredNormalized'], color='purple', linestyle='-', linewidth=1.5, label='On-Chip Laser')
+
+    # Annotate peak distances (alternating y positions)
+    for wavelengths, distances, power, levels, color in (
+            (result['benchtopPeakWavelengths'], result['benchtopPeakDistances'], result['powerBenchtopNormalized'], (0.9, 0.85), 'red'),
+            (result['onChipPeakWavelengths'], result['onChipPeakDistances'], result['powerFilteredNormalized'], (0.5, 0.75), 'purple')):
+        for i in range(len(distances)):
+            x = (wavelengths[i] + wavelengths[i + 1]) / 2
+            y = max(power) * levels[i % 2]
+            y_offset = 0.05 * (i % 2)  # Add a small vertical offset to alternate positions
+            ax.annotate(f"{distances[i]:.1f} pm", (x, y + y_offset), fontsize=10, color=color, ha='center')
+
+    ax.set_xlim([result['minWavelength'], result['maxWavelength']])  # Set x-axis limits to match the adjusted wavelength range
+    ax.set_xlabel('Wavelength (nm)', fontsize=16)
+    ax.set_ylabel('Normalized Power', fontsize=16)
+    ax.legend(loc='upper right', fontsize=13)  # Place the legend in the top-right corner
+    ax.set_title(f'Wavelength vs Normalized Power ({title})', fontsize=14)
+    ax.grid(True)
+    return fig
+
+def _device_name(benchtop_file):
+    # Remove "_data" and ".mat" from the benchtop file name
+    return os.path.splitext(os.path.basename(benchtop_file).replace("_data", ""))[0]
+
+def _compare_entry(entry, q_analysis=True, plot_folder=None):
+    """Worker for run_comparisons: (entry, error message or None, list of FigureSpec, result)."""
+    osa_file, liv_file, benchtop_file = entry
+    try:
+        result = compare_device(osa_file, liv_file, benchtop_file, q_analysis=q_analysis)
     except Exception as e:
-        print(f"Fit failed: {e}")
-        return None, None, None, None, None, None, None
-    x0 = params[1]
-    gamma = np.sqrt(params[2]) * 2  # FWHM = 2*sqrt(gamma)
-    Q_factor = x0 / gamma if gamma != 0 else np.nan
-    R_sq = 1 - np.var(normalized_curve_lin - yfit) / np.var(normalized_curve_lin)
-    return peak_x, normalized_curve_lin, yfit, Q_factor, R_sq, residual, params
-
-# Print current date and time for logging
-print("Script run at:", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-
-# Initialize the Tkinter root window
-root = Tk()
-root.withdraw()  # Hide the root window but keep it active for dialogs
-
-# Prompt user to select the OSA folder
-osaFolder = filedialog.askdirectory(
-    title="Select the folder containing OSA .mat files",
-    initialdir=r"C:\Users\jsheri1\Documents\A_Research\2024-02_Wafer-Scale\20250403_Shuksan_ANT_Light2025_WaferscaleMeasurements\OSA"
-)
-if not osaFolder:
-    raise FileNotFoundError("No OSA folder selected.")
-
-# Prompt user to select the LIV folder
-livFolder = filedialog.askdirectory(
-    title="Select the folder containing LIV .mat files",
-    initialdir=r"C:\Users\jsheri1\Documents\A_Research\2024-02_Wafer-Scale\20250403_Shuksan_ANT_Light2025_WaferscaleMeasurements\LIV"
-)
-if not livFolder:
-    raise FileNotFoundError("No LIV folder selected.")
-
-# Prompt user to select the Benchtop .mat file
-benchtopFile = filedialog.askopenfilename(
-    title="Select the Benchtop .mat file",
-    filetypes=[("MAT files", "*.mat")],
-    initialdir=r"C:\Users\jsheri1\Documents\A_Research\2024-02_Wafer-Scale\20250403_Shuksan_ANT_Light2025_WaferscaleMeasurements\Benchtop"
-)
-if not benchtopFile:
-    raise FileNotFoundError("No Benchtop .mat file selected.")
-
-# Process OSA files
-osaFiles = [f for f in os.listdir(osaFolder) if f.endswith('.mat')]
-if not osaFiles:
-    raise FileNotFoundError("No .mat files found in the selected OSA folder.")
-
-osaData = scipy.io.loadmat(os.path.join(osaFolder, osaFiles[0]))  # Load the first file
-if 'polyfit_peakWL_vs_I_deg2_coeffs' not in osaData:
-    raise KeyError("FitParams not found in the selected OSA file.")
-
-# Process LIV files
-livFiles = [f for f in os.listdir(livFolder) if f.endswith('.mat')]
-if not livFiles:
-    raise FileNotFoundError("No .mat files found in the selected LIV folder.")
-## comment the following if you are using the eval_system data
-# Load the first LIV file
-# livData = scipy.io.loadmat(os.path.join(livFolder, livFiles[0]))  # Load the first file
-# if 'current' not in livData or 'channel_3' not in livData:
-#     raise KeyError("'current' or 'channel3' data not found in the selected LIV file.")
-
-# current = np.array(livData['current']).flatten()  # Current data
-# channel3 = np.array(livData['channel_3']).flatten()  # Power data
-
-# Load the eval_system data
-livData = scipy.io.loadmat(os.path.join(livFolder, livFiles[0]))  # Load the first file
-if 'current' not in livData or 'power4' not in livData:
-     raise KeyError("'current' or 'power4' data not found in the selected LIV file.")
-
-current = np.array(livData['current']).flatten()  # Current data
-
-channel3 =-np.array(livData['power4']).flatten()  # Power data
-
-# Filter current data between 20 mA and 50 mA
-validIdx = (current >= 20) & (current <= 50)
-currentFiltered = current[validIdx]
-powerFiltered = channel3[validIdx]
-
-# Debugging: Print the filtered data
-print("Current array (scaled):", current)
-print("Valid indices:", validIdx)
-print("Filtered current values:", currentFiltered)
-
-# Ensure currentFiltered is not empty
-if len(currentFiltered) == 0:
-    raise ValueError("No valid current values found in the range 20 mA to 50 mA. Please check the data or adjust the range.")
-
-# Calculate wavelength using the polynomial coefficients
-polyfit_peakWL_vs_I_deg2_coeffs = osaData['polyfit_peakWL_vs_I_deg2_coeffs'].flatten()
-wavelengthOnChip = (
-    polyfit_peakWL_vs_I_deg2_coeffs[0] * currentFiltered**2 +
-    polyfit_peakWL_vs_I_deg2_coeffs[1] * currentFiltered +
-    polyfit_peakWL_vs_I_deg2_coeffs[2]
-)
-
-# Ensure wavelengthOnChip is not empty
-if len(wavelengthOnChip) == 0:
-    raise ValueError("No valid wavelengths calculated for the on-chip data.")
-
-# Process Benchtop file
-benchtopData = scipy.io.loadmat(benchtopFile)  # Load the selected file
-if 'wavelength' not in benchtopData or 'channel_4_mW' not in benchtopData:
-    raise KeyError("'wavelength' or 'channel_4_mW' data not found in the selected Benchtop file.")
-
-wavelengthBenchtop = np.array(benchtopData['wavelength']).flatten()
-powerBenchtop = np.array(benchtopData['channel_4_mW']).flatten()
-
-# Limit Benchtop data to the nearest 0.1 nm range of the on-chip wavelength
-minWavelength = np.floor(min(wavelengthOnChip) * 10) / 10  # Round down to nearest 0.1 nm
-maxWavelength = np.ceil(max(wavelengthOnChip) * 10) / 10   # Round up to nearest 0.1 nm
-
-benchtopIdx = (wavelengthBenchtop >= minWavelength) & (wavelengthBenchtop <= maxWavelength)
-wavelengthBenchtopLimited = wavelengthBenchtop[benchtopIdx]
-powerBenchtopLimited = powerBenchtop[benchtopIdx]
-
-# Ensure Benchtop data is valid
-if len(wavelengthBenchtopLimited) == 0 or len(powerBenchtopLimited) == 0:
-    raise ValueError("No Benchtop data found within the specified wavelength range.")
-
-# Normalize the power values
-powerBenchtopNormalized = powerBenchtopLimited / np.max(powerBenchtopLimited)
-powerFilteredNormalized = powerFiltered / np.max(powerFiltered)
-
-# Find peaks for Benchtop data
-benchtopPeaks, _ = find_peaks(powerBenchtopNormalized, height=0.4)
-benchtopPeakWavelengths = wavelengthBenchtopLimited[benchtopPeaks]  # Extract peak wavelengths
-benchtopPeakWavelengths = np.sort(benchtopPeakWavelengths)  # Ensure sorted order
-benchtopPeakDistances = np.diff(benchtopPeakWavelengths) * 1e3  # Convert to picometers (pm)
-
-# Find peaks for On-Chip data
-onChipPeaks, _ = find_peaks(powerFilteredNormalized,  height=0.2)
-onChipPeakWavelengths = wavelengthOnChip[onChipPeaks]  # Extract peak wavelengths
-onChipPeakWavelengths = np.sort(onChipPeakWavelengths)  # Ensure sorted order
-onChipPeakDistances = np.diff(onChipPeakWavelengths) * 1e3  # Convert to picometers (pm)
-
-# Save plot data to a .mat file
-comparisonFolder = r"C:\Users\jsheri1\Documents\A_Research\2024-02_Wafer-Scale\20250403_Shuksan_ANT_Light2025_WaferscaleMeasurements\Comparison"
-if not os.path.exists(comparisonFolder):
-    os.makedirs(comparisonFolder)
-
-benchtopFileName = os.path.basename(benchtopFile)
-comparisonFileName = f"Comparison2_{benchtopFileName}"
-outputFile = os.path.join(comparisonFolder, comparisonFileName)
-
-scipy.io.savemat(outputFile, {
-    'wavelengthBenchtopLimited': wavelengthBenchtopLimited,
-    'powerBenchtopNormalized': powerBenchtopNormalized,
-    'benchtopPeakWavelengths': benchtopPeakWavelengths,
-    'benchtopPeakDistances': benchtopPeakDistances,
-    'wavelengthOnChip': wavelengthOnChip,
-    'powerFilteredNormalized': powerFilteredNormalized,
-    'onChipPeakWavelengths': onChipPeakWavelengths,
-    'onChipPeakDistances': onChipPeakDistances
-})
-print(f"Plot data saved to {outputFile}")
-
-# Plotting
-plt.figure(figsize=(12, 8))
-plt.tick_params(axis='both', which='major', labelsize=16)  # Set axis tick label font size
-plt.plot(wavelengthBenchtopLimited, powerBenchtopNormalized, color='red', linestyle='--', linewidth=1.5, label='Benchtop Laser')
-plt.plot(wavelengthOnChip, powerFilteredNormalized, color='purple', linestyle='-', linewidth=1.5, label='On-Chip Laser')
-
-# Annotate Benchtop peak distances
-for i in range(len(benchtopPeakDistances)):
-    x = (benchtopPeakWavelengths[i] + benchtopPeakWavelengths[i + 1]) / 2
-    y = max(powerBenchtopNormalized) * (0.9 if i % 2 == 0 else 0.85)  # Alternate y position
-    y_offset = 0.05 * (i % 2)  # Add a small vertical offset to alternate positions
-    plt.annotate(f"{benchtopPeakDistances[i]:.1f} pm", (x, y + y_offset), fontsize=10, color='red', ha='center')
-
-# Annotate On-Chip peak distances
-for i in range(len(onChipPeakDistances)):
-    x = (onChipPeakWavelengths[i] + onChipPeakWavelengths[i + 1]) / 2
-    y = max(powerFilteredNormalized) * (0.5 if i % 2 == 0 else 0.75)  # Alternate y position
-    y_offset = 0.05 * (i % 2)  # Add a small vertical offset to alternate positions
-    plt.annotate(f"{onChipPeakDistances[i]:.1f} pm", (x, y + y_offset), fontsize=10, color='purple', ha='center')
-
-plt.xlim([minWavelength, maxWavelength])  # Set x-axis limits to match the adjusted wavelength range
-plt.xlabel('Wavelength (nm)', fontsize=16)
-plt.ylabel('Normalized Power', fontsize=16)
-plt.legend(loc='upper right', fontsize=13)  # Place the legend in the top-right corner
-
-# Remove "_data" and ".mat" from the benchtop file name for the title
-benchtopFileNameCleaned = os.path.splitext(benchtopFileName.replace("_data", ""))[0]
-
-# Set the plot title with the cleaned file name
-plt.title(f'Wavelength vs Normalized Power ({benchtopFileNameCleaned})', fontsize=14)
-
-plt.grid(True)
-
-# Save the figure as a PNG file
-figureFileName = os.path.splitext(comparisonFileName)[0] + ".png"
-figureFilePath = os.path.join(comparisonFolder, figureFileName)
-plt.savefig(figureFilePath, format='png', dpi=300)
-print(f"Figure saved to {figureFilePath}")
-
-# Show the plot
-plt.show()
-
-# Prompt user for Q factor analysis
-do_q_analysis = messagebox.askyesno("Q Factor Analysis", "Do you want to perform quality factor (Q) analysis using Lorentzian fits?")
-
-if do_q_analysis:
-    # --- Perform Q factor analysis for all peaks ---
-    # Analyze all peaks in Benchtop data
-    for i, peak_idx in enumerate(benchtopPeaks):
-        analyze_peak_qfactor(
-            wavelengthBenchtopLimited, powerBenchtopNormalized, peak_idx,
-            window=10, color='r', label=f'Benchtop Peak {i+1}',
-            plot_title=f'Benchtop Peak {i+1} Lorentzian Fit'
-        )
-
-    # Analyze all peaks in On-Chip data
-    for i, peak_idx in enumerate(onChipPeaks):
-        analyze_peak_qfactor(
-            wavelengthOnChip, powerFilteredNormalized, peak_idx,
-            window=6, color='purple', label=f'On-Chip Peak {i+1}',
-            plot_title=f'On-Chip Peak {i+1} Lorentzian Fit'
-        )
-
-    # --- Overlay plot for Benchtop ---
-    plt.figure(figsize=(12, 8))
-    plt.plot(wavelengthBenchtopLimited, powerBenchtopNormalized, color='red', linestyle='--', linewidth=1.5, label='Benchtop Laser')
-    q_labels = []
-    for i, peak_idx in enumerate(benchtopPeaks):
-        px, norm_y, yfit, Q, R2, residual, params = analyze_peak_qfactor_overlay(
-            wavelengthBenchtopLimited, powerBenchtopNormalized, peak_idx, window=10)
-        if px is not None:
-            plt.plot(px, yfit, 'b:', linewidth=2, label='Lorentz fit' if i == 0 else None)
-            peak_wl = px[np.argmax(norm_y)]
-            peak_val = np.max(norm_y)
-            plt.annotate(f"Q={Q:.0f}", (peak_wl, peak_val+0.05), color='blue', fontsize=12, ha='center')
-            q_labels.append((peak_wl, Q))
-    plt.xlabel('Wavelength (nm)', fontsize=16)
-    plt.ylabel('Normalized Power', fontsize=16)
-    plt.title('Benchtop Peaks with Lorentzian Fits and Q Factors', fontsize=14)
-    plt.legend(loc='upper right', fontsize=13)
-    plt.ylim([0, 1.2])
-    plt.grid(True)
-    plt.show()
-
-    # --- Overlay plot for On-Chip ---
-    plt.figure(figsize=(12, 8))
-    plt.plot(wavelengthOnChip, powerFilteredNormalized, color='purple', linestyle='-', linewidth=1.5, label='On-Chip Laser')
-    for i, peak_idx in enumerate(onChipPeaks):
-        px, norm_y, yfit, Q, R2, residual, params = analyze_peak_qfactor_overlay(
-            wavelengthOnChip, powerFilteredNormalized, peak_idx, window=6)
-        if px is not None:
-            plt.plot(px, yfit, 'g:', linewidth=2, label='Lorentz fit' if i == 0 else None)
-            peak_wl = px[np.argmax(norm_y)]
-            peak_val = np.max(norm_y)
-            plt.annotate(f"Q={Q:.0f}", (peak_wl, peak_val+0.05), color='green', fontsize=12, ha='center')
-    plt.xlabel('Wavelength (nm)', fontsize=16)
-    plt.ylabel('Normalized Power', fontsize=16)
-    plt.title('On-Chip Peaks with Lorentzian Fits and Q Factors', fontsize=14)
-    plt.legend(loc='upper right', fontsize=13)
-    plt.ylim([0, 1.2])
-    plt.grid(True)
-    plt.show()
-
-    # --- Residuals plots ---
-    for i, peak_idx in enumerate(benchtopPeaks):
-        px, norm_y, yfit, Q, R2, residual, params = analyze_peak_qfactor_overlay(
-            wavelengthBenchtopLimited, powerBenchtopNormalized, peak_idx, window=10)
-        if px is not None:
-            plt.figure(figsize=(7, 5))
-            plt.plot(yfit, residual, '.', linewidth=2)
-            plt.axhline(0, color='k')
-            plt.xlabel('Fit Value')
-            plt.ylabel('Residuals')
-            plt.title(f'Benchtop Peak {i+1} Residuals (Q={Q:.0f})')
-            plt.grid(True)
-            plt.show()
-
-    for i, peak_idx in enumerate(onChipPeaks):
-        px, norm_y, yfit, Q, R2, residual, params = analyze_peak_qfactor_overlay(
-            wavelengthOnChip, powerFilteredNormalized, peak_idx, window=6)
-        if px is not None:
-            plt.figure(figsize=(7, 5))
-            plt.plot(yfit, residual, '.', linewidth=2)
-            plt.axhline(0, color='k')
-            plt.xlabel('Fit Value')
-            plt.ylabel('Residuals')
-            plt.title(f'On-Chip Peak {i+1} Residuals (Q={Q:.0f})')
-            plt.grid(True)
-            plt.show()
-
-    # --- Combined overlay plot for Benchtop and On-Chip with Lorentzian fits and Q annotation ---
-    plt.figure(figsize=(14, 8))
-    plt.plot(wavelengthBenchtopLimited, powerBenchtopNormalized, color='red', linestyle='--', linewidth=1.5, label='Benchtop Laser')
-    plt.plot(wavelengthOnChip, powerFilteredNormalized, color='purple', linestyle='-', linewidth=1.5, label='On-Chip Laser')
-
-    # Overlay Benchtop Lorentzian fits and annotate Q
-    for i, peak_idx in enumerate(benchtopPeaks):
-        px, norm_y, yfit, Q, R2, residual, params = analyze_peak_qfactor_overlay(
-            wavelengthBenchtopLimited, powerBenchtopNormalized, peak_idx, window=10)
-        if px is not None:
-            plt.plot(px, yfit, 'b:', linewidth=2, label='Benchtop Lorentz fit' if i == 0 else None)
-            peak_wl = px[np.argmax(norm_y)]
-            peak_val = np.max(norm_y)
-            plt.annotate(f"Q={Q:.0f}", (peak_wl, peak_val+0.08), color='blue', fontsize=12, ha='center')
-
-    # Overlay On-Chip Lorentzian fits and annotate Q
-    for i, peak_idx in enumerate(onChipPeaks):
-        px, norm_y, yfit, Q, R2, residual, params = analyze_peak_qfactor_overlay(
-            wavelengthOnChip, powerFilteredNormalized, peak_idx, window=6)
-        if px is not None:
-            plt.plot(px, yfit, 'g:', linewidth=2, label='On-Chip Lorentz fit' if i == 0 else None)
-            peak_wl = px[np.argmax(norm_y)]
-            peak_val = np.max(norm_y)
-            plt.annotate(f"Q={Q:.0f}", (peak_wl, peak_val+0.08), color='green', fontsize=12, ha='center')
-
-    plt.xlabel('Wavelength (nm)', fontsize=16)
-    plt.ylabel('Normalized Power', fontsize=16)
-    plt.title('Benchtop & On-Chip Peaks with Lorentzian Fits and Q Factors', fontsize=15)
-    plt.legend(loc='upper right', fontsize=13)
-    plt.ylim([0, 1.25])
-    plt.grid(True)
+        return entry, str(e), [], None
+    specs = []
+    if plot_folder is not None:
+        name = _device_name(benchtop_file)
+        specs.append(comparison_figure(result, name, [os.path.join(plot_folder, f"Comparison2_{name}.png")]))
+    return entry, None, specs, result
+
+def load_manifest(path):
+    """Read a manifest csv with columns osa_file, liv_file, benchtop_file (one device per row)."""
+    table = pd.read_csv(path)
+    return list(table[['osa_file', 'liv_file', 'benchtop_file']].itertuples(index=False, name=None))
+
+def run_comparisons(manifest, output, workers=None, q_analysis=True, plot_folder=None, render_workers=None,
+                    save_spectra=False):
+    """
+    Compare many devices in parallel and save all results to one .mat file.
+
+    Parameters
+    ----------
+    manifest : list of tuple or str
+        (osa_file, liv_file, benchtop_file) per device, or a csv file read with load_manifest.
+    output : str
+        Consolidated .mat file. It holds device (names), osa_file, liv_file, benchtop_file, and results: one struct
+        per device with the scalars and peak arrays of compare_device (peak wavelengths, spacings, spectral offset,
+        FSRs, Q-factors; empty for devices that failed, see error).
+    workers : int or None
+        Worker processes (None = one per CPU core, 1 = one device at a time).
+    q_analysis : bool
+        Include the Lorentzian Q-factors.
+    plot_folder : str or None
+        If given, the comparison plot of each device is saved there as Comparison2_<device>.png.
+    render_workers : int or None
+        Processes that draw the plots (see render.RenderPool).
+    save_spectra : bool
+        Also save the normalised spectra and the peak indices into them (SPECTRUM_FIELDS) of every device.
+
+    Returns
+    -------
+    results : list of dict
+        compare_device result of each manifest entry (in manifest order), None where it failed.
+    """
+    if isinstance(manifest, (str, os.PathLike)):
+        manifest = load_manifest(manifest)
+    manifest = [tuple(str(f) for f in entry) for entry in manifest]
+    if plot_folder is not None:
+        os.makedirs(plot_folder, exist_ok=True)
+
+    by_entry = {}
+    errors = process_and_render(partial(_compare_entry, q_analysis=q_analysis, plot_folder=plot_folder),
+                                manifest, workers, render_workers, on_result=by_entry.__setitem__)
+    for entry in manifest:
+        if errors.get(entry):
+            print(f"Error comparing {_device_name(entry[2])}: {errors[entry]}")
+
+    results = [by_entry.get(entry) for entry in manifest]
+    saved = [{key: value for key, value in result.items() if save_spectra or key not in SPECTRUM_FIELDS}
+             if result is not None else {} for result in results]
+    scipy.io.savemat(output, {
+        'device': np.array([_device_name(entry[2]) for entry in manifest], dtype=object),
+        'osa_file': np.array([entry[0] for entry in manifest], dtype=object),
+        'liv_file': np.array([entry[1] for entry in manifest], dtype=object),
+        'benchtop_file': np.array([entry[2] for entry in manifest], dtype=object),
+        'error': np.array([errors.get(entry) or '' for entry in manifest], dtype=object),
+        'results': np.array(saved, dtype=object),
+    })
+    print(f"Compared {sum(r is not None for r in results)} of {len(manifest)} devices, results saved to {output}")
+    return results
+
+def main():
+    from tkinter import Tk, filedialog, messagebox
+
+    # Print current date and time for logging
+    print("Script run at:", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+    # Initialize the Tkinter root window
+    root = Tk()
+    root.withdraw()  # Hide the root window but keep it active for dialogs
+
+    # Prompt user to select the OSA folder
+    osaFolder = filedialog.askdirectory(
+        title="Select the folder containing OSA .mat files",
+        initialdir=r"C:\Users\jsheri1\Documents\A_Research\2024-02_Wafer-Scale\20250403_Shuksan_ANT_Light2025_WaferscaleMeasurements\OSA"
+    )
+    if not osaFolder:
+        raise FileNotFoundError("No OSA folder selected.")
+
+    # Prompt user to select the LIV folder
+    livFolder = filedialog.askdirectory(
+        title="Select the folder containing LIV .mat files",
+        initialdir=r"C:\Users\jsheri1\Documents\A_Research\2024-02_Wafer-Scale\20250403_Shuksan_ANT_Light2025_WaferscaleMeasurements\LIV"
+    )
+    if not livFolder:
+        raise FileNotFoundError("No LIV folder selected.")
+
+    # Prompt user to select the Benchtop .mat file
+    benchtopFile = filedialog.askopenfilename(
+        title="Select the Benchtop .mat file",
+        filetypes=[("MAT files", "*.mat")],
+        initialdir=r"C:\Users\jsheri1\Documents\A_Research\2024-02_Wafer-Scale\20250403_Shuksan_ANT_Light2025_WaferscaleMeasurements\Benchtop"
+    )
+    if not benchtopFile:
+        raise FileNotFoundError("No Benchtop .mat file selected.")
+
+    # Use the first .mat file of the OSA and LIV folders
+    osaFiles = [f for f in os.listdir(osaFolder) if f.endswith('.mat')]
+    if not osaFiles:
+        raise FileNotFoundError("No .mat files found in the selected OSA folder.")
+    livFiles = [f for f in os.listdir(livFolder) if f.endswith('.mat')]
+    if not livFiles:
+        raise FileNotFoundError("No .mat files found in the selected LIV folder.")
+
+    result = compare_device(os.path.join(osaFolder, osaFiles[0]), os.path.join(livFolder, livFiles[0]), benchtopFile,
+                            q_analysis=False)
+
+    # Save plot data to a .mat file
+    if not os.path.exists(COMPARISON_FOLDER):
+        os.makedirs(COMPARISON_FOLDER)
+    benchtopFileName = os.path.basename(benchtopFile)
+    comparisonFileName = f"Comparison2_{benchtopFileName}"
+    outputFile = os.path.join(COMPARISON_FOLDER, comparisonFileName)
+    scipy.io.savemat(outputFile, {key: result[key] for key in (
+        'wavelengthBenchtopLimited', 'powerBenchtopNormalized', 'benchtopPeakWavelengths', 'benchtopPeakDistances',
+        'wavelengthOnChip', 'powerFilteredNormalized', 'onChipPeakWavelengths', 'onChipPeakDistances')})
+    print(f"Plot data saved to {outputFile}")
+
+    # Plot, save as PNG and show
+    figureFilePath = os.path.join(COMPARISON_FOLDER, os.path.splitext(comparisonFileName)[0] + ".png")
+    fig = comparison_figure(result, _device_name(benchtopFile), [figureFilePath])
+    render_figure(fig)
+    show_figure(fig)
     plt.show()
 
+    # Prompt user for Q factor analysis
+    do_q_analysis = messagebox.askyesno("Q Factor Analysis", "Do you want to perform quality factor (Q) analysis using Lorentzian fits?")
+
+    if do_q_analysis:
+        # --- Fit all peaks of each spectrum at once; the plots below reuse these fits ---
+        wavelengthBenchtopLimited, powerBenchtopNormalized = result['wavelengthBenchtopLimited'], result['powerBenchtopNormalized']
+        wavelengthOnChip, powerFilteredNormalized = result['wavelengthOnChip'], result['powerFilteredNormalized']
+        benchtopPeaks, onChipPeaks = result['benchtopPeakIndices'], result['onChipPeakIndices']
+        benchtopFits = analyze_peaks_qfactor(wavelengthBenchtopLimited, powerBenchtopNormalized, benchtopPeaks, window=BENCHTOP_WINDOW)
+        onChipFits = analyze_peaks_qfactor(wavelengthOnChip, powerFilteredNormalized, onChipPeaks, window=ON_CHIP_WINDOW)
+
+        # --- Perform Q factor analysis for all peaks ---
+        # Analyze all peaks in Benchtop data
+        for i, peak_idx in enumerate(benchtopPeaks):
+            analyze_peak_qfactor(
+                wavelengthBenchtopLimited, powerBenchtopNormalized, peak_idx,
+                window=BENCHTOP_WINDOW, color='r', label=f'Benchtop Peak {i+1}',
+                plot_title=f'Benchtop Peak {i+1} Lorentzian Fit', fit=benchtopFits[i]
+            )
+
+        # Analyze all peaks in On-Chip data
+        for i, peak_idx in enumerate(onChipPeaks):
+            analyze_peak_qfactor(
+                wavelengthOnChip, powerFilteredNormalized, peak_idx,
+                window=ON_CHIP_WINDOW, color='purple', label=f'On-Chip Peak {i+1}',
+                plot_title=f'On-Chip Peak {i+1} Lorentzian Fit', fit=onChipFits[i]
+            )
+
+        # --- Overlay plot for Benchtop ---
+        plt.figure(figsize=(12, 8))
+        plt.plot(wavelengthBenchtopLimited, powerBenchtopNormalized, color='red', linestyle='--', linewidth=1.5, label='Benchtop Laser')
+        q_labels = []
+        for i, peak_idx in enumerate(benchtopPeaks):
+            px, norm_y, yfit, Q, R2, residual, params = benchtopFits[i]
+            if px is not None:
+                plt.plot(px, yfit, 'b:', linewidth=2, label='Lorentz fit' if i == 0 else None)
+                peak_wl = px[np.argmax(norm_y)]
+                peak_val = np.max(norm_y)
+                plt.annotate(f"Q={Q:.0f}", (peak_wl, peak_val+0.05), color='blue', fontsize=12, ha='center')
+                q_labels.append((peak_wl, Q))
+        plt.xlabel('Wavelength (nm)', fontsize=16)
+        plt.ylabel('Normalized Power', fontsize=16)
+        plt.title('Benchtop Peaks with Lorentzian Fits and Q Factors', fontsize=14)
+        plt.legend(loc='upper right', fontsize=13)
+        plt.ylim([0, 1.2])
+        plt.grid(True)
+        plt.show()
+
+        # --- Overlay plot for On-Chip ---
+        plt.figure(figsize=(12, 8))
+        plt.plot(wavelengthOnChip, powerFilteredNormalized, color='purple', linestyle='-', linewidth=1.5, label='On-Chip Laser')
+        for i, peak_idx in enumerate(onChipPeaks):
+            px, norm_y, yfit, Q, R2, residual, params = onChipFits[i]
+            if px is not None:
+                plt.plot(px, yfit, 'g:', linewidth=2, label='Lorentz fit' if i == 0 else None)
+                peak_wl = px[np.argmax(norm_y)]
+                peak_val = np.max(norm_y)
+                plt.annotate(f"Q={Q:.0f}", (peak_wl, peak_val+0.05), color='green', fontsize=12, ha='center')
+        plt.xlabel('Wavelength (nm)', fontsize=16)
+        plt.ylabel('Normalized Power', fontsize=16)
+        plt.title('On-Chip Peaks with Lorentzian Fits and Q Factors', fontsize=14)
+        plt.legend(loc='upper right', fontsize=13)
+        plt.ylim([0, 1.2])
+        plt.grid(True)
+        plt.show()
+
+        # --- Residuals plots ---
+        for i, peak_idx in enumerate(benchtopPeaks):
+            px, norm_y, yfit, Q, R2, residual, params = benchtopFits[i]
+            if px is not None:
+                plt.figure(figsize=(7, 5))
+                plt.plot(yfit, residual, '.', linewidth=2)
+                plt.axhline(0, color='k')
+                plt.xlabel('Fit Value')
+                plt.ylabel('Residuals')
+                plt.title(f'Benchtop Peak {i+1} Residuals (Q={Q:.0f})')
+                plt.grid(True)
+                plt.show()
+
+        for i, peak_idx in enumerate(onChipPeaks):
+            px, norm_y, yfit, Q, R2, residual, params = onChipFits[i]
+            if px is not None:
+                plt.figure(figsize=(7, 5))
+                plt.plot(yfit, residual, '.', linewidth=2)
+                plt.axhline(0, color='k')
+                plt.xlabel('Fit Value')
+                plt.ylabel('Residuals')
+                plt.title(f'On-Chip Peak {i+1} Residuals (Q={Q:.0f})')
+                plt.grid(True)
+                plt.show()
+
+        # --- Combined overlay plot for Benchtop and On-Chip with Lorentzian fits and Q annotation ---
+        plt.figure(figsize=(14, 8))
+        plt.plot(wavelengthBenchtopLimited, powerBenchtopNormalized, color='red', linestyle='--', linewidth=1.5, label='Benchtop Laser')
+        plt.plot(wavelengthOnChip, powerFilteredNormalized, color='purple', linestyle='-', linewidth=1.5, label='On-Chip Laser')
+
+        # Overlay Benchtop Lorentzian fits and annotate Q
+        for i, peak_idx in enumerate(benchtopPeaks):
+            px, norm_y, yfit, Q, R2, residual, params = benchtopFits[i]
+            if px is not None:
+                plt.plot(px, yfit, 'b:', linewidth=2, label='Benchtop Lorentz fit' if i == 0 else None)
+                peak_wl = px[np.argmax(norm_y)]
+                peak_val = np.max(norm_y)
+                plt.annotate(f"Q={Q:.0f}", (peak_wl, peak_val+0.08), color='blue', fontsize=12, ha='center')
+
+        # Overlay On-Chip Lorentzian fits and annotate Q
+        for i, peak_idx in enumerate(onChipPeaks):
+            px, norm_y, yfit, Q, R2, residual, params = onChipFits[i]
+            if px is not None:
+                plt.plot(px, yfit, 'g:', linewidth=2, label='On-Chip Lorentz fit' if i == 0 else None)
+                peak_wl = px[np.argmax(norm_y)]
+                peak_val = np.max(norm_y)
+                plt.annotate(f"Q={Q:.0f}", (peak_wl, peak_val+0.08), color='green', fontsize=12, ha='center')
+
+        plt.xlabel('Wavelength (nm)', fontsize=16)
+        plt.ylabel('Normalized Power', fontsize=16)
+        plt.title('Benchtop & On-Chip Peaks with Lorentzian Fits and Q Factors', fontsize=15)
+        plt.legend(loc='upper right', fontsize=13)
+        plt.ylim([0, 1.25])
+        plt.grid(True)
+        plt.show()
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,7 @@ import pandas as pd
 import scipy.io as sio
 import datetime
 import matplotlib.pyplot as plt
+from filename_meta import parse_filename
 
 class LaserComparator:
     def __init__(self, laser_df, compare_mode):
@@ -75,6 +76,8 @@ class LaserComparator:
             #plt.close(fig)
             plt.show()  # Show the plot for debugging
 
+_LAST_FIELD = re.compile(r'_([A-Za-z0-9-]+)$')
+
 def compile_laser_data(parent_folder, compare_mode, output_folder=None):
     if output_folder is None:
         output_folder = parent_folder
@@ -89,9 +92,13 @@ def compile_laser_data(parent_folder, compare_mode, output_folder=None):
             mat_file = mat_files[0]
             mat_path = os.path.join(root, mat_file)
             folder_name = os.path.basename(root)
-            base_name = os.path.splitext(mat_file)[0]
-            match = re.search(r'_([A-Za-z0-9-]+)$', base_name)
-            laser_id = match.group(1) if match else folder_name
+            # Device IDtag from the filename; names outside the naming scheme keep their last '_' field (or the folder)
+            meta = parse_filename(mat_file)
+            if meta.chip is not None:
+                laser_id = meta.idtag(iteration=True)
+            else:
+                match = _LAST_FIELD.search(os.path.splitext(mat_file)[0])
+                laser_id = match.group(1) if match else folder_name
             data = sio.loadmat(mat_path, squeeze_me=True, struct_as_record=False)
 
             pk_power = pk_wl = thr_curr = None
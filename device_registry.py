@@ -0,0 +1,191 @@
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from filename_meta import parse_filename
+
+"""
+    SQLite registry of every processed measurement, filled in by the multi_* drivers as they process files, so that
+    devices can be selected by their metadata without walking the parent folder or reopening .mat files.
+
+    '<parent>/device_registry.sqlite' holds:
+            - measurements: one row per raw csv, with its type (LIV, WLM, OSA, from the content), IDtag, the fields of its
+              filename (chip, device, cladding, wavelength band, iteration, timestamp), the raw and .mat paths and
+              when it was processed. Indexed on chip/device, type/wavelength/cladding, IDtag and timestamp.
+            - metrics: the scalar results of each measurement (the row of the summary index: thresholds, peak power,
+              fit coefficients, ...), one (measurement, name, value) row each, indexed on name/value.
+
+    Usage:
+        registry = DeviceRegistry(parent_dir)
+        registry.query(kind="LIV", chip="ChipC32", wavelength_nm=1310, cladding="clad", latest=True,
+                       metrics=["ch1_threshold"])   # DataFrame, one row per measurement
+
+    [Author: Rhiannon H Evans]
+"""
+
+REGISTRY_FILENAME = "device_registry.sqlite"
+REGISTRY_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS measurements (
+    id INTEGER PRIMARY KEY,
+    raw_path TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    idtag TEXT,
+    chip TEXT COLLATE NOCASE,
+    device TEXT COLLATE NOCASE,
+    cladding TEXT COLLATE NOCASE,
+    wavelength_nm INTEGER,
+    iteration INTEGER,
+    timestamp TEXT,
+    mat_path TEXT,
+    processed TEXT
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    measurement_id INTEGER NOT NULL REFERENCES measurements(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (measurement_id, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS measurements_chip_device ON measurements (chip, device);
+CREATE INDEX IF NOT EXISTS measurements_kind_band ON measurements (kind, wavelength_nm, cladding);
+CREATE INDEX IF NOT EXISTS measurements_idtag ON measurements (idtag);
+CREATE INDEX IF NOT EXISTS measurements_timestamp ON measurements (timestamp);
+CREATE INDEX IF NOT EXISTS metrics_name_value ON metrics (name, value);
+"""
+
+# Columns of measurements that query() can filter on
+FILTER_COLUMNS = ("kind", "idtag", "chip", "device", "cladding", "wavelength_nm", "iteration")
+
+
+def registry_path(parent_path):
+    return Path(parent_path) / REGISTRY_FILENAME
+
+
+def filename_fields(filename):
+    """{chip, device, cladding, wavelength_nm, iteration, timestamp} from a measurement filename (None where absent)."""
+    meta = parse_filename(filename)
+    return {
+        "chip": meta.chip,
+        "device": meta.device,
+        "cladding": meta.cladding,
+        "wavelength_nm": meta.wavelength_nm,
+        "iteration": meta.iteration,
+        "timestamp": meta.timestamp.isoformat() if meta.timestamp else None,
+    }
+
+
+class DeviceRegistry:
+    """Shared by main.py and the multi_* drivers (like MeasurementCatalog and ProcessingLedger)."""
+
+    def __init__(self, parent_path, registry_file=None):
+        self.parent_path = Path(parent_path)
+        self.registry_file = Path(registry_file) if registry_file else registry_path(parent_path)
+        self.connection = sqlite3.connect(self.registry_file)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, REGISTRY_VERSION):
+            # Written by another version: start again, the drivers fill it in as they go
+            print(f"Rebuilding device registry {self.registry_file} written by another version")
+            self.connection.executescript("DROP TABLE IF EXISTS metrics; DROP TABLE IF EXISTS measurements;")
+        self.connection.executescript(_SCHEMA)
+        self.connection.execute(f"PRAGMA user_version = {REGISTRY_VERSION}")
+
+    def record(self, kind, raw_path, idtag, mat_path=None, metrics=None):
+        """
+        Add or update the measurement of a raw csv (call save() to commit).
+
+        Parameters
+        ----------
+        kind : str
+            Measurement type (LIV, WLM, OSA).
+        raw_path : str or Path
+            Raw measurement csv; its filename gives chip, device, cladding, wavelength, iteration and timestamp.
+        idtag : str
+            IDtag the driver uses for the device.
+        mat_path : str or Path or None
+            Processed .mat of the csv.
+        metrics : dict or None
+            {name: float} scalar results (a summary index row); replaces the earlier metrics of the measurement.
+        """
+        fields = filename_fields(raw_path)
+        row = dict(fields, raw_path=str(raw_path), kind=kind, idtag=idtag,
+                   mat_path=None if mat_path is None else str(mat_path),
+                   processed=datetime.now().isoformat(timespec="seconds"))
+        columns = ", ".join(row)
+        self.connection.execute(
+            f"INSERT INTO measurements ({columns}) VALUES ({', '.join('?' * len(row))}) "
+            f"ON CONFLICT(raw_path) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in row if c != 'raw_path')}",
+            list(row.values()))
+        if metrics is not None:
+            (measurement_id,) = self.connection.execute(
+                "SELECT id FROM measurements WHERE raw_path = ?", (str(raw_path),)).fetchone()
+            self.connection.execute("DELETE FROM metrics WHERE measurement_id = ?", (measurement_id,))
+            self.connection.executemany(
+                "INSERT INTO metrics (measurement_id, name, value) VALUES (?, ?, ?)",
+                [(measurement_id, name, None if value is None or np.isnan(value) else float(value))
+                 for name, value in metrics.items()])
+
+    def save(self):
+        """Commit the measurements recorded since the last save."""
+        self.connection.commit()
+
+    def close(self):
+        self.save()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def query(self, latest=False, metrics=None, **filters):
+        """
+        Measurements matching the filters, as a DataFrame (one row per measurement, indexed by id).
+
+        Parameters
+        ----------
+        latest : bool
+            Keep only the latest measurement (highest iteration, then timestamp) of each device, i.e. of each type,
+            chip, device, cladding and wavelength.
+        metrics : list of str or None
+            Names of metrics to add as columns (NaN where a measurement has none).
+        **filters
+            Column (one of FILTER_COLUMNS) = value, or a list of values; text columns except kind and idtag ignore case.
+        """
+        clauses, params = [], []
+        for column, value in filters.items():
+            if column not in FILTER_COLUMNS:
+                raise ValueError(f"Cannot filter measurements on {column!r} (one of {FILTER_COLUMNS})")
+            values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+            clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        sql = "SELECT * FROM measurements" + (f" WHERE {' AND '.join(clauses)}" if clauses else "")
+        if latest:
+            sql = ("SELECT * FROM (SELECT *, ROW_NUMBER() OVER (PARTITION BY kind, chip, device, cladding, wavelength_nm "
+                   "ORDER BY COALESCE(iteration, -1) DESC, timestamp DESC) AS rank FROM (" + sql + ")) WHERE rank = 1")
+        frame = pd.read_sql_query(sql, self.connection, params=params, index_col="id")
+        frame = frame.drop(columns="rank", errors="ignore")
+        if metrics:
+            frame = frame.join(self.metrics(frame.index, metrics))
+        return frame
+
+    def metrics(self, measurement_ids, names=None):
+        """DataFrame of the metrics of the given measurements (columns: names, or every metric they have)."""
+        ids = [int(i) for i in measurement_ids]
+        columns = list(names) if names is not None else None
+        if not ids:
+            return pd.DataFrame(columns=columns, dtype=float)
+        sql = f"SELECT measurement_id, name, value FROM metrics WHERE measurement_id IN ({', '.join('?' * len(ids))})"
+        params = list(ids)
+        if columns is not None:
+            sql += f" AND name IN ({', '.join('?' * len(columns))})"
+            params += columns
+        long = pd.read_sql_query(sql, self.connection, params=params)
+        wide = long.pivot(index="measurement_id", columns="name", values="value").astype(float)
+        wide = wide.reindex(index=ids, columns=columns)
+        wide.index.name = "id"
+        wide.columns.name = None
+        return wide
@@ -0,0 +1,160 @@
+import os
+import re
+from datetime import datetime
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+"""
+    Metadata of a measurement from its filename, following the naming scheme in README.md (FILE NAME FORMAT):
+
+        <timestamp>_<custom>_<datatype>_<wavelength>nm_<chipID>_<deviceID>_<cladding>_<iteration>
+
+    e.g. '2025_05_01_19_55_58_LIV_1310nm_Chip27_R5_clad__iter16.csv'. Only the chip and device are required; the
+    format is case insensitive and anything after the last recognised field (such as '_new' of the OSA .mat) is
+    ignored. The chip ID may contain underscores but ends at the first device token ('Chip_C32_R1' is chip 'Chip_C32',
+    device 'R1'). One compiled pattern parses the whole name and the result is cached per filename, so the drivers can
+    call parse_filename for every file of a discovery loop.
+
+    The IDtag is not built from the parsed fields: it is what the per-script IDtag regexes gave before this module
+    (the first of 'Chip\w+_R\d+', '..._L\d+', '..._D\d+' in the name, case sensitive, with '_clad' and, for LIV,
+    '__iter<n>'), so the .mat files, campaign stores, summary indexes and registries written before keep their keys.
+    The iteration of a name such as '..._clad_iter90' (one underscore) is therefore in FilenameMeta.iteration only.
+    IDTAG_EXAMPLES (also in README.md) lists example names with their IDtags; run this module to check them.
+
+    Usage:
+        meta = parse_filename(csv_path)     # FilenameMeta(timestamp=datetime(...), chip='Chip27', device='R5', ...)
+        meta.idtag()                        # 'Chip27_R5_clad'
+        meta.idtag(iteration=True)          # 'Chip27_R5_clad__iter16'
+        unique_idtags(csv_paths)            # {path: IDtag}, with devices whose IDtags collide told apart
+
+    [Author: Rhiannon H Evans]
+"""
+
+UNKNOWN_ID = "Unknown_ID"
+
+# (filename, IDtag, IDtag with iteration=True as used for LIV)
+IDTAG_EXAMPLES = (
+    ("anything123_LIV_1310nm_Chip27_R5_clad_iter90.csv", "Chip27_R5_clad", "Chip27_R5_clad"),
+    ("2025_05_01_19_55_58_LIV_1310nm_Chip27_R5_clad__iter16.csv", "Chip27_R5_clad", "Chip27_R5_clad__iter16"),
+    ("2025_06_27_13_53_34_LIV_1310nm_ChipC32_R4_clad.csv", "ChipC32_R4_clad", "ChipC32_R4_clad"),
+    ("2025_06_27_13_49_37_wlmLIV_1310nm_ChipC32_R4_clad.csv", "ChipC32_R4_clad", "ChipC32_R4_clad"),
+    ("2025_04_04_17_10_53_OSA_1330nm_ChipC32_R1.csv", "ChipC32_R1", "ChipC32_R1"),
+    ("2025_04_04_17_10_53_OSA_1330nm_ChipC32_R1_new.mat", "ChipC32_R1", "ChipC32_R1"),
+    ("x_OSA_1310nm_Chip_C32_R1_clad.csv", "Chip_C32_R1_clad", "Chip_C32_R1_clad"),
+    ("x_LIV_1310nm_Chip27_L3_unclad__iter2.csv", "Chip27_L3", "Chip27_L3"),
+    ("x_LIV_1310nm_Chip27_D12_clad__iter4.csv", "Chip27_D12_clad", "Chip27_D12_clad__iter4"),
+    ("x_LIV_1310nm_chip27_r5_CLAD.csv", UNKNOWN_ID, UNKNOWN_ID),
+    ("x_LIV_1310nm_Wafer3.csv", UNKNOWN_ID, UNKNOWN_ID),
+)
+
+_FILENAME_RE = re.compile(r"""
+    ^(?:(?P<timestamp>\d{4}_\d{2}_\d{2}_\d{2}_\d{2}_\d{2})_)?
+    (?:(?P<custom>.*?)_)??
+    (?:(?P<datatype>[a-z]*(?:liv|osa|wlm))_)?
+    (?:(?P<wavelength>\d+)nm_)?
+    (?P<chip>chip(?:(?!_[rld]\d)[\w-])+)_(?P<device>[rld]\d+)(?![^\W_])
+    (?:_(?P<cladding>clad|unclad))?
+    (?:_+iter(?P<iteration>\d+))?
+    """, re.IGNORECASE | re.VERBOSE)
+
+# The IDtag regexes of the scripts this module replaced, in the order they were tried (R, L, then D devices)
+_IDTAG_RES = tuple(re.compile(rf"Chip\w+_{device}\d+(_clad)?(?P<iteration>__iter\d+)?") for device in "RLD")
+
+
+class FilenameMeta(NamedTuple):
+    """Fields of a measurement filename (None where the name does not have them)."""
+    name: str
+    timestamp: Optional[datetime] = None
+    custom: Optional[str] = None
+    datatype: Optional[str] = None
+    wavelength_nm: Optional[int] = None
+    chip: Optional[str] = None
+    device: Optional[str] = None
+    cladding: Optional[str] = None
+    iteration: Optional[int] = None
+
+    def idtag(self, iteration=False):
+        """
+        IDtag of the device, exactly as the earlier IDtag regexes gave it: '<chip>_<device>', then '_clad' if the name
+        has it, then '__iter<n>' if iteration is True and the name has it right after (the LIV form). UNKNOWN_ID if
+        the name has no 'Chip..._R/L/D<n>'. An unclad device has no suffix (the cladding field tells it apart;
+        unique_idtags separates a clad and an unclad file of the same device).
+        """
+        return _legacy_idtag(os.path.splitext(self.name)[0], iteration)
+
+
+@lru_cache(maxsize=None)
+def _legacy_idtag(stem, iteration):
+    for pattern in _IDTAG_RES:
+        match = pattern.search(stem)
+        if match:
+            return match[0] if iteration or not match["iteration"] else match[0][:match.start("iteration") - match.start()]
+    return UNKNOWN_ID
+
+
+def _timestamp(text):
+    try:
+        return datetime.strptime(text, "%Y_%m_%d_%H_%M_%S")
+    except (TypeError, ValueError):
+        return None
+
+
+@lru_cache(maxsize=None)
+def _parse_name(name):
+    stem = os.path.splitext(name)[0]
+    match = _FILENAME_RE.search(stem)
+    if match is None:
+        return FilenameMeta(name, timestamp=_timestamp(stem[:19]))
+    return FilenameMeta(
+        name,
+        timestamp=_timestamp(match["timestamp"]),
+        custom=match["custom"] or None,
+        datatype=match["datatype"],
+        wavelength_nm=int(match["wavelength"]) if match["wavelength"] else None,
+        chip=match["chip"],
+        device=match["device"],
+        cladding=match["cladding"].lower() if match["cladding"] else None,
+        iteration=int(match["iteration"]) if match["iteration"] else None,
+    )
+
+
+def parse_filename(filename):
+    """FilenameMeta of a file (str or Path; only the file name is used), cached per file name."""
+    return _parse_name(os.path.basename(os.fspath(filename)))
+
+
+def unique_idtags(paths, iteration=False):
+    """
+    {path: IDtag} of the given files. When several files give the same IDtag (e.g. the same device measured twice
+    without an iteration number), the earliest keeps it and the others get their timestamp (or a count) appended, so
+    no device overwrites another; each such case is reported.
+    """
+    by_tag = {}
+    for path in paths:
+        by_tag.setdefault(parse_filename(path).idtag(iteration), []).append(path)
+
+    idtags = {}
+    taken = set(by_tag)
+    for tag, group in by_tag.items():
+        if len(group) > 1:
+            group = sorted(group, key=lambda p: (parse_filename(p).timestamp or datetime.min, os.fspath(p)))
+            print(f"Warning: {len(group)} files give the IDtag {tag}, the later ones are told apart by their timestamp")
+        for k, path in enumerate(group):
+            if k == 0:
+                idtags[path] = tag
+                continue
+            timestamp = parse_filename(path).timestamp
+            candidate = f"{tag}_{timestamp:%Y%m%d_%H%M%S}" if timestamp else f"{tag}_{k + 1}"
+            while candidate in taken:
+                candidate += f"_{k + 1}"
+            taken.add(candidate)
+            idtags[path] = candidate
+    return {path: idtags[path] for path in paths}
+
+
+if __name__ == "__main__":
+    for filename, idtag, idtag_iteration in IDTAG_EXAMPLES:
+        meta = parse_filename(filename)
+        found = (meta.idtag(), meta.idtag(iteration=True))
+        status = "ok" if found == (idtag, idtag_iteration) else f"MISMATCH, expected {idtag}, {idtag_iteration}"
+        print(f"{filename}: {found[0]}, {found[1]} ({meta.chip}, {meta.device}, {meta.cladding}, {meta.iteration}) {status}")
@@ -3,11 +3,128 @@
 #date: 2025-05-31
 # This module provides a Lorentzian curve fitting function using scipy's curve_fit.
 # It supports various parameterizations and can return diagnostics like residuals and Jacobian.
+# The Jacobian of each parameterization is analytic (passed to curve_fit and returned), and the default initial
+# guess comes from a linearised fit of 1/y, so the optimizer starts close to the solution.
+# lorentzfit_batch fits many peak windows at once with a vectorized Levenberg-Marquardt.
 
 
+import warnings
 import numpy as np
 from scipy.optimize import curve_fit
 
+
+# Each parameterization: fit function, analytic Jacobian d(fitfunc)/d(params) with shape (len(x), npar)
+# (both broadcast: x of shape (peaks, points) with parameters of shape (peaks, 1) gives (peaks, points, npar))
+def _f1(x, p1):
+    return 1.0 / (p1 * (x**2 + 1))
+
+def _j1(x, p1):
+    return (-1.0 / (p1**2 * (x**2 + 1)))[..., None]
+
+def _f2(x, p1, p2):
+    return p1 / (x**2 + p2)
+
+def _j2(x, p1, p2):
+    d = x**2 + p2
+    return np.stack([1.0 / d, -p1 / d**2], axis=-1)
+
+def _f3(x, p1, p2, p3):
+    return p1 / ((x - p2)**2 + p3)
+
+def _j3(x, p1, p2, p3):
+    d = (x - p2)**2 + p3
+    return np.stack([1.0 / d, 2 * p1 * (x - p2) / d**2, -p1 / d**2], axis=-1)
+
+def _with_offset(f, j):
+    # Same model plus a constant offset c as the last parameter
+    fitfunc = lambda x, *p: f(x, *p[:-1]) + p[-1]
+    def jac(x, *p):
+        jp = j(x, *p[:-1])
+        return np.concatenate([jp, np.ones(jp.shape[:-1] + (1,))], axis=-1)
+    return fitfunc, jac
+
+MODELS = {
+    '1': (_f1, _j1, 1),
+    '1c': _with_offset(_f1, _j1) + (2,),
+    '2': (_f2, _j2, 2),
+    '2c': _with_offset(_f2, _j2) + (3,),
+    '3': (_f3, _j3, 3),
+    '3c': _with_offset(_f3, _j3) + (4,),
+}
+
+
+def _linearised_params(X, Y, valid, nparams, min_fraction=0.1):
+    # Batched core of linearised_guess: X, Y, valid of shape (peaks, points); returns (peaks, npar), NaN rows on failure
+    offset = nparams.endswith('c')
+    c = np.where(valid, Y, np.inf).min(axis=-1) if offset else np.zeros(len(Y))
+    H = np.where(valid, Y - c[:, None], np.nan)
+    use = valid & (H > min_fraction * np.nanmax(np.where(valid, H, -np.inf), axis=-1, keepdims=True))
+    W = np.where(use, H, 0.0)**4  # squared residual weights (y - c)**2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        Z = np.where(use, 1.0 / H, 0.0)
+
+    if nparams.startswith('3'):
+        # Centre and scale x per peak so the quadratic normal equations stay well conditioned
+        n_use = use.sum(axis=-1)
+        xm = np.where(use, X, 0.0).sum(axis=-1) / np.maximum(n_use, 1)
+        s = np.where(use, np.abs(X - xm[:, None]), 0.0).max(axis=-1)
+        s = np.where(s > 0, s, 1.0)
+        T = np.where(use, (X - xm[:, None]) / s[:, None], 0.0)
+        A = np.stack([T**2, T, np.ones_like(T)], axis=-1)
+    elif nparams.startswith('2'):
+        X0 = np.where(use, X, 0.0)
+        A = np.stack([X0**2, np.ones_like(X0)], axis=-1)
+    else:
+        X0 = np.where(use, X, 0.0)
+        A = (X0**2 + 1)[..., None]
+
+    G = np.einsum('kn,kni,knj->kij', W, A, A)
+    r = np.einsum('kn,kni,kn->ki', W, A, Z)
+    ok = use.sum(axis=-1) >= 3
+    coef = np.full(r.shape, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ok &= np.abs(np.linalg.det(G)) > 0
+        if ok.any():
+            coef[ok] = np.linalg.solve(G[ok], r[ok][..., None])[..., 0]
+
+        if nparams.startswith('3'):
+            # z = a (t - t0)**2 + q  with t = (x - xm) / s  ->  p1 = s**2 / a, p2 = xm + s t0, p3 = q s**2 / a
+            a, b, k = coef.T
+            t0 = -b / (2 * a)
+            q = k - a * t0**2
+            params = np.stack([s**2 / a, xm + s * t0, q * s**2 / a], axis=-1)
+        elif nparams.startswith('2'):
+            slope, intercept = coef.T
+            params = np.stack([1.0 / slope, intercept / slope], axis=-1)
+        else:
+            params = coef
+
+    bad = ~np.all(np.isfinite(params), axis=-1) | (params[:, 0] <= 0) | (params[:, -1] <= 0)
+    params[bad] = np.nan
+    if offset:
+        params = np.concatenate([params, c[:, None]], axis=-1)
+        params[bad] = np.nan
+    return params
+
+
+def linearised_guess(x, y, nparams='3c', min_fraction=0.1):
+    """
+    Closed-form initial guess: for all parameterizations 1/(y - c) is a polynomial in x (e.g. for '3'
+    ((x - p2)**2 + p3) / p1), so a weighted least-squares fit of 1/(y - c) gives the parameters directly.
+    Only points above min_fraction of the peak height are used, weighted by (y - c)**2 (the inverse of the
+    noise amplification of 1/y). c is min(y) for the offset models, 0 otherwise.
+
+    Returns the parameter list, or None if the data do not look like a peak (then use the default guess).
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = (np.isfinite(x) & np.isfinite(y))[None, :]
+    params = _linearised_params(x[None, :], y[None, :], valid, nparams, min_fraction)[0]
+    if np.isnan(params).any():
+        return None
+    return list(params)
+
+
 def lorentzfit(x, y, p0=None, bounds=None, nparams='3c', options=None, return_func=False):
     """
     Lorentzian curve fitting with flexible parameterization and diagnostics.
@@ -38,34 +155,19 @@ def lorentzfit(x, y, p0=None, bounds=None, nparams='3c', options=None, return_fu
     residual : ndarray
         Residuals (y - yfit).
     jacobian : ndarray
-        Jacobian matrix from curve_fit.
+        Analytic Jacobian of the fit function at the solution, shape (len(x), number of parameters).
     fitfunc : function, optional
         The fit function (if return_func is True).
     """
     x = np.asarray(x)
     y = np.asarray(y)
-    if nparams == '1':
-        fitfunc = lambda x, p1: 1.0 / (p1 * (x**2 + 1))
-        npar = 1
-    elif nparams == '1c':
-        fitfunc = lambda x, p1, c: 1.0 / (p1 * (x**2 + 1)) + c
-        npar = 2
-    elif nparams == '2':
-        fitfunc = lambda x, p1, p2: p1 / (x**2 + p2)
-        npar = 2
-    elif nparams == '2c':
-        fitfunc = lambda x, p1, p2, c: p1 / (x**2 + p2) + c
-        npar = 3
-    elif nparams == '3':
-        fitfunc = lambda x, p1, p2, p3: p1 / ((x - p2)**2 + p3)
-        npar = 3
-    elif nparams == '3c':
-        fitfunc = lambda x, p1, p2, p3, c: p1 / ((x - p2)**2 + p3) + c
-        npar = 4
-    else:
+    if nparams not in MODELS:
         raise ValueError("Unknown nparams option.")
+    fitfunc, jac, npar = MODELS[nparams]
 
-    # Set default initial guess if not provided
+    # Set initial guess if not provided: linearised fit, or a generic guess from the data range
+    if p0 is None:
+        p0 = linearised_guess(x, y, nparams)
     if p0 is None:
         p3 = ((np.max(x) - np.min(x)) / 10.0) ** 2
         p2 = (np.max(x) + np.min(x)) / 2.0
@@ -86,27 +188,168 @@ def lorentzfit(x, y, p0=None, bounds=None, nparams='3c', options=None, return_fu
     if bounds is None:
         bounds = (-np.inf * np.ones(npar), np.inf * np.ones(npar))
 
-    # Fit
-    popt, pcov = curve_fit(fitfunc, x, y, p0=p0, bounds=bounds, **(options or {}))
+    # Fit (analytic Jacobian unless options give another jac)
+    popt, pcov = curve_fit(fitfunc, x, y, p0=p0, bounds=bounds, **{'jac': jac, **(options or {})})
     yfit = fitfunc(x, *popt)
     residual = y - yfit
     resnorm = np.sum(residual**2)
-
-    # Numerical Jacobian (scipy returns pcov, not jacobian directly)
-    # We'll estimate the Jacobian at the solution numerically
-    eps = np.sqrt(np.finfo(float).eps)
-    jacobian = np.empty((len(x), npar))
-    for i in range(npar):
-        dp = np.zeros_like(popt)
-        dp[i] = eps * (abs(popt[i]) + 1)
-        yfit1 = fitfunc(x, *(popt + dp))
-        yfit2 = fitfunc(x, *(popt - dp))
-        jacobian[:, i] = (yfit1 - yfit2) / (2 * dp[i])
+    jacobian = jac(x, *popt)
 
     if return_func:
         return yfit, popt, resnorm, residual, jacobian, fitfunc
     return yfit, popt, resnorm, residual, jacobian
 
+
+def _peak_shape(params, nparams):
+    # Centre x0 and FWHM of each fitted Lorentzian (models '1' and '2' are centred on x = 0)
+    params = np.asarray(params, dtype=float)
+    if nparams.startswith('3'):
+        return params[..., 1], 2 * np.sqrt(params[..., 2])
+    if nparams.startswith('2'):
+        return np.zeros(params.shape[:-1]), 2 * np.sqrt(params[..., 1])
+    return np.zeros(params.shape[:-1]), np.full(params.shape[:-1], 2.0)
+
+
+def lorentzfit_batch(X, Y, p0=None, nparams='3c', max_iter=200, xtol=1e-8, ftol=1e-10):
+    """
+    Fit many Lorentzian peak windows at once with a vectorized Levenberg-Marquardt (one batched np.linalg.solve per
+    iteration for all peaks still running).
+
+    Parameters
+    ----------
+    X, Y : array_like
+        Peak windows, shape (peaks, points). Windows of different length are padded with NaN.
+    p0 : array_like or None
+        Initial parameters, shape (peaks, npar). If None, linearised_guess of each window (falling back to the
+        lorentzfit default guess).
+    nparams : str
+        Lorentzian type: '1', '1c', '2', '2c', '3', '3c' (see lorentzfit).
+    max_iter : int
+        Maximum Levenberg-Marquardt iterations.
+    xtol, ftol : float
+        A peak has converged when an accepted step changes every parameter by less than xtol (relative) or the sum
+        of squared residuals by less than ftol (relative).
+
+    Returns
+    -------
+    results : dict
+            - params (peaks, npar), yfit (peaks, points), resnorm (peaks,)
+            - x0, fwhm, Q (x0 / fwhm), R2 (1 - var(residual) / var(y)): arrays of shape (peaks,)
+            - converged: bool array, False where the fit stopped at max_iter or produced non-finite values, and for
+              degenerate windows (fewer than npar valid points, or a flat Y), which are not fitted
+    """
+    if nparams not in MODELS:
+        raise ValueError("Unknown nparams option.")
+    fitfunc, jac, npar = MODELS[nparams]
+    X = np.atleast_2d(np.asarray(X, dtype=float))
+    Y = np.atleast_2d(np.asarray(Y, dtype=float))
+    X, Y = np.broadcast_arrays(X, Y)
+    valid = np.isfinite(X) & np.isfinite(Y)
+    K = len(Y)
+    # Variance of each window (NaN for an empty one, without the all-NaN slice warnings of nanvar)
+    n_valid = valid.sum(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_y = np.where(valid, Y, 0.0).sum(axis=-1) / n_valid
+        var_y = np.where(valid, (Y - mean_y[:, None])**2, 0.0).sum(axis=-1) / n_valid
+    degenerate = (n_valid < npar) | ~(var_y > 0)
+
+    if p0 is None:
+        P = _linearised_params(X, Y, valid, nparams)
+        # Default guess (as in lorentzfit) where the linearised fit failed (inf/NaN for windows with no valid point)
+        with np.errstate(all="ignore"):
+            x_lo = np.where(valid, X, np.inf).min(axis=-1)
+            x_hi = np.where(valid, X, -np.inf).max(axis=-1)
+            p3 = ((x_hi - x_lo) / 10.0) ** 2
+            default = {'1': [np.where(valid, Y, -np.inf).max(axis=-1) * p3],
+                       '2': [np.where(valid, Y, -np.inf).max(axis=-1) * p3, p3],
+                       '3': [np.where(valid, Y, -np.inf).max(axis=-1) * p3, (x_hi + x_lo) / 2.0, p3]}[nparams[0]]
+            if nparams.endswith('c'):
+                default = default + [np.where(valid, Y, np.inf).min(axis=-1)]
+        failed = np.isnan(P).any(axis=-1)
+        P[failed] = np.stack(default, axis=-1)[failed]
+    else:
+        P = np.array(np.broadcast_to(np.asarray(p0, dtype=float), (K, npar)))
+
+    # Models '3'/'3c' are fitted on x relative to the window centre (only p2 moves), which keeps J well conditioned
+    centre = np.zeros(K)
+    if nparams.startswith('3'):
+        centre = np.where(valid, X, 0.0).sum(axis=-1) / np.maximum(valid.sum(axis=-1), 1)
+        P[:, 1] -= centre
+    Xf = np.where(valid, X - centre[:, None], 0.0)
+    Yf = np.where(valid, Y, 0.0)
+
+    def residuals(rows, params):
+        with np.errstate(all="ignore"):
+            F = fitfunc(Xf[rows], *params.T[..., None])
+        return np.where(valid[rows], Yf[rows] - F, 0.0)
+
+    def cost(r):
+        c = np.sum(r**2, axis=-1)
+        return np.where(np.isfinite(c), c, np.inf)
+
+    lam = np.full(K, 1e-3)
+    nu = np.full(K, 2.0)
+    current_cost = cost(residuals(np.arange(K), P))
+    converged = np.zeros(K, dtype=bool)
+    active = np.flatnonzero(np.isfinite(current_cost) & ~degenerate)
+
+    for _ in range(max_iter):
+        if active.size == 0:
+            break
+        Pa = P[active]
+        r = residuals(active, Pa)
+        with np.errstate(all="ignore"):
+            J = jac(Xf[active], *Pa.T[..., None]) * valid[active][..., None]
+        # Marquardt damping on column-scaled parameters: (Js^T Js + lam I) ds = Js^T r with Js = J / D, step = ds / D
+        D = np.sqrt(np.einsum('kni,kni->ki', J, J))
+        D = np.where(D > 0, D, 1.0)
+        Js = J / D[:, None, :]
+        A = np.einsum('kni,knj->kij', Js, Js) + lam[active, None, None] * np.eye(npar)
+        g = np.einsum('kni,kn->ki', Js, r)
+        ok = np.all(np.isfinite(A), axis=(-2, -1)) & np.all(np.isfinite(g), axis=-1)
+        ds = np.zeros_like(Pa)
+        with np.errstate(all="ignore"):
+            try:
+                ds[ok] = np.linalg.solve(A[ok], g[ok][..., None])[..., 0]
+            except np.linalg.LinAlgError:
+                ds[ok] = (np.linalg.pinv(A[ok]) @ g[ok][..., None])[..., 0]
+        step = ds / D
+        P_new = Pa + step
+        new_cost = cost(residuals(active, P_new))
+
+        # Gain ratio of actual to predicted reduction sets the damping (Nielsen's update)
+        old_cost = current_cost[active]
+        predicted = np.einsum('ki,ki->k', ds, lam[active, None] * ds + g)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rho = (old_cost - new_cost) / predicted
+        accept = ok & (new_cost <= old_cost)
+        P[active[accept]] = P_new[accept]
+        current_cost[active[accept]] = new_cost[accept]
+        gain = np.where(accept & (rho > 0), np.maximum(1 / 3, 1 - (2 * np.clip(rho, 0, 1) - 1)**3), 1.0)
+        lam[active] = np.where(accept, lam[active] * gain, lam[active] * nu[active])
+        nu[active] = np.where(accept, 2.0, nu[active] * 2)
+
+        small_step = np.all(np.abs(step) <= xtol * (np.abs(Pa) + xtol), axis=-1)
+        small_change = np.abs(old_cost - new_cost) <= ftol * np.maximum(old_cost, 1e-300)
+        done = (accept & (small_step | small_change)) | (old_cost == 0) | ~ok | (lam[active] > 1e16)
+        converged[active[done]] = (accept | (old_cost == 0))[done] & ok[done]
+        active = active[~done]
+
+    with np.errstate(all="ignore"):
+        yfit = np.where(valid, fitfunc(Xf, *P.T[..., None]), np.nan)
+    residual = np.where(valid, Y - yfit, np.nan)
+    if nparams.startswith('3'):
+        P[:, 1] += centre
+    converged &= np.all(np.isfinite(P), axis=-1) & ~degenerate
+    with np.errstate(all="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # nanvar of windows with no valid point
+        x0, fwhm = _peak_shape(P, nparams)  # NaN FWHM for a negative width parameter
+        Q = np.where(fwhm != 0, x0 / fwhm, np.nan)
+        R2 = np.where(var_y > 0, 1 - np.nanvar(residual, axis=-1) / var_y, np.nan)
+    return {"params": P, "yfit": yfit, "resnorm": np.nansum(residual**2, axis=-1), "x0": x0, "fwhm": fwhm, "Q": Q,
+            "R2": R2, "converged": converged}
+
 # Example usage for external scripts:
 # from lorentzfit import lorentzfit
-# yfit, params, resnorm, residual, jacobian = lorentzfit(x, y, nparams='3c')
\ No newline at end of file
+# yfit, params, resnorm, residual, jacobian = lorentzfit(x, y, nparams='3c')
+# fits = lorentzfit_batch(peak_windows_x, peak_windows_y)   # fits["Q"], fits["fwhm"], fits["converged"], ...
\ No newline at end of file
@@ -4,6 +4,25 @@ from multi_LIV import multi_LIV
 from multi_osa import multi_OSA
 from multi_wlm  import multi_WLM
 import multi_select
+from measurement_catalog import MeasurementCatalog, LIV, OSA, WLM
+from processing_ledger import ProcessingLedger
+from device_registry import DeviceRegistry
+
+# Number of worker processes used to process files (None = one per CPU core, 1 = one file at a time)
+WORKERS = None
+# False = metrics only: .mat files, thresholds and comparison plots, but no plots for each individual device
+RENDER_DEVICE_PLOTS = True
+# Number of processes that draw and save the per-device plots while the analysis runs (None = one per CPU core)
+RENDER_WORKERS = None
+# True = also keep all processed devices of each type in one <type>_campaign.zip in the parent folder; the comparison
+# plots then read from it instead of reopening every .mat (much faster with thousands of devices)
+CAMPAIGN_STORE = False
+# True = also append every OSA spectrum to the memory-mapped archive OSA_spectra in the parent folder, to compare
+# spectra across devices (e.g. all devices at 50 mA) without loading every .mat
+SPECTRAL_ARCHIVE = False
+# True = read each OSA csv one sweep at a time from the memory-mapped file instead of parsing it whole (for very large
+# OSA files; same results, but the parse cache is not used)
+STREAM_OSA_SWEEPS = False
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -17,14 +36,25 @@ if __name__ == "__main__":
     overwrite_existing = tk.messagebox.askyesno("Overwrite Existing Files", "Do you want to overwrite existing files?")
 
     print(f"Selected files: {file_selection}")
-    if any('liv' in filename.lower() for filename in file_selection):
+
+    # Classify the selected csvs by content once; all drivers share the same catalog
+    catalog = MeasurementCatalog(parent_dir)
+    types_found = catalog.types_present(file_selection) if file_selection else set()
+    # Record of how each csv was processed: with "no" to overwrite, only new or changed files (or files processed by an
+    # older analysis version) are processed again
+    ledger = ProcessingLedger(parent_dir)
+    # Metadata and scalar results of every processed measurement (device_registry.sqlite), shared by all drivers
+    registry = DeviceRegistry(parent_dir)
+    print(f"Measurement types found: {sorted(types_found)}")
+
+    if LIV in types_found:
         print("Processing LIV files...")
-        multi_liv = multi_LIV(parent_dir, selected_files=file_selection, overwrite_existing=overwrite_existing)
-    if any('osa' in filename.lower() for filename in file_selection):
+        multi_liv = multi_LIV(parent_dir, selected_files=file_selection, overwrite_existing=overwrite_existing, catalog=catalog, ledger=ledger, registry=registry, workers=WORKERS, render_plots=RENDER_DEVICE_PLOTS, render_workers=RENDER_WORKERS, campaign_store=CAMPAIGN_STORE)
+    if OSA in types_found:
         print("Processing OSA files...")
-        multi_osa = multi_OSA(parent_dir, selected_files=file_selection, overwrite_existing=overwrite_existing)
-    if any('wlm' in filename.lower() for filename in file_selection):
+        multi_osa = multi_OSA(parent_dir, selected_files=file_selection, overwrite_existing=overwrite_existing, catalog=catalog, ledger=ledger, registry=registry, workers=WORKERS, render_plots=RENDER_DEVICE_PLOTS, render_workers=RENDER_WORKERS, campaign_store=CAMPAIGN_STORE, spectral_archive=SPECTRAL_ARCHIVE, stream_sweeps=STREAM_OSA_SWEEPS)
+    if WLM in types_found:
         print("Processing WLM files...")
-        multi_wlm = multi_WLM(parent_dir, selected_files=file_selection, overwrite_existing=overwrite_existing)
+        multi_wlm = multi_WLM(parent_dir, selected_files=file_selection, overwrite_existing=overwrite_existing, catalog=catalog, ledger=ledger, registry=registry, workers=WORKERS, render_plots=RENDER_DEVICE_PLOTS, render_workers=RENDER_WORKERS, campaign_store=CAMPAIGN_STORE)
 
     root.destroy()
\ No newline at end of file
@@ -0,0 +1,234 @@
+import os
+import re
+import json
+from pathlib import Path
+from scylla_parser import SCYLLA_HEADER_ROWS
+
+"""
+    Content-based measurement-type detection for raw Scylla/benchtop csvs, and a catalog that walks a parent folder
+    once and caches the verdict for every csv.
+
+    sniff_measurement_type reads only the first few KB of a file and classifies it from its row labels:
+            - OSA:      a 'Current (A)' row holding a single value (one row per sweep), or an 'Optical power (dBm)' row
+            - WLM:      Current/Voltage rows plus a 'Wavelength' row
+            - LIV:      Current/Voltage rows and no 'Wavelength' row
+            - benchtop: 'channel_N' rows (benchtop.py format)
+    When the head of the file is not enough to tell LIV from WLM, the old filename cue ('wlm'/'liv') breaks the tie.
+
+    MeasurementCatalog keeps the verdicts in '<parent>/measurement_catalog.json', keyed by path and invalidated by
+    (mtime, size), so repeated runs and the three multi_* drivers share one directory walk and one sniff per file.
+
+    [Author: Rhiannon H Evans]
+"""
+
+LIV = "LIV"
+WLM = "WLM"
+OSA = "OSA"
+BENCHTOP = "benchtop"
+MEASUREMENT_TYPES = (LIV, WLM, OSA, BENCHTOP)
+
+SNIFF_BYTES = 16384
+CATALOG_FILENAME = "measurement_catalog.json"
+
+_BENCHTOP_LABEL = re.compile(r"channel_\d")
+
+
+def type_from_filename(name):
+    """Old filename-substring rule, used only as a tie-breaker."""
+    name = Path(name).name.lower()
+    if 'wlm' in name:
+        return WLM
+    if 'osa' in name:
+        return OSA
+    if 'liv' in name:
+        return LIV
+    return None
+
+
+def _head_labels(text):
+    """
+    Return [(line_number, label, n_values)] for the lines of a block of text that have a label and values, numbered
+    from 0 as physical lines of the file (blank lines count), so the Scylla header can be skipped by line number as
+    the parsers do. The last (possibly cut) line is kept.
+    """
+    rows = []
+    for line_number, line in enumerate(text.splitlines()):
+        label, sep, values = line.partition(",")
+        if not sep:
+            continue
+        rows.append((line_number, label.strip().strip('"').lower(), values.count(",") + 1))
+    return rows
+
+
+def _data_rows(rows):
+    # Scylla files: only the lines below the header block (header labels such as 'Current limit' are not data rows)
+    return [(label, n) for line_number, label, n in rows if line_number >= SCYLLA_HEADER_ROWS]
+
+
+def _classify(rows, complete):
+    if any(_BENCHTOP_LABEL.search(label) for _, label, n in rows):
+        return BENCHTOP
+
+    rows = _data_rows(rows)
+    labels = [label for label, n in rows]
+    if any(label == "optical power (dbm)" for label in labels):
+        return OSA
+    if any(label == "current (a)" and n == 1 for label, n in rows):
+        return OSA
+
+    has_current = any("current" in label for label in labels)
+    has_voltage = any("voltage" in label for label in labels)
+    if not (has_current and has_voltage):
+        return None
+    if any("wavelength" in label for label in labels):
+        return WLM
+    # LIV only if we saw the whole file, otherwise a wavelength row may follow
+    return LIV if complete else None
+
+
+def sniff_measurement_type(path, nbytes=SNIFF_BYTES):
+    """
+    Classify a raw csv as LIV, WLM, OSA or benchtop from its content.
+
+    Parameters
+    ----------
+    path : str or Path
+        Raw measurement csv.
+    nbytes : int
+        Number of bytes read from the start of the file.
+
+    Returns
+    -------
+    kind : str or None
+        One of MEASUREMENT_TYPES, or None if the file is not a recognised measurement.
+    """
+    path = Path(path)
+    with open(path, "rb") as f:
+        head = f.read(nbytes)
+        complete = len(f.read(1)) == 0
+    rows = _head_labels(head.decode("utf-8", errors="replace"))
+    kind = _classify(rows, complete)
+    if kind is not None:
+        return kind
+
+    # Current/Voltage seen but no wavelength row in the head: use the filename cue, otherwise read all labels
+    labels = [label for label, n in _data_rows(rows)]
+    if any("current" in label for label in labels) and any("voltage" in label for label in labels):
+        hint = type_from_filename(path.name)
+        if hint in (LIV, WLM):
+            return hint
+        with open(path, "r", errors="replace") as f:
+            labels = [line.partition(",")[0].strip().strip('"').lower() for line in f]
+        return WLM if any("wavelength" in label for label in labels[SCYLLA_HEADER_ROWS:]) else LIV
+    return None
+
+
+def _wanted_stems(selected_files):
+    """Lower-cased names/stems of a selection (folder names from multi_select or csv file names), or None."""
+    if not selected_files:
+        return None
+    wanted = set()
+    for name in selected_files:
+        name = os.path.basename(str(name)).lower()
+        wanted.add(name)
+        wanted.add(Path(name).stem)
+    return wanted
+
+
+class MeasurementCatalog:
+    """
+    One directory walk per parent folder, one sniff per (path, mtime, size). Shared by main.py and the multi_* drivers.
+    """
+
+    def __init__(self, parent_path, cache_file=None):
+        self.parent_path = Path(parent_path)
+        self.cache_file = Path(cache_file) if cache_file else self.parent_path / CATALOG_FILENAME
+        self._cache = self._load_cache()
+        self._entries = None
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_file, "r") as f:
+                return json.load(f).get("entries", {})
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self):
+        try:
+            with open(self.cache_file, "w") as f:
+                json.dump({"entries": self._cache}, f, indent=1)
+        except OSError as e:
+            print(f"Warning: could not write measurement catalog {self.cache_file}: {e}")
+
+    def scan(self, refresh=False):
+        """Walk the parent folder once and classify every csv. Returns {Path: type or None}."""
+        if self._entries is not None and not refresh:
+            return self._entries
+
+        entries = {}
+        changed = False
+        seen = set()
+        for root, dirs, files in os.walk(self.parent_path):
+            for name in files:
+                if not name.lower().endswith(".csv"):
+                    continue
+                fp = Path(root) / name
+                key = str(fp)
+                seen.add(key)
+                st = fp.stat()
+                cached = self._cache.get(key)
+                if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+                    kind = cached[2]
+                else:
+                    try:
+                        kind = sniff_measurement_type(fp)
+                    except OSError as e:
+                        print(f"Could not read {fp}: {e}")
+                        kind = None
+                    self._cache[key] = [st.st_mtime_ns, st.st_size, kind]
+                    changed = True
+                entries[fp] = kind
+
+        stale = set(self._cache) - seen
+        for key in stale:
+            del self._cache[key]
+        if changed or stale:
+            self._save_cache()
+
+        self._entries = entries
+        print(f"Catalog: {len(entries)} csv files under {self.parent_path}")
+        return entries
+
+    def type_of(self, path):
+        """Measurement type of a single csv (sniffed now if it is not under the parent folder)."""
+        path = Path(path)
+        entries = self.scan()
+        if path in entries:
+            return entries[path]
+        return sniff_measurement_type(path)
+
+    def files(self, kind, selected_files=None):
+        """
+        Return csv paths of the given type, sorted. If selected_files is given (names or stems, e.g. from
+        multi_select), only csvs whose stem matches one of them are kept.
+        """
+        wanted = _wanted_stems(selected_files)
+        return sorted(
+            fp for fp, fkind in self.scan().items()
+            if fkind == kind and (wanted is None or fp.stem.lower() in wanted)
+        )
+
+    def types_present(self, selected_files=None):
+        """Set of measurement types among the (selected) csvs."""
+        wanted = _wanted_stems(selected_files)
+        return {
+            fkind for fp, fkind in self.scan().items()
+            if fkind is not None and (wanted is None or fp.stem.lower() in wanted)
+        }
+
+
+if __name__ == "__main__":
+    import sys
+    catalog = MeasurementCatalog(sys.argv[1])
+    for fp, kind in sorted(catalog.scan().items()):
+        print(f"{kind}\t{fp}")
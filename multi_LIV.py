@@ -4,11 +4,19 @@ import matplotlib.cm as cm
 import numpy as np
 import pandas as pd
 from pathlib import Path
-import re
 import ast
 import scipy
 
-from LIVclass import LIVclass
+from LIVclass import LIVclass, ANALYSIS_VERSION, ANALYSIS_PARAMS, load_rows, liv_sweep, batch_analysis
+from functools import partial
+from render import SpecCollector, process_and_render
+from parallel import resolve_workers
+from measurement_catalog import MeasurementCatalog, LIV
+from processing_ledger import ProcessingLedger
+from campaign_store import CampaignStore, store_path
+from device_registry import DeviceRegistry
+from filename_meta import parse_filename, unique_idtags
+from summary_index import SummaryIndex, summary_path, summary_row, POWER_CURRENTS
 
 """ Class for processing multiple LIV (Power, current, voltage) files. Processes selected 'liv' files, creates the following comparison plots:
          - LI, VI, and TI curves for all devices (channel 1 - although this is changeable)
@@ -16,8 +24,48 @@ from LIVclass import LIVclass
          - Power at specified currents (default: 25mA and 50mA)
 """
 
+# Most files one worker analyses together (thresholds and IV analysis of the whole chunk in one vectorized pass)
+BATCH_SIZE = 64
+
+def _process_liv_chunk(csv_fps, render_plots=True, return_data=False):
+    """
+    Process a chunk of raw LIV csvs (runs in a worker process): parse them all, run the threshold and IV analysis of
+    every device in one batch_analysis, then save each file's .mat. Returns a list with, for each csv, (csv_fp, error
+    message or None, figure specs to render, (summary row, the saved data dict if return_data else None)).
+    """
+    parsed = {}
+    for csv_fp in csv_fps:
+        try:
+            parsed[csv_fp] = load_rows(csv_fp)
+        except Exception as e:
+            parsed[csv_fp] = e
+    # Files that cannot be analysed (or failed to parse) are left to LIVclass, which reports their error
+    sweeps = {csv_fp: liv_sweep(rows) for csv_fp, rows in parsed.items() if not isinstance(rows, Exception)}
+    sweeps = {csv_fp: sweep for csv_fp, sweep in sweeps.items() if sweep is not None}
+    try:
+        analyses = dict(zip(sweeps, batch_analysis(list(sweeps.values())))) if sweeps else {}
+    except Exception as e:
+        print(f"Batch analysis failed ({e}), analysing the files one at a time")
+        analyses = {}
+
+    outcomes = []
+    for csv_fp in csv_fps:
+        if isinstance(parsed[csv_fp], Exception):
+            outcomes.append((csv_fp, str(parsed[csv_fp]), [], None))
+            continue
+        figures = SpecCollector()
+        try:
+            liv = LIVclass(csv_fp, output_folder=csv_fp.parent, render_plots=render_plots, renderer=figures,
+                           rows=parsed[csv_fp], analysis=analyses.get(csv_fp))
+        except Exception as e:
+            outcomes.append((csv_fp, str(e), figures.specs, None))
+            continue
+        outcomes.append((csv_fp, None, figures.specs, (liv.summary, liv.data_dict if return_data else None)))
+    return outcomes
+
 class multi_LIV:
-    def __init__(self, parent_path, selected_files=None, overwrite_existing=False):
+    def __init__(self, parent_path, selected_files=None, overwrite_existing=False, catalog=None, workers=1, render_plots=True,
+                 render_workers=None, campaign_store=False, ledger=None, registry=None):
         p = Path(parent_path)
         self.parent_path = parent_path
         self.cmap = plt.get_cmap('inferno')
@@ -25,45 +73,13 @@ class multi_LIV:
         # Log selected files for debugging
         print("Debug: Selected files:", selected_files)
 
-        selected_files = self.filter_liv(selected_files) if selected_files else None
-
-        if not selected_files:
-            # auto‑scan for every CSV under parent_path (including subfolders)
-            all_files = [
-                fp
-                for fp in p.rglob('*.csv')
-                if fp.is_file()
-            ]
-            # Log all files found by rglob
-            print("Debug: All files found by rglob:", [str(fp) for fp in all_files])
-
-            self.selected_files = [
-                fp
-                for fp in all_files
-                if 'loss' not in fp.name.lower()
-                and 'liv'  in fp.name.lower()
-                and 'wlm' not in fp.name.lower()
-            ]
-        else:
-            # assume selected_files is a list of basenames WITHOUT path, e.g.
-            # ["2025_04_04_17_10_53_OSA_1330nm_ChipC32_R1", ...]
-            # Normalize filenames for comparison
-            wanted = {Path(name).stem.lower() for name in selected_files}
-
-            # still recurse via rglob, but only keep those whose stem matches
-            all_files = [
-                fp
-                for fp in p.rglob('*.csv')
-                if fp.is_file()
-            ]
-            # Log all files found by rglob
-            print("Debug: All files found by rglob:", [str(fp) for fp in all_files])
-
-            self.selected_files = [
-                fp
-                for fp in all_files
-                if fp.stem.lower() in wanted
-            ]
+        # File type comes from the content of each csv (shared catalog, one directory walk)
+        self.catalog = catalog if catalog is not None else MeasurementCatalog(parent_path)
+        # How each csv was last processed (content hash, analysis version, parameters), shared like the catalog
+        self.ledger = ledger if ledger is not None else ProcessingLedger(parent_path)
+        # Metadata and scalar results of every processed measurement, for selecting devices without a directory walk
+        self.registry = registry if registry is not None else DeviceRegistry(parent_path)
+        self.selected_files = self.filter_liv(selected_files)
 
         # Log the final list of selected files
         print("Debug: Final selected files:", [str(fp) for fp in self.selected_files])
@@ -77,30 +93,60 @@ class multi_LIV:
             os.makedirs(self.save_dir)
 
         self.overwrite_existing = overwrite_existing
+        # IDtag of every csv from its filename (with the iteration); files of the same device are told apart
+        self.file_idtags = unique_idtags(self.selected_files, iteration=True)
+
+        # 2) Process each base CSV into a .mat (in parallel if workers != 1), then load them back in order
+        # Without overwrite_existing, a csv is only processed again if the ledger shows that its content, the analysis
+        # version or parameters changed since its .mat was made (or the .mat is missing)
+        to_process = []
+        for csv_fp in self.selected_files:
+            loss_path = csv_fp.with_name(csv_fp.stem + '.mat')
+            reason = "overwrite requested" if self.overwrite_existing else self.ledger.stale_reason(
+                csv_fp, LIV, ANALYSIS_VERSION, ANALYSIS_PARAMS, [loss_path], render_plots)
+            if reason:
+                print(f"Processing {csv_fp.name}: {reason}")
+                to_process.append(csv_fp)
+            else:
+                print(f"Loss data up to date: {loss_path}. Skipping processing.")
+        # Per-device figures are rendered by a separate pool of render_workers processes while the analysis runs
+        # render_plots=False: metrics and .mat only, no per-device figures (comparison plots are still made)
+        # campaign_store=True: the data dicts come back from the workers and go into one LIV_campaign.zip, which is
+        # read lazily below instead of reopening every .mat
+        # The files are split into one chunk per worker (at most BATCH_SIZE files each); each chunk is analysed in one
+        # vectorized batch (_process_liv_chunk)
+        results = {}
+        chunk_size = min(BATCH_SIZE, max(1, -(-len(to_process) // resolve_workers(workers))))
+        errors = process_and_render(partial(_process_liv_chunk, render_plots=render_plots, return_data=campaign_store),
+                                    to_process, workers, render_workers, on_result=results.__setitem__,
+                                    chunk_size=chunk_size)
+        for csv_fp in to_process:
+            if not errors.get(csv_fp):
+                self.ledger.record(csv_fp, LIV, ANALYSIS_VERSION, ANALYSIS_PARAMS, [csv_fp.with_name(csv_fp.stem + '.mat')],
+                                   render_plots)
+        self.ledger.save()
+        self.store = CampaignStore(store_path(parent_path, "LIV")) if campaign_store else None
+        if self.store is not None:
+            self.update_store(results, errors)
+        # Scalar results (thresholds, peak power, power at 25/50 mA) of every device, one row each, in LIV_summary.npz;
+        # the threshold and power comparison plots read only this
+        self.summary = SummaryIndex(summary_path(parent_path, "LIV"))
+        self.update_summary(results, errors)
+        self.update_registry(errors)
 
-        # 2) Process each base CSV into a loss_data CSV, then load it
         self.loss_data = {}
         for csv_fp in self.selected_files:
             print(f"→ Processing base file: {csv_fp.name}")
-
-            # sanitize_data should write out a file like "foo_loss_data.csv"
-            # and return its path (as a str or Path)
-
             loss_path = csv_fp.with_name(csv_fp.stem + '.mat')
-            if self.overwrite_existing or not loss_path.exists():
-                try:
-                    liv_instance = LIVclass(csv_fp, output_folder=csv_fp.parent)
-                except Exception as e:
-                    print(f"Error processing {csv_fp}: {e}")
-                    continue
-            else:
-                print(f"Loss data already exists: {loss_path}. Skipping processing.")
+            if errors.get(csv_fp):
+                print(f"Error processing {csv_fp}: {errors[csv_fp]}")
+                continue
 
             # read it back in
-            df = self.read_mat(loss_path)
+            idtag = self.file_idtags[csv_fp]
+            df = self.read_mat(loss_path) if self.store is None else self.to_frame(self.store.device(idtag))
             print(df)
             print(f"Processing file: {csv_fp.name}")
-            idtag = self.get_IDtag(csv_fp.name)
             print(f"Extracted ID tag: {idtag}")
             if idtag in self.loss_data:
                 print(f"Warning: Duplicate ID tag detected for {idtag}. Overwriting previous data.")
@@ -118,9 +164,54 @@ class multi_LIV:
         self.plot_chip_thresholds()
         #plt.show()
 
+    def update_store(self, results, errors):
+        """
+        Put the devices processed in this run into the campaign store, and import the existing .mat of any skipped
+        file that is not in the store yet (or has changed since it was stored).
+        """
+        for csv_fp in self.selected_files:
+            loss_path = csv_fp.with_name(csv_fp.stem + '.mat')
+            if errors.get(csv_fp) or not (csv_fp in results or loss_path.exists()):
+                continue
+            idtag = self.file_idtags[csv_fp]
+            if csv_fp in results:
+                self.store.append(idtag, results[csv_fp][1], source=loss_path)
+            elif not self.store.is_current(idtag, loss_path):
+                self.store.append(idtag, scipy.io.loadmat(loss_path), source=loss_path)
+        self.store.flush()
+
+    def update_summary(self, results, errors):
+        """Add the summary rows of this run's devices, and of skipped files that are new to the index or changed since."""
+        for csv_fp in self.selected_files:
+            loss_path = csv_fp.with_name(csv_fp.stem + '.mat')
+            if errors.get(csv_fp) or not (csv_fp in results or loss_path.exists()):
+                continue
+            idtag = self.file_idtags[csv_fp]
+            if csv_fp in results:
+                self.summary.append(idtag, results[csv_fp][0], source=loss_path)
+            elif not self.summary.is_current(idtag, loss_path):
+                if self.store is not None and self.store.is_current(idtag, loss_path):
+                    mat = self.store.device(idtag)
+                else:
+                    mat = scipy.io.loadmat(loss_path)
+                self.summary.append(idtag, summary_row(mat, power_currents=POWER_CURRENTS), source=loss_path)
+        self.summary.save()
+
+    def update_registry(self, errors):
+        """Record every device of this run, with its summary row as metrics, in the device registry."""
+        for csv_fp in self.selected_files:
+            loss_path = csv_fp.with_name(csv_fp.stem + '.mat')
+            if errors.get(csv_fp) or not loss_path.exists():
+                continue
+            idtag = self.file_idtags[csv_fp]
+            self.registry.record(LIV, csv_fp, idtag, loss_path, metrics=self.summary.rows.get(idtag))
+        self.registry.save()
+
     def read_mat(self, mat_file: Path) -> pd.DataFrame:
-        mat = scipy.io.loadmat(mat_file)
+        return self.to_frame(scipy.io.loadmat(mat_file))
 
+    def to_frame(self, mat) -> pd.DataFrame:
+        """DataFrame of one device from {variable: array}: a loaded .mat or a campaign store record."""
         # Manually extract each known variable
         ch0_threshold = mat['ch0_threshold'].item()
         ch1_threshold = mat['ch1_threshold'].item()
@@ -170,16 +261,12 @@ class multi_LIV:
         return df
 
 
-    def filter_liv(self, selected_files = []):
+    def filter_liv(self, selected_files = None):
         # Log the initial list of selected files
         print("Debug: Initial selected files:", selected_files)
 
-        filtered = []
-        for f in selected_files:
-            # get just the filename portion
-            name = os.path.basename(f)
-            if 'liv' in name.lower():
-                filtered.append(f)
+        # Keep the csvs whose content is LIV (all LIV csvs under parent_path if nothing was selected)
+        filtered = self.catalog.files(LIV, selected_files)
 
         # Log the filtered list of files
         print("Debug: Filtered files:", filtered)
@@ -194,24 +281,9 @@ class multi_LIV:
             print(df.head())
 
     def get_IDtag(self, filename: str) -> str:
-        base = Path(filename).stem
-        # Expanded regex to handle more variations, including '_clad' and other suffixes
-        matchR = re.search(r"Chip\w+_R\d+(_clad)?(__iter\d+)?", base)
-        matchL = re.search(r"Chip\w+_L\d+(_clad)?(__iter\d+)?", base)
-        matchD = re.search(r"Chip\w+_D\d+(_clad)?(__iter\d+)?", base)
-        if matchR:
-            id_tag = matchR.group(0)  # Retain '_clad' if present
-        elif matchL:
-            id_tag = matchL.group(0)  # Retain '_clad' if present
-        elif matchD:
-            id_tag = matchD.group(0)  # Retain '_clad' if present
-        else:
-            id_tag = "Unknown_ID"
-
-        # Detailed logging for debugging
-        print(f"Debug: Filename: {filename}, Base: {base}, Extracted ID Tag: {id_tag}")
-        return id_tag
-        
+        """IDtag of a file: chip, device, cladding and iteration from its name (see filename_meta.py)."""
+        return parse_filename(filename).idtag(iteration=True)
+
     def compPlots(self):
         """Generates comparison plots for LI, VI, and TI curves."""
         LIfig, LIax = plt.subplots(figsize=(8, 6))
@@ -275,9 +347,7 @@ class multi_LIV:
     def plot_thresholds(self):
         """Generates a boxplot of (ch1) threshold currents for each IDtag."""
         idtags = list(self.loss_data.keys())
-        threshold_list = [self.loss_data[id]['ch1_threshold'].values[0] for id in idtags]
-        # Replace None values in threshold_list with np.nan
-        threshold_list = [np.nan if v is None else v for v in threshold_list]
+        threshold_list = self.summary.frame(idtags)['ch1_threshold'].tolist()  # NaN where there is no threshold
         print(threshold_list)
 
 
@@ -314,17 +384,16 @@ class multi_LIV:
     def plot_power_at_current(self, allowance= 0.01):
 
         # Generates two separate bar plots for power at 25mA and 50mA for each chip ID. Allowance is the tolerance for current matching (i.e. 24.5 ~ 25.5 for 25mA).
+        # The power at 25/50 mA comes from the summary index (value at the point nearest to each current)
         idtags = list(self.loss_data.keys())
-        power_25mA = []
-        for idtag in idtags:
-            df = self.loss_data[idtag]
-            cur_mA = df['current'].astype(float)  # Convert current to mA
-            power = df['channel_2'].astype(float) #Ensure to use the correct channel
-            mask = np.isclose(cur_mA, 25, atol=allowance)
-            if mask.any():
-                power_25mA.append(power[mask].iloc[0])
-            else:
-                power_25mA.append(np.nan)
+        summary = self.summary.frame(idtags)
+
+        def power_at(column, target):
+            # NaN for devices without a point within allowance of target
+            near = summary[f'current_near_{target}mA'].to_numpy()
+            return summary[f'{column}_at_{target}mA'].where(np.isclose(near, target, atol=allowance)).tolist()
+
+        power_25mA = power_at('channel_2', 25)  # Ensure to use the correct channel
 
         fig_25, ax_25 = plt.subplots(figsize=(8, 6))
         ax_25.bar(idtags, power_25mA, color='skyblue')
@@ -340,16 +409,7 @@ class multi_LIV:
         
 
         # Power at 50mA
-        power_50mA = []
-        for idtag in idtags:
-            df = self.loss_data[idtag]
-            cur_mA = df['current'].astype(float) # Convert current to mA
-            power = df['channel_1'].astype(float) #Ensure to use the correct channel
-            mask = np.isclose(cur_mA, 50, atol=allowance)
-            if mask.any():
-                power_50mA.append(power[mask].iloc[0])
-            else:
-                power_50mA.append(np.nan)
+        power_50mA = power_at('channel_1', 50)  # Ensure to use the correct channel
 
         fig_50, ax_50 = plt.subplots(figsize=(8, 6))
         ax_50.bar(idtags, power_50mA, color='lightcoral')
@@ -364,16 +424,7 @@ class multi_LIV:
         print("Power at 50mA plot saved as Power_at_50mA.png")
 
         # Power at 25mA (dBm)
-        power_25mA_dBm = []
-        for idtag in idtags:
-            df = self.loss_data[idtag]
-            cur_mA = df['current'].astype(float)  # Convert current to mA
-            power_dBm = df['channel_2_log'].astype(float)  #
-            mask = np.isclose(cur_mA, 25, atol=allowance)
-            if mask.any():
-                power_25mA_dBm.append(power_dBm[mask].iloc[0])
-            else:
-                power_25mA_dBm.append(np.nan)
+        power_25mA_dBm = power_at('channel_2_log', 25)
 
         fig_25_dBm, ax_25_dBm = plt.subplots(figsize=(8, 6))
         ax_25_dBm.bar(idtags, power_25mA_dBm, color='skyblue')
@@ -388,16 +439,7 @@ class multi_LIV:
         print("Power at 25mA (dBm) plot saved as Power_at_25mA_dBm.png")
 
         # Power at 50mA (dBm)
-        power_50mA_dBm = []
-        for idtag in idtags:
-            df = self.loss_data[idtag]
-            cur_mA = df['current'].astype(float)  # Convert current to mA
-            power_dBm = df['channel_2_log'].astype(float)  # Assuming channel 2 contains dBm values
-            mask = np.isclose(cur_mA, 50, atol=allowance)
-            if mask.any():
-                power_50mA_dBm.append(power_dBm[mask].iloc[0])
-            else:
-                power_50mA_dBm.append(np.nan)
+        power_50mA_dBm = power_at('channel_2_log', 50)  # Assuming channel 2 contains dBm values
 
         fig_50_dBm, ax_50_dBm = plt.subplots(figsize=(8, 6))
         ax_50_dBm.bar(idtags, power_50mA_dBm, color='lightcoral')
@@ -415,12 +457,8 @@ class multi_LIV:
     def plot_chip_thresholds(self):
         """Generates a simple plot of chip ID vs threshold_ch2 data."""
         idtags = list(self.loss_data.keys())
-        threshold_ch2 = [
-            self.loss_data[id]['ch2_threshold'].values[0]
-            if 'ch2_threshold' in self.loss_data[id]
-            else None
-            for id in idtags
-        ]
+        summary = self.summary.frame(idtags)
+        threshold_ch2 = summary['ch2_threshold'].tolist() if 'ch2_threshold' in summary else [None] * len(idtags)
 
         filtered_data = [(idtag, current) for idtag, current in zip(idtags, threshold_ch2) if current is not None]
         if not filtered_data:
@@ -1,12 +1,20 @@
 import os
 import io
-import re
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 from pathlib import Path
 import scipy.io
-from OSAclass import OSAclass
+from OSAclass import OSAclass, ANALYSIS_VERSION, ANALYSIS_PARAMS
+from functools import partial
+from render import SpecCollector, process_and_render
+from measurement_catalog import MeasurementCatalog, OSA
+from processing_ledger import ProcessingLedger
+from campaign_store import CampaignStore, store_path, file_stamp
+from device_registry import DeviceRegistry
+from filename_meta import parse_filename, unique_idtags
+from summary_index import SummaryIndex, summary_path, summary_row
+from spectral_archive import SpectralArchive, archive_path
 
 """ Class for processing multiple OSA (Optical Spectrum Analyzer) files. Processes selected 'osa' files, creates the following comparison plots:
          - Peak Power vs Current for all devices
@@ -14,78 +22,133 @@ from OSAclass import OSAclass
          - Peak Wavelength vs Current with 2nd Order Polynomial Fits
 """
 
+def _process_osa_file(task, render_plots=True, return_data=False, stream_sweeps=False):
+    """
+    Process one raw OSA csv (runs in a worker process); task is (raw csv, IDtag given by the driver). Returns (raw_file,
+    error message or None, figure specs to render, (summary row, the saved data dict if return_data else None)).
+    """
+    raw_file, idtag = task
+    print(f"Processing {raw_file}")
+    figures = SpecCollector()
+    try:
+        osa = OSAclass(str(raw_file), render_plots=render_plots, renderer=figures, idtag=idtag,
+                       stream_sweeps=stream_sweeps)
+    except Exception as e:
+        return raw_file, str(e), figures.specs, None
+    return raw_file, None, figures.specs, (osa.summary, osa.data_dict if return_data else None)
+
+# Variables of the _new.mat files used by the comparison (plots and summary index); the spectra (optical_power_dBm,
+# wavelength_nm) are never loaded and the IDtag comes from the filename
+COMPARISON_KEYS = ('current_mA', 'peak_power', 'peak_wavelength',
+                   'polyfit_peakWL_vs_I_deg2_coeffs', 'polyfit_peakWL_vs_I_deg3_coeffs')
+
+
+# Variables of the _new.mat files appended to the spectral archive
+SPECTRAL_KEYS = ('current_mA', 'temperature_C', 'optical_power_dBm', 'wavelength_nm', 'sweep_lengths')
+
+
+class MatLoader:
+    """
+    scipy.io.loadmat with an in-process cache: each file is read once, and with variable_names only the requested
+    variables are decoded (later requests for variables already read are served from memory). A file that changes on
+    disk is read again.
+    """
+
+    def __init__(self):
+        self._cache = {}  # path: [file stamp, {name: array}, names requested so far (None = all)]
+
+    def load(self, mat_file, variable_names=None):
+        """{name: array} of the requested variables that are in the file (all variables if variable_names is None)."""
+        path = str(mat_file)
+        stamp = file_stamp(path)
+        entry = self._cache.get(path)
+        if entry is None or entry[0] != stamp:
+            entry = self._cache[path] = [stamp, {}, set()]
+        _, data, requested = entry
+
+        if variable_names is None:
+            if requested is not None:
+                data.update(scipy.io.loadmat(path))
+                entry[2] = None
+            return dict(data)
+
+        if requested is not None:
+            missing = [name for name in variable_names if name not in requested]
+            if missing:
+                data.update(scipy.io.loadmat(path, variable_names=missing))
+                requested.update(missing)
+        return {name: data[name] for name in variable_names if name in data}
+
+
 class multi_OSA:
-    def __init__(self, parent_path, selected_files=None, overwrite_existing=False):
+    def __init__(self, parent_path, selected_files=None, overwrite_existing=False, catalog=None, workers=1, render_plots=True,
+                 render_workers=None, campaign_store=False, ledger=None, spectral_archive=False,
+                 registry=None, stream_sweeps=False):
         p = Path(parent_path)
         self.parent_path = parent_path
         self.cmap = plt.get_cmap('inferno')
         self.idtag_to_mat_file = {}  # Store mapping of IDtag to mat file path
+        self.loader = MatLoader()  # every .mat is read once, and only COMPARISON_KEYS unless the whole file is needed
         
         # Log selected files for debugging
         print("Debug: Selected files:", selected_files)
         
-        # Filter selected files to only include OSA files
-        selected_files = self.filter_osa(selected_files) if selected_files else None
-        
-        if not selected_files:
-            # Auto-scan for every OSA CSV under parent_path (including subfolders)
-            all_files = [
-                fp
-                for fp in p.rglob('*.csv')
-                if fp.is_file()
-            ]
-            print("Debug: All files found by rglob:", [str(fp) for fp in all_files])
-            
-            # Filter for raw OSA files (excluding loss_data files)
-            raw_files = [
-                fp
-                for fp in all_files
-                if 'loss' not in fp.name.lower() and 'osa' in fp.name.lower()
-            ]
-        else:
-            # Use the selected files to find matching CSV files
-            wanted = {Path(name).stem.lower() for name in selected_files}
-            
-            all_files = [
-                fp
-                for fp in p.rglob('*.csv')
-                if fp.is_file()
-            ]
-            
-            # Find CSVs that match selected files and are OSA files
-            raw_files = [
-                fp
-                for fp in all_files
-                if fp.stem.lower() in wanted and 'osa' in fp.name.lower()
-            ]
-            print("Debug: Selected OSA raw files:", [str(fp) for fp in raw_files])
+        # File type comes from the content of each csv (shared catalog, one directory walk)
+        self.catalog = catalog if catalog is not None else MeasurementCatalog(parent_path)
+        # How each csv was last processed (content hash, analysis version, parameters), shared like the catalog
+        self.ledger = ledger if ledger is not None else ProcessingLedger(parent_path)
+        # Metadata and scalar results of every processed measurement, for selecting devices without a directory walk
+        self.registry = registry if registry is not None else DeviceRegistry(parent_path)
+        raw_files = self.filter_osa(selected_files)
+        print("Debug: Selected OSA raw files:", [str(fp) for fp in raw_files])
 
         self.raw_files = raw_files
         print(f"Found {len(raw_files)} raw files to process")
+        # IDtag of every raw file from its filename; files of the same device are told apart. The IDtag is saved in the
+        # _new.mat, so it is part of the parameters the ledger compares (a file whose IDtag changes is processed again)
+        raw_idtags = unique_idtags(raw_files)
+        params = {raw_file: dict(ANALYSIS_PARAMS, idtag=raw_idtags[raw_file]) for raw_file in raw_files}
 
-        # STEP 3: Process raw files with OSAclass if overwrite_existing is True
-        if overwrite_existing:
-            print("Overwrite flag is set, processing raw OSA files...")
-            # Process raw files with OSAclass
-            for raw_file in raw_files:
-                print(f"Processing {raw_file}")
-                try:
-                    osa = OSAclass(str(raw_file))
-                    # The OSAclass will save outputs in the same directory as the raw file
-                except Exception as e:
-                    print(f"Error processing {raw_file}: {e}")
+        # STEP 3: Process raw files with OSAclass: all of them if overwrite_existing is True, otherwise those whose
+        # content, analysis version or parameters changed since their _new.mat was made (see processing_ledger.py)
+        to_process = []
+        for raw_file in raw_files:
+            reason = "overwrite requested" if overwrite_existing else self.ledger.stale_reason(
+                raw_file, OSA, ANALYSIS_VERSION, params[raw_file], [self.mat_path(raw_file)], render_plots)
+            if reason:
+                print(f"Processing {raw_file.name}: {reason}")
+                to_process.append(raw_file)
+        results = {}
+        if to_process:
+            # Process raw files with OSAclass (in parallel if workers != 1), figures rendered by a separate pool
+            # The OSAclass will save outputs in the same directory as the raw file
+            # stream_sweeps=True: each csv is read one sweep at a time from the memory-mapped file (see osa_file.py)
+            # instead of being parsed whole; the results are the same
+            errors = process_and_render(partial(_process_osa_file, render_plots=render_plots,
+                                                return_data=campaign_store or spectral_archive,
+                                                stream_sweeps=stream_sweeps),
+                                        [(raw_file, raw_idtags[raw_file]) for raw_file in to_process], workers,
+                                        render_workers, on_result=results.__setitem__)
+            for raw_file, error in errors.items():
+                if error:
+                    print(f"Error processing {raw_file}: {error}")
+                else:
+                    self.ledger.record(raw_file, OSA, ANALYSIS_VERSION, params[raw_file], [self.mat_path(raw_file)],
+                                       render_plots)
+            self.ledger.save()
         else:
-            print("Skipping raw file processing (use overwrite_existing=True to reprocess)")
+            print("All raw OSA files are up to date (use overwrite_existing=True to reprocess)")
             
         # STEP 4: Find all the processed .mat files for comparison plots
         mat_files = []
+        self.file_idtags = {}  # {mat file: IDtag}, the IDtag each raw file was processed with
         # First check if each raw file has a corresponding .mat file
         for raw_file in raw_files:
             # Look for a .mat file in the same directory with the same name but ending in _new.mat
-            mat_name = raw_file.stem + "_new.mat"
-            mat_path = raw_file.parent / mat_name
+            mat_path = self.mat_path(raw_file)
             if mat_path.exists():
                 mat_files.append(mat_path)
+                self.file_idtags[mat_path] = raw_idtags[raw_file]
             else:
                 print(f"Warning: No matching .mat file found for {raw_file}")
 
@@ -96,6 +159,7 @@ class multi_OSA:
             mat_files = [
                 fp for fp in p.rglob("*_new.mat") if fp.is_file()
             ]
+            self.file_idtags = unique_idtags(mat_files)
 
         if not mat_files:
             print("No OSA .mat file found with _new.mat suffix!")
@@ -109,6 +173,21 @@ class multi_OSA:
         self.save_dir = Path(parent_path) / "OSA_Comparison"
         os.makedirs(self.save_dir, exist_ok=True)
         
+        # campaign_store=True: all devices go into one OSA_campaign.zip, from which the comparison reads only the
+        # peak power/wavelength vs current of each device instead of loading every .mat
+        self.store = CampaignStore(store_path(parent_path, "OSA")) if campaign_store else None
+        if self.store is not None:
+            self.update_store(results)
+        # Polynomial fit coefficients of every device, one row each, in OSA_summary.npz
+        self.summary = SummaryIndex(summary_path(parent_path, "OSA"))
+        self.update_summary(results)
+        self.update_registry()
+        # spectral_archive=True: the spectra of every device are also appended to the memory-mapped OSA_spectra
+        # archive, for comparisons of spectra across devices (see spectral_archive.py)
+        if spectral_archive:
+            self.archive = SpectralArchive(archive_path(parent_path))
+            self.update_archive(results)
+
         # Build a dictionary mapping IDtags to mat files for faster lookup
         self.build_idtag_mapping()
         
@@ -116,58 +195,45 @@ class multi_OSA:
         self.create_comparison_plots()
                 
     def filter_osa(self, selected_files):
-        """Filter selected files to only include OSA files"""
-        if not selected_files:
-            return None
-            
-        # Only keep files that have "OSA" in their name
-        filtered = []
-        for fname in selected_files:
-            if 'osa' in Path(fname).name.lower():
-                filtered.append(fname)
-            else:
-                print(f"Skipping non-OSA file: {fname}")
-                
-        return filtered
+        """Keep the csvs whose content is OSA (all OSA csvs under parent_path if nothing was selected)"""
+        return self.catalog.files(OSA, selected_files)
         
     def build_idtag_mapping(self):
         """Build a dictionary mapping IDtags to mat files for faster lookup"""
-        self.idtag_to_mat_file = {}
-        
-        for mat_file in self.mat_files:
-            try:
-                data = scipy.io.loadmat(str(mat_file))
-                if 'IDtag' in data:
-                    idtag = str(data['IDtag'][0])
-                    self.idtag_to_mat_file[idtag] = mat_file
-                else:
-                    print(f"Warning: No IDtag found in {mat_file}")
-            except Exception as e:
-                print(f"Error reading {mat_file}: {e}")
+        self.idtag_to_mat_file = {idtag: mat_file for mat_file, idtag in self.file_idtags.items()}
         
     def create_comparison_plots(self):
         """Create all comparison plots"""
         print(f"\n--- Generating comparison plots in: {self.save_dir} ---")
         
-        # Load data from all mat files
+        device_data = self.load_device_data() if self.store is None else self.load_store_data()
+
+        # Generate comparison plots
+        print(f"Total devices loaded: {len(device_data)}")
+        if len(device_data) == 0:
+            print("No device data loaded - cannot generate plots")
+            return
+            
+        self.plot_peak_power_vs_current(device_data)
+        self.plot_peak_wl_vs_current(device_data)
+        self.plot_peak_wl_vs_current_with_fit(device_data)
+        self.plot_peak_power_at_25mA(device_data)
+        self.plot_peak_power_at_50mA(device_data)
+        
+    def load_device_data(self):
+        """{IDtag: current, peak power and peak wavelength} from every .mat file."""
         device_data = {}
         
         for mat_file in self.mat_files:
             try:
-                # Load the mat file
-                data = scipy.io.loadmat(str(mat_file))
+                # Load the comparison variables of the mat file (served from memory if update_summary already read them)
+                data = self.loader.load(mat_file, COMPARISON_KEYS)
                 
                 # Debugging: Print available keys in the .mat file
                 print(f"Keys in {mat_file}: {list(data.keys())}")
                 
-                # Extract IDtag
-                if 'IDtag' in data:
-                    idtag = str(data['IDtag'][0])
-                else:
-                    # Generate IDtag from filename using same method as multi_LIV
-                    idtag = self.get_IDtag(mat_file.name)
-                    print(f"Generated IDtag: {idtag} from filename: {mat_file.name}")
-                    
+                idtag = self.file_idtags[mat_file]
+
                 # Extract current, peak power and wavelength data
                 print(f"Checking for keys: ['current_mA', 'peak_power', 'peak_wavelength']")
                 if all(key in data for key in ['current_mA', 'peak_power', 'peak_wavelength']):
@@ -191,19 +257,96 @@ class multi_OSA:
                     print(f"Missing keys: {missing_keys}")
             except Exception as e:
                 print(f"Error loading {mat_file}: {e}")
-                
-        # Generate comparison plots
-        print(f"Total devices loaded: {len(device_data)}")
-        if len(device_data) == 0:
-            print("No device data loaded - cannot generate plots")
-            return
-            
-        self.plot_peak_power_vs_current(device_data)
-        self.plot_peak_wl_vs_current(device_data)
-        self.plot_peak_wl_vs_current_with_fit(device_data)
-        self.plot_peak_power_at_25mA(device_data)
-        self.plot_peak_power_at_50mA(device_data)
-        
+        return device_data
+
+    def update_store(self, results):
+        """
+        Put the devices processed in this run into the campaign store, and import every other .mat that is not in the
+        store yet (or has changed since it was stored). Sets self.mat_idtags: {mat file: IDtag}.
+        """
+        processed = {self.mat_path(raw_file): result[1] for raw_file, result in results.items()}
+        self.mat_idtags = {}
+        for mat_file in self.mat_files:
+            data = processed.get(mat_file)
+            idtag = self.file_idtags[mat_file]
+            if data is None and self.store.is_current(idtag, mat_file):
+                self.mat_idtags[mat_file] = idtag
+                continue
+            try:
+                self.store.append(idtag, data if data is not None else self.loader.load(mat_file), source=mat_file)
+                self.mat_idtags[mat_file] = idtag
+            except Exception as e:
+                print(f"Error storing {mat_file}: {e}")
+        self.store.flush()
+
+    def update_summary(self, results):
+        """Add the summary rows of this run's devices, and of every other .mat that is new to the index or changed since."""
+        processed = {self.mat_path(raw_file): result[0] for raw_file, result in results.items()}
+        for mat_file in self.mat_files:
+            idtag = self.file_idtags[mat_file]
+            if mat_file in processed:
+                self.summary.append(idtag, processed[mat_file], source=mat_file)
+            elif not self.summary.is_current(idtag, mat_file):
+                try:
+                    if self.store is not None and self.store.is_current(idtag, mat_file):
+                        data = self.store.device(idtag)
+                    else:
+                        data = self.loader.load(mat_file, COMPARISON_KEYS)
+                    self.summary.append(idtag, summary_row(data), source=mat_file)
+                except Exception as e:
+                    print(f"Error summarising {mat_file}: {e}")
+        self.summary.save()
+
+    def update_archive(self, results):
+        """Append the spectra of this run's devices to the archive, and of every other .mat that is new to it or changed since."""
+        processed = {self.mat_path(raw_file): result[1] for raw_file, result in results.items()}
+        for mat_file in self.mat_files:
+            data = processed.get(mat_file)
+            idtag = self.file_idtags[mat_file]
+            if data is None and self.archive.is_current(idtag, mat_file):
+                continue
+            try:
+                if data is None:
+                    data = self.loader.load(mat_file, SPECTRAL_KEYS)
+                self.archive.append(idtag, data, source=mat_file)
+            except Exception as e:
+                print(f"Error archiving the spectra of {mat_file}: {e}")
+        self.archive.flush()
+
+    def update_registry(self):
+        """Record every raw file with a _new.mat, with its summary row as metrics, in the device registry."""
+        for raw_file in self.raw_files:
+            mat_file = self.mat_path(raw_file)
+            if mat_file not in self.file_idtags:
+                continue
+            idtag = self.file_idtags[mat_file]
+            self.registry.record(OSA, raw_file, idtag, mat_file, metrics=self.summary.rows.get(idtag))
+        self.registry.save()
+
+    @staticmethod
+    def mat_path(raw_file):
+        """The _new.mat that OSAclass saves next to a raw csv."""
+        raw_file = Path(raw_file)
+        return raw_file.parent / (raw_file.stem + "_new.mat")
+
+    def load_store_data(self):
+        """Same as load_device_data, but reads only the three variables of each device from the campaign store."""
+        device_data = {}
+        keys = ['current_mA', 'peak_power', 'peak_wavelength']
+        for mat_file, idtag in self.mat_idtags.items():
+            record = self.store.device(idtag)
+            if not all(key in record for key in keys):
+                print(f"Warning: Missing required data keys for {idtag} in {self.store.path}")
+                continue
+            device_data[idtag] = {
+                'current': record['current_mA'].flatten(),
+                'peak_power': record['peak_power'].flatten(),
+                'peak_wl': record['peak_wavelength'].flatten(),
+                'file_path': mat_file
+            }
+        print(f"Loaded {len(device_data)} devices from {self.store.path}")
+        return device_data
+
     def plot_peak_power_vs_current(self, device_data):
         """Plot peak power vs current for all devices"""
         plt.figure(figsize=(10, 6))
@@ -434,24 +577,5 @@ class multi_OSA:
         print(f"Saved peak power at 50mA comparison plot to {save_path}")
         
     def get_IDtag(self, filename: str) -> str:
-        """Extract IDtag from filename using same method as multi_LIV"""
-        base = Path(filename).stem
-        # Remove _new suffix if present
-        if base.endswith('_new'):
-            base = base[:-4]
-        # Expanded regex to handle more variations, including '_clad' and other suffixes
-        matchR = re.search(r"Chip\w+_R\d+(_clad)?", base)
-        matchL = re.search(r"Chip\w+_L\d+(_clad)?", base)
-        matchD = re.search(r"Chip\w+_D\d+(_clad)?", base)
-        if matchR:
-            id_tag = matchR.group(0)  # Retain '_clad' if present
-        elif matchL:
-            id_tag = matchL.group(0)  # Retain '_clad' if present
-        elif matchD:
-            id_tag = matchD.group(0)  # Retain '_clad' if present
-        else:
-            id_tag = "Unknown_ID"
-
-        # Detailed logging for debugging
-        print(f"Debug: Filename: {filename}, Base: {base}, Extracted ID Tag: {id_tag}")
-        return id_tag
\ No newline at end of file
+        """IDtag of a file: chip, device and cladding from its name, as OSAclass (see filename_meta.py)."""
+        return parse_filename(filename).idtag()
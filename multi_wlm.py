@@ -3,44 +3,49 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 from pathlib import Path
-import re
 import scipy
 
-from WLMclass import WLMclass
+from WLMclass import WLMclass, ANALYSIS_VERSION, ANALYSIS_PARAMS
+from functools import partial
+from render import SpecCollector, process_and_render
+from measurement_catalog import MeasurementCatalog, WLM
+from processing_ledger import ProcessingLedger
+from campaign_store import CampaignStore, store_path
+from device_registry import DeviceRegistry
+from filename_meta import parse_filename, unique_idtags
+from summary_index import SummaryIndex, summary_path, summary_row
 
 """ Class for processing multiple Wavelength Meter (WLM) files. Processes selected 'wlm' files, creates the following comparison plots:
          - Current vs Wavelength for all devices
          - Voltage vs Current for all devices
 """
 
+def _process_wlm_file(csv_fp, render_plots=True, return_data=False):
+    """
+    Process one raw WLM csv (runs in a worker process). Returns (csv_fp, error message or None, figure specs to render,
+    (summary row, the saved data dict if return_data else None)).
+    """
+    figures = SpecCollector()
+    try:
+        wlm = WLMclass(csv_fp, output_folder=csv_fp.parent, render_plots=render_plots, renderer=figures)
+    except Exception as e:
+        return csv_fp, str(e), figures.specs, None
+    return csv_fp, None, figures.specs, (wlm.summary, wlm.data_dict if return_data else None)
+
 class multi_WLM:
-    def __init__(self, parent_path, selected_files=None, overwrite_existing=False):
+    def __init__(self, parent_path, selected_files=None, overwrite_existing=False, catalog=None, workers=1, render_plots=True,
+                 render_workers=None, campaign_store=False, ledger=None, registry=None):
         p = Path(parent_path)
         self.parent_path = parent_path
         self.cmap = plt.get_cmap('inferno')
 
-        selected_files = self.filter_wlm(selected_files) if selected_files else None
-
-        if not selected_files:
-            # auto‑scan for every CSV under parent_path (including subfolders)
-            self.selected_files = [
-                fp
-                for fp in p.rglob('*.csv')
-                if fp.is_file()
-                and 'loss' not in fp.name.lower()
-                and 'wlm'  in fp.name.lower()
-            ]
-        else:
-            # assume selected_files is a list of basenames WITHOUT path, e.g.
-            # ["2025_04_04_17_10_53_OSA_1330nm_ChipC32_R1", ...]
-            wanted = {name.lower() for name in selected_files}
-
-            # still recurse via rglob, but only keep those whose stem is in wanted
-            self.selected_files = [
-                fp
-                for fp in p.rglob('*.csv')
-                if fp.is_file() and fp.stem.lower() in wanted
-            ]
+        # File type comes from the content of each csv (shared catalog, one directory walk)
+        self.catalog = catalog if catalog is not None else MeasurementCatalog(parent_path)
+        # How each csv was last processed (content hash, analysis version, parameters), shared like the catalog
+        self.ledger = ledger if ledger is not None else ProcessingLedger(parent_path)
+        # Metadata and scalar results of every processed measurement, for selecting devices without a directory walk
+        self.registry = registry if registry is not None else DeviceRegistry(parent_path)
+        self.selected_files = self.filter_wlm(selected_files)
 
         if not self.selected_files:
             print("No WLM files found!")
@@ -51,28 +56,52 @@ class multi_WLM:
             os.makedirs(self.save_dir)
 
         self.overwrite_existing = overwrite_existing
+        # IDtag of every csv from its filename; files of the same device are told apart
+        self.file_idtags = unique_idtags(self.selected_files)
+
+        # 2) Process each base CSV into a .mat (in parallel if workers != 1), then load them back in order
+        # Without overwrite_existing, a csv is only processed again if the ledger shows that its content, the analysis
+        # version or parameters changed since its .mat was made (or the .mat is missing)
+        to_process = []
+        for csv_fp in self.selected_files:
+            loss_path = csv_fp.with_name(csv_fp.stem + '.mat')
+            reason = "overwrite requested" if self.overwrite_existing else self.ledger.stale_reason(
+                csv_fp, WLM, ANALYSIS_VERSION, ANALYSIS_PARAMS, [loss_path], render_plots)
+            if reason:
+                print(f"Processing {csv_fp.name}: {reason}")
+                to_process.append(csv_fp)
+            else:
+                print(f"Loss data up to date: {loss_path}. Skipping processing.")
+        # Per-device figures are rendered by a separate pool of render_workers processes while the analysis runs
+        # render_plots=False: metrics and .mat only, no per-device figures (comparison plots are still made)
+        # campaign_store=True: devices go into one WLM_campaign.zip, read lazily below instead of reopening every .mat
+        results = {}
+        errors = process_and_render(partial(_process_wlm_file, render_plots=render_plots, return_data=campaign_store),
+                                    to_process, workers, render_workers, on_result=results.__setitem__)
+        for csv_fp in to_process:
+            if not errors.get(csv_fp):
+                self.ledger.record(csv_fp, WLM, ANALYSIS_VERSION, ANALYSIS_PARAMS, [csv_fp.with_name(csv_fp.stem + '.mat')],
+                                   render_plots)
+        self.ledger.save()
+        self.store = CampaignStore(store_path(parent_path, "WLM")) if campaign_store else None
+        if self.store is not None:
+            self.update_store(results, errors)
+        # Scalar results (peak power and the current, voltage and wavelength at it) of every device in WLM_summary.npz
+        self.summary = SummaryIndex(summary_path(parent_path, "WLM"))
+        self.update_summary(results, errors)
+        self.update_registry(errors)
 
-        # 2) Process each base CSV into a loss_data CSV, then load it
         self.loss_data = {}
         for csv_fp in self.selected_files:
             print(f"→ Processing base file: {csv_fp.name}")
-
-            # sanitize_data should write out a file like "foo_loss_data.csv"
-            # and return its path (as a str or Path)
-
             loss_path = csv_fp.with_name(csv_fp.stem + '.mat')
-            if self.overwrite_existing or not loss_path.exists():
-                try:
-                    wlm_instance = WLMclass(csv_fp, output_folder=csv_fp.parent)
-                except Exception as e:
-                    print(f"Error processing {csv_fp}: {e}")
-                    continue
-            else:
-                print(f"Loss data already exists: {loss_path}. Skipping processing.")
+            if errors.get(csv_fp):
+                print(f"Error processing {csv_fp}: {errors[csv_fp]}")
+                continue
 
             # read it back in
-            df = self.read_mat(loss_path.with_suffix('.mat'))
-            idtag = self.get_IDtag(csv_fp.name)
+            idtag = self.file_idtags[csv_fp]
+            df = self.read_mat(loss_path) if self.store is None else self.to_frame(self.store.device(idtag))
 
             self.loss_data[idtag] = df
             print(f"   ✓ loaded loss_data for {idtag}  ({len(df)} rows)")
@@ -83,9 +112,51 @@ class multi_WLM:
         self.plot_power_at_current()  
         #plt.show()
 
+    def update_store(self, results, errors):
+        """Store this run's devices, and import the .mat of skipped files that are new to the store or changed since."""
+        for csv_fp in self.selected_files:
+            loss_path = csv_fp.with_name(csv_fp.stem + '.mat')
+            if errors.get(csv_fp) or not (csv_fp in results or loss_path.exists()):
+                continue
+            idtag = self.file_idtags[csv_fp]
+            if csv_fp in results:
+                self.store.append(idtag, results[csv_fp][1], source=loss_path)
+            elif not self.store.is_current(idtag, loss_path):
+                self.store.append(idtag, scipy.io.loadmat(loss_path), source=loss_path)
+        self.store.flush()
+
+    def update_summary(self, results, errors):
+        """Add the summary rows of this run's devices, and of skipped files that are new to the index or changed since."""
+        for csv_fp in self.selected_files:
+            loss_path = csv_fp.with_name(csv_fp.stem + '.mat')
+            if errors.get(csv_fp) or not (csv_fp in results or loss_path.exists()):
+                continue
+            idtag = self.file_idtags[csv_fp]
+            if csv_fp in results:
+                self.summary.append(idtag, results[csv_fp][0], source=loss_path)
+            elif not self.summary.is_current(idtag, loss_path):
+                if self.store is not None and self.store.is_current(idtag, loss_path):
+                    mat = self.store.device(idtag)
+                else:
+                    mat = scipy.io.loadmat(loss_path)
+                self.summary.append(idtag, summary_row(mat), source=loss_path)
+        self.summary.save()
+
+    def update_registry(self, errors):
+        """Record every device of this run, with its summary row as metrics, in the device registry."""
+        for csv_fp in self.selected_files:
+            loss_path = csv_fp.with_name(csv_fp.stem + '.mat')
+            if errors.get(csv_fp) or not loss_path.exists():
+                continue
+            idtag = self.file_idtags[csv_fp]
+            self.registry.record(WLM, csv_fp, idtag, loss_path, metrics=self.summary.rows.get(idtag))
+        self.registry.save()
+
     def read_mat(self, mat_file: Path) -> pd.DataFrame:
-        mat = scipy.io.loadmat(mat_file)
+        return self.to_frame(scipy.io.loadmat(mat_file))
 
+    def to_frame(self, mat) -> pd.DataFrame:
+        """DataFrame of one device from {variable: array}: a loaded .mat or a campaign store record."""
         # Manually extract each known variable
         channel_0 = mat['channel_0'].flatten()
         channel_0_log = mat['channel_0_log'].flatten()
@@ -129,14 +200,9 @@ class multi_WLM:
         df['peak_power_wl'] = peak_power_wl
         return df
 
-    def filter_wlm(self, selected_files = []):
-        filtered = []
-        for f in selected_files:
-            # get just the filename portion
-            name = os.path.basename(f)
-            if 'wlm' in name.lower():
-                filtered.append(f)
-        return filtered
+    def filter_wlm(self, selected_files = None):
+        # Keep the csvs whose content is WLM (all WLM csvs under parent_path if nothing was selected)
+        return self.catalog.files(WLM, selected_files)
     
     def check_data(self):
         """Prints out the loaded IDtags and first few rows of each DataFrame."""
@@ -147,21 +213,9 @@ class multi_WLM:
             print(df.head())
 
     def get_IDtag(self, filename: str) -> str:
-        base = Path(filename).stem
-        matchR = re.search(r"Chip\w+_R\d+(_clad)?", base)
-        matchL = re.search(r"Chip\w+_L\d+(_clad)?", base)
-        matchD = re.search(r"Chip\w+_D\d+(_clad)?", base)
-        if matchR:
-            id_tag = matchR.group(0)  # Retain '_clad' if present
-        elif matchL:
-            id_tag = matchL.group(0)  # Retain '_clad' if present
-        elif matchD:
-            id_tag = matchD.group(0)  # Retain '_clad' if present
-        else:
-            id_tag = "Unknown_ID"
-
-        return id_tag
-        
+        """IDtag of a file: chip, device and cladding from its name (see filename_meta.py)."""
+        return parse_filename(filename).idtag()
+
     def plot_voltage_vs_current(self):
         """Plot voltage vs current for all devices"""
         
@@ -0,0 +1,184 @@
+import mmap
+from functools import cached_property
+from pathlib import Path
+import numpy as np
+from scylla_parser import SCYLLA_HEADER_ROWS, OSA_LABELS, parse_values
+
+"""
+    Lazy, memory-mapped access to the sweeps of a Scylla OSA csv.
+
+    On open, the file is memory-mapped and the byte offsets of every labelled row are indexed (labels only, no values
+    are decoded). A sweep is decoded only when it is accessed, so peak extraction and plotting can walk thousands of
+    high-resolution sweeps with constant memory (OSAclass(..., stream_sweeps=True) reads its csv this way):
+
+        with OSAFile(path) as osa:
+            print(len(osa), osa[3].current_mA)
+            for sweep in osa:
+                ax.plot(sweep.wavelength, sweep.power)
+
+    The values are decoded with scylla_parser.parse_values, so a sweep holds the same numbers as read_osa_sweeps.
+
+    [Author: Rhiannon H Evans]
+"""
+
+
+class OSASweep:
+    """One sweep of an OSAFile. Each row is decoded from the mapped file on first access and then kept."""
+
+    def __init__(self, osa_file, index):
+        self.osa_file = osa_file
+        self.index = index
+
+    def _row(self, key):
+        return self.osa_file._decode(key, self.index)
+
+    @cached_property
+    def current(self):
+        """Drive current in A."""
+        return self._row("current")[0]
+
+    @property
+    def current_mA(self):
+        return self.current * 1000
+
+    @cached_property
+    def temperature(self):
+        """Stage temperature in C."""
+        return self._row("temperature")[0]
+
+    @cached_property
+    def _spectrum(self):
+        wl = self._row("wavelength")
+        pw = self._row("power")
+        n = min(wl.size, pw.size)
+        return wl[:n], pw[:n]
+
+    @property
+    def wavelength(self):
+        """Wavelength axis of the sweep in nm."""
+        return self._spectrum[0]
+
+    @property
+    def power(self):
+        """Optical power of the sweep in dBm."""
+        return self._spectrum[1]
+
+    def peak(self):
+        """Return (peak power in dBm, wavelength at peak power in nm)."""
+        idx = np.nanargmax(self.power)
+        return self.power[idx], self.wavelength[idx]
+
+    def __repr__(self):
+        return f"OSASweep({self.osa_file.path.name}, index={self.index})"
+
+
+class OSAFile:
+    def __init__(self, path, skiprows=SCYLLA_HEADER_ROWS):
+        self.path = Path(path)
+        if not self.path.exists():
+            raise FileNotFoundError(f"Cannot find input CSV: {self.path}")
+
+        if self.path.stat().st_size == 0:
+            raise ValueError(f"Empty OSA file: {self.path}")
+        self._fh = open(self.path, "rb")
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self._index_rows(skiprows)
+
+    def _index_rows(self, skiprows):
+        """
+        Record (start, end) byte offsets of the values of every labelled row. Only the labels are read, and the commas
+        of the spectrum rows are counted (one row at a time) for the width of the widest sweep.
+        """
+        mm = self._mm
+        labels = {label.encode(): key for label, key in OSA_LABELS.items()}
+        offsets = {key: [] for key in OSA_LABELS.values()}
+
+        pos = 0
+        size = len(mm)
+        line_no = 0
+        width = 0
+        while pos < size:
+            end = mm.find(b"\n", pos)
+            if end == -1:
+                end = size
+            if line_no >= skiprows:
+                comma = mm.find(b",", pos, end)
+                if comma != -1:
+                    key = labels.get(mm[pos:comma].strip().strip(b'"').strip())
+                    if key is not None:
+                        offsets[key].append((comma + 1, end))
+                        if key in ("wavelength", "power"):
+                            width = max(width, mm[comma + 1:end].count(b",") + 1)
+            line_no += 1
+            pos = end + 1
+
+        self.n_sweeps = min(len(rows) for rows in offsets.values())
+        self.width = width  # points of the widest spectrum row (the n_points of read_osa_sweeps' matrices)
+        self._offsets = {key: np.array(rows[:self.n_sweeps], dtype=np.int64).reshape(-1, 2) for key, rows in offsets.items()}
+
+    def _decode(self, key, index):
+        start, end = self._offsets[key][index]
+        return parse_values(self._mm[start:end].decode().rstrip("\r"))
+
+    def __len__(self):
+        return self.n_sweeps
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.n_sweeps
+        if not 0 <= index < self.n_sweeps:
+            raise IndexError(f"Sweep {index} out of range for {self.n_sweeps} sweeps")
+        return OSASweep(self, index)
+
+    def __iter__(self):
+        for i in range(self.n_sweeps):
+            yield OSASweep(self, i)
+
+    @property
+    def currents_mA(self):
+        """Drive current of every sweep in mA (decodes only the current rows)."""
+        return np.array([self._decode("current", i)[0] for i in range(self.n_sweeps)]) * 1000
+
+    def peaks(self):
+        """
+        Walk all sweeps one at a time and return per-sweep peak data without holding the spectra in memory.
+
+        Returns
+        -------
+        peaks : dict
+            "current_mA", "temperature_C", "peak_power" (dBm) and "peak_wavelength" (nm), one value per sweep.
+        """
+        current = np.empty(self.n_sweeps)
+        temperature = np.empty(self.n_sweeps)
+        peak_power = np.empty(self.n_sweeps)
+        peak_wl = np.empty(self.n_sweeps)
+        for i, sweep in enumerate(self):
+            current[i] = sweep.current_mA
+            temperature[i] = sweep.temperature
+            peak_power[i], peak_wl[i] = sweep.peak()
+        return {
+            "current_mA": current,
+            "temperature_C": temperature,
+            "peak_power": peak_power,
+            "peak_wavelength": peak_wl
+        }
+
+    def close(self):
+        self._mm.close()
+        self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __repr__(self):
+        return f"OSAFile({self.path.name}, {self.n_sweeps} sweeps)"
+
+
+if __name__ == "__main__":
+    import sys
+    with OSAFile(sys.argv[1]) as osa:
+        print(osa)
+        print(osa.peaks())
@@ -0,0 +1,54 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+"""
+    Process-pool helper used by the multi_* drivers to run the per-file analysis (parse, analyse, plot, save) on several
+    cores. Each file is handled by a top-level worker function in its own process, so one bad file cannot take down the
+    batch, and results always come back in input order.
+
+    [Author: Rhiannon H Evans]
+"""
+
+
+def resolve_workers(workers):
+    """None or 0 means one worker per CPU core; anything else is clamped to at least 1."""
+    if not workers:
+        return os.cpu_count() or 1
+    return max(1, int(workers))
+
+
+def _init_worker():
+    # Worker processes never show figures; Agg avoids GUI backends (Tk) in child processes
+    import matplotlib
+    matplotlib.use("Agg", force=True)
+
+
+def iter_per_file(func, items, workers=1):
+    """
+    Apply func to every item and yield the results in the same order as items, as soon as each one is ready.
+
+    Parameters
+    ----------
+    func : callable
+        Top-level (picklable) function taking one item. It should catch its own exceptions and report them in its
+        return value so that one failure does not stop the others.
+    items : list
+        Work items, e.g. csv paths.
+    workers : int or None
+        Number of worker processes. 1 runs everything in this process (previous behaviour); None/0 uses all cores.
+    """
+    items = list(items)
+    workers = min(resolve_workers(workers), len(items)) if items else 1
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    print(f"Processing {len(items)} files on {workers} worker processes...")
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        yield from pool.map(func, items)
+
+
+def run_per_file(func, items, workers=1):
+    """Same as iter_per_file, but returns all results as a list."""
+    return list(iter_per_file(func, items, workers))
@@ -0,0 +1,113 @@
+import hashlib
+import json
+from pathlib import Path
+import numpy as np
+
+"""
+    Binary cache of parsed raw measurements. The decoded arrays of a raw csv are stored as one uncompressed .npy per
+    array in a '<stem>_parsed' folder next to the file, with 'entry.json' holding the content hash of the csv and the
+    array names. Later runs memory-map the arrays (copy-on-write, so nothing is read until it is used and the cache
+    file is never modified) and skip text parsing; any change to the csv content (or to PARSE_CACHE_VERSION)
+    invalidates the entry.
+
+    Usage:
+        rows = load_or_parse(path, "liv", lambda: read_scylla_rows(path, LIV_TERMS))
+
+    [Author: Rhiannon H Evans]
+"""
+
+# Bump when the layout of the parsed arrays changes (e.g. a new row or a different unit)
+PARSE_CACHE_VERSION = 1
+
+_CHUNK = 1 << 20
+
+
+def file_digest(path):
+    """Content hash (blake2b, hex) of a file, read in 1 MB chunks."""
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_path(path):
+    """Cache folder of a raw csv."""
+    path = Path(path)
+    return path.with_name(path.stem + "_parsed")
+
+
+_ENTRY = "entry.json"
+
+
+def _tag(kind, digest):
+    return f"{kind}:{PARSE_CACHE_VERSION}:{digest}"
+
+
+def load_cached(path, kind, digest=None):
+    """
+    Return the cached {key: array or None} for a raw csv, or None if there is no valid entry. The arrays are
+    copy-on-write memory maps of the cache files (read-write in memory, the files are never changed).
+    """
+    folder = cache_path(path)
+    if not (folder / _ENTRY).exists():
+        return None
+    digest = digest or file_digest(path)
+    try:
+        with open(folder / _ENTRY, "r") as f:
+            entry = json.load(f)
+        if entry["tag"] != _tag(kind, digest):
+            return None
+        return {key: None if name is None else np.load(folder / name, mmap_mode="c", allow_pickle=False)
+                for key, name in entry["files"].items()}
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Ignoring unreadable parse cache {folder}: {e}")
+        return None
+
+
+def save_cached(path, kind, rows, digest=None):
+    """Write {key: array or None} to the cache folder next to the raw csv. Failures are reported, not raised."""
+    folder = cache_path(path)
+    digest = digest or file_digest(path)
+    # Arrays are named by position (keys such as 'channel 0' need not be valid file names)
+    files = {key: None if value is None else f"{k}.npy" for k, (key, value) in enumerate(rows.items())}
+    try:
+        folder.mkdir(exist_ok=True)
+        # The entry is removed first and written last, so an interrupted write leaves no valid entry
+        (folder / _ENTRY).unlink(missing_ok=True)
+        for stale in folder.glob("*.npy"):
+            stale.unlink()
+        for key, name in files.items():
+            if name is not None:
+                np.save(folder / name, np.asarray(rows[key]), allow_pickle=False)
+        with open(folder / _ENTRY, "w") as f:
+            json.dump({"tag": _tag(kind, digest), "files": files}, f)
+        # Cache file of the earlier layout (one .npz read and copied on every load), superseded by the folder
+        folder.with_name(folder.name + ".npz").unlink(missing_ok=True)
+    except OSError as e:
+        print(f"Warning: could not write parse cache {folder}: {e}")
+
+
+def load_or_parse(path, kind, parse):
+    """
+    Return the parsed arrays of a raw csv, from the cache if its content hash matches, otherwise by calling parse()
+    and caching the result.
+
+    Parameters
+    ----------
+    path : str or Path
+        Raw measurement csv.
+    kind : str
+        Parser name stored with the entry (e.g. "liv", "wlm", "osa"), so a cache written by one parser is never
+        returned to another.
+    parse : callable
+        Zero-argument function returning {key: ndarray or None}.
+    """
+    digest = file_digest(path)
+    rows = load_cached(path, kind, digest)
+    if rows is not None:
+        print(f"Loaded parsed data from cache {cache_path(path).name}")
+        return rows
+    rows = parse()
+    save_cached(path, kind, rows, digest)
+    return rows
@@ -0,0 +1,122 @@
+import json
+from pathlib import Path
+from parse_cache import file_digest
+from campaign_store import file_stamp
+
+"""
+    Ledger of how every raw csv was last processed, so that the multi_* drivers only reprocess files whose input or
+    analysis has changed (instead of skipping any file that has a .mat, however old).
+
+    For each csv '<parent>/processing_ledger.json' records:
+            - the content hash of the csv (blake2b, as parse_cache; only recomputed when the size/mtime changes)
+            - the measurement type and the analysis version of its class (ANALYSIS_VERSION in LIVclass.py, WLMclass.py,
+              OSAclass.py, bumped whenever the results would change, e.g. a new threshold algorithm)
+            - the analysis parameters (ANALYSIS_PARAMS of the class)
+            - the output files and whether the per-device plots were drawn
+    A file is processed again if any of these differ, or an output is missing.
+
+    Usage:
+        ledger = ProcessingLedger(parent_dir)
+        reason = ledger.stale_reason(csv, LIV, ANALYSIS_VERSION, ANALYSIS_PARAMS, [mat_path], render_plots)
+        ... process if reason is not None ...
+        ledger.record(csv, LIV, ANALYSIS_VERSION, ANALYSIS_PARAMS, [mat_path], render_plots)
+        ledger.save()
+
+    [Author: Rhiannon H Evans]
+"""
+
+LEDGER_FILENAME = "processing_ledger.json"
+
+
+class ProcessingLedger:
+    """Shared by main.py and the multi_* drivers (like MeasurementCatalog)."""
+
+    def __init__(self, parent_path, ledger_file=None):
+        self.parent_path = Path(parent_path)
+        self.ledger_file = Path(ledger_file) if ledger_file else self.parent_path / LEDGER_FILENAME
+        self._entries = self._load()
+        self._digests = {}  # str(path): (file stamp, digest) hashed in this run
+        self._changed = False
+
+    def _load(self):
+        try:
+            with open(self.ledger_file, "r") as f:
+                return json.load(f).get("entries", {})
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        """Write the ledger if anything was recorded (failures are reported, not raised)."""
+        if not self._changed:
+            return
+        try:
+            with open(self.ledger_file, "w") as f:
+                json.dump({"entries": self._entries}, f, indent=1)
+            self._changed = False
+        except OSError as e:
+            print(f"Warning: could not write processing ledger {self.ledger_file}: {e}")
+
+    def digest(self, csv_path):
+        """Content hash of a csv; the recorded one is reused while the file's size and mtime are unchanged."""
+        key = str(csv_path)
+        stamp = file_stamp(csv_path)
+        entry = self._entries.get(key)
+        if entry is not None and entry["stamp"] == stamp:
+            return entry["digest"]
+        cached = self._digests.get(key)
+        if cached is None or cached[0] != stamp:
+            cached = self._digests[key] = (stamp, file_digest(csv_path))
+        if entry is not None and entry["digest"] == cached[1]:
+            entry["stamp"] = stamp  # touched but not changed: no need to hash it again next time
+            self._changed = True
+        return cached[1]
+
+    def stale_reason(self, csv_path, kind, version, params, outputs, render_plots=False):
+        """
+        Why the csv has to be processed (again), or None if its outputs are up to date.
+
+        Parameters
+        ----------
+        csv_path : str or Path
+            Raw measurement csv.
+        kind : str
+            Measurement type (LIV, WLM, OSA).
+        version : int
+            Analysis version of the class that processes it.
+        params : dict
+            Analysis parameters (JSON serialisable).
+        outputs : list of str or Path
+            Files the processing writes (e.g. the .mat).
+        render_plots : bool
+            True if the per-device plots are wanted (a file processed without them is then processed again).
+        """
+        entry = self._entries.get(str(csv_path))
+        if entry is None:
+            return "not processed before"
+        if any(not Path(output).exists() for output in outputs):
+            return "output missing"
+        if entry["kind"] != kind:
+            return f"type changed ({entry['kind']} -> {kind})"
+        if entry["version"] != version:
+            return f"analysis version changed ({entry['version']} -> {version})"
+        if entry["params"] != json.loads(json.dumps(params)):
+            return "analysis parameters changed"
+        if render_plots and not entry["plots"]:
+            return "plots not drawn before"
+        if self.digest(csv_path) != entry["digest"]:
+            return "csv content changed"
+        return None
+
+    def record(self, csv_path, kind, version, params, outputs, render_plots=False):
+        """Record a successful processing of the csv (call save() to write the ledger)."""
+        key = str(csv_path)
+        self._entries[key] = {
+            "digest": self.digest(csv_path),
+            "stamp": file_stamp(csv_path),
+            "kind": kind,
+            "version": version,
+            "params": json.loads(json.dumps(params)),
+            "outputs": [str(output) for output in outputs],
+            "plots": bool(render_plots),
+        }
+        self._changed = True
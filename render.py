@@ -0,0 +1,269 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from parallel import resolve_workers, iter_per_file, _init_worker
+
+"""
+    Plot specs and the rendering stage for per-device figures.
+
+    The analysis code (LIVclass, WLMclass, OSAclass, threshold.py) does not draw figures itself. It builds a FigureSpec,
+    which records the Axes calls it would have made (plot, scatter, axvline, set_xlabel, legend, ...) together with the
+    data, and hands it to a renderer:
+            - InlineRenderer: draws and saves the figure straight away (default, same as before)
+            - SpecCollector:  keeps the specs, e.g. to send them back from a worker process
+            - RenderPool:     draws and saves the figures in background Agg worker processes
+
+    Usage:
+        fig = FigureSpec([save_dir / "x_IVcurve.svg", save_dir / "x_IVcurve.png"])
+        ax = fig.axes[0]
+        ax.plot(current, voltage, color='black', marker='o')
+        ax.set_xlabel("Current (mA)")
+        renderer.submit(fig)
+
+    [Author: Rhiannon H Evans]
+"""
+
+# Use as transform=AXES_COORDS in a recorded call (e.g. ax.text) where matplotlib code would pass ax.transAxes
+AXES_COORDS = "transAxes"
+
+_VECTOR_FORMATS = ("svg", "pdf", "eps", "ps")
+
+
+class AxesSpec:
+    """Records Axes method calls, replayed on a real Axes by render_figure."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def record(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+        return record
+
+
+class FigureSpec:
+    """
+    A figure to be rendered: grid of AxesSpec plus the files it is saved to (format taken from each file suffix).
+
+    Parameters
+    ----------
+    paths : list of str or Path
+        Output files, e.g. [name.svg, name.png].
+    nrows, ncols : int
+        Subplot grid.
+    figsize : tuple or None
+        Figure size in inches (matplotlib default if None).
+    tight_layout : bool
+        Call fig.tight_layout() before saving.
+    raster_dpi : float or None
+        Resolution of rasterized artists (rasterized=True) inside vector outputs (.svg/.pdf); None uses the figure dpi.
+        Raster outputs (.png) are not affected.
+    dpi : float or None
+        Figure resolution, used for raster outputs (matplotlib default if None).
+    """
+
+    def __init__(self, paths, nrows=1, ncols=1, figsize=None, tight_layout=False, bbox_inches="tight", raster_dpi=None,
+                 dpi=None):
+        self.paths = [str(p) for p in paths]
+        self.nrows = nrows
+        self.ncols = ncols
+        self.figsize = figsize
+        self.tight_layout = tight_layout
+        self.bbox_inches = bbox_inches
+        self.raster_dpi = raster_dpi
+        self.dpi = dpi
+        self.axes = [AxesSpec() for _ in range(nrows * ncols)]
+
+
+def minmax_decimate(x, y, max_points=2000):
+    """
+    Reduce a dense trace for plotting by keeping the minimum and maximum of y in each of max_points/2 bins of
+    consecutive samples (plus the first and last sample). The envelope drawn at screen resolution looks the same as the
+    full trace, and every local extreme that matters at that resolution, including the global peak, is kept exactly.
+
+    Parameters
+    ----------
+    x, y : array_like
+        Trace, e.g. wavelength (nm) and power (dBm). NaNs are ignored.
+    max_points : int or None
+        Approximate number of points to keep. None/0, or a trace that is already short enough, returns the input.
+
+    Returns
+    -------
+    x, y : ndarray
+        The kept samples, in their original order.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    n = y.size
+    if not max_points or n <= max_points:
+        return x, y
+
+    n_bins = max(1, max_points // 2)
+    bin_size = -(-n // n_bins)
+    padded = np.full(n_bins * bin_size, np.nan)
+    padded[:n] = y
+    bins = padded.reshape(n_bins, bin_size)
+    valid = ~np.isnan(bins)
+    offsets = np.arange(n_bins) * bin_size
+    i_max = np.argmax(np.where(valid, bins, -np.inf), axis=1) + offsets
+    i_min = np.argmin(np.where(valid, bins, np.inf), axis=1) + offsets
+    has_data = valid.any(axis=1)
+
+    keep = np.unique(np.concatenate([[0, n - 1], i_max[has_data], i_min[has_data]]))
+    return x[keep], y[keep]
+
+
+def _draw(fig, spec):
+    axes = fig.subplots(spec.nrows, spec.ncols, squeeze=False).ravel()
+    for ax, ax_spec in zip(axes, spec.axes):
+        for name, args, kwargs in ax_spec.calls:
+            if kwargs.get("transform") == AXES_COORDS:
+                kwargs = dict(kwargs, transform=ax.transAxes)
+            getattr(ax, name)(*args, **kwargs)
+    if spec.tight_layout:
+        fig.tight_layout()
+    return fig
+
+
+def show_figure(spec):
+    """Draw a FigureSpec on a pyplot figure (for interactive use with plt.show()); nothing is saved."""
+    import matplotlib.pyplot as plt
+    return _draw(plt.figure(figsize=spec.figsize, dpi=spec.dpi), spec)
+
+
+def render_figure(spec):
+    """Draw a FigureSpec and save it to all its paths. Uses the object-oriented API only (no pyplot state)."""
+    from matplotlib.figure import Figure
+
+    fig = _draw(Figure(figsize=spec.figsize, dpi=spec.dpi), spec)
+    for path in spec.paths:
+        fmt = Path(path).suffix.lstrip(".") or None
+        dpi = spec.raster_dpi if spec.raster_dpi and fmt in _VECTOR_FORMATS else "figure"
+        fig.savefig(path, format=fmt, bbox_inches=spec.bbox_inches, dpi=dpi)
+        print(f"Saved plot to {path}")
+    return spec.paths
+
+
+class InlineRenderer:
+    """Render each spec immediately in this process."""
+
+    def submit(self, spec):
+        render_figure(spec)
+
+    def submit_all(self, specs):
+        for spec in specs:
+            self.submit(spec)
+
+
+class SpecCollector:
+    """Keep the specs instead of rendering them (they are picklable and can be returned from a worker process)."""
+
+    def __init__(self):
+        self.specs = []
+
+    def submit(self, spec):
+        self.specs.append(spec)
+
+    def submit_all(self, specs):
+        self.specs.extend(specs)
+
+
+class RenderPool:
+    """
+    Background pool of Agg worker processes that render FigureSpecs while the caller carries on with the analysis.
+    close() (or leaving a with-block) waits for all figures and reports failures.
+
+    Parameters
+    ----------
+    workers : int or None
+        Number of render processes; None/0 uses one per CPU core.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = resolve_workers(workers)
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        self._futures = []
+
+    def submit(self, spec):
+        self._futures.append((spec, self._pool.submit(render_figure, spec)))
+
+    def submit_all(self, specs):
+        for spec in specs:
+            self.submit(spec)
+
+    def close(self):
+        """Wait for all submitted figures. Returns the number of figures that failed to render."""
+        failed = 0
+        for spec, future in self._futures:
+            try:
+                future.result()
+            except Exception as e:
+                failed += 1
+                print(f"Error rendering {', '.join(os.path.basename(p) for p in spec.paths)}: {e}")
+        if self._futures:
+            print(f"Rendered {len(self._futures) - failed} of {len(self._futures)} figures")
+        self._futures = []
+        self._pool.shutdown()
+        return failed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def process_and_render(worker, items, workers=1, render_workers=None, on_result=None, chunk_size=None):
+    """
+    Run the per-file analysis and render its figures in a separate stage. Used by the multi_* drivers.
+
+    Parameters
+    ----------
+    worker : callable
+        Top-level function taking one item and returning (item, error message or None, list of FigureSpec), optionally
+        followed by a result (e.g. the data dict of the device).
+    items : list
+        Files to process.
+    workers : int or None
+        Analysis processes (see parallel.iter_per_file).
+    render_workers : int or None
+        Render processes (None/0 = one per CPU core). The pool is only started if a figure is produced.
+    on_result : callable or None
+        Called in this process as on_result(item, result) for every item whose worker returned a result (not None).
+    chunk_size : int or None
+        If given, the worker takes a list of up to chunk_size items (analysed together, e.g. in one vectorized batch)
+        and returns a list with one of the tuples above per item.
+
+    Returns
+    -------
+    errors : dict
+        {item: error message or None}
+    """
+    errors = {}
+    pool = None
+    try:
+        if chunk_size:
+            items = list(items)
+            outcomes = (outcome for chunk in iter_per_file(worker, [items[k:k + chunk_size]
+                                                                    for k in range(0, len(items), chunk_size)], workers)
+                        for outcome in chunk)
+        else:
+            outcomes = iter_per_file(worker, items, workers)
+        for item, error, specs, *result in outcomes:
+            errors[item] = error
+            if on_result is not None and result and result[0] is not None:
+                on_result(item, result[0])
+            if specs:
+                if pool is None:
+                    pool = RenderPool(render_workers)
+                pool.submit_all(specs)
+    finally:
+        if pool is not None:
+            pool.close()
+    return errors
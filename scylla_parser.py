@@ -0,0 +1,205 @@
+import warnings
+import numpy as np
+import pandas as pd
+
+"""
+    Single-pass reader for the row-oriented CSVs written by the Scylla station. Below a fixed-size header block, each
+    measured quantity is stored as one row: a label in the first column followed by the values of the sweep.
+
+    The file is read once, the label column is scanned once for every search term, and only the rows that were asked
+    for are converted to float64 NumPy arrays (C tokenizer, with a per-row fallback for empty or malformed cells).
+
+    OSA files repeat a block of four rows per sweep; read_osa_sweeps decodes them into one matrix per quantity.
+
+    Matching follows the old pandas-based readers: a search term matches the first label containing it (case
+    insensitive), and rows with more fields than the first row after the header are skipped (on_bad_lines="skip").
+
+    [Author: Rhiannon H Evans]
+"""
+
+SCYLLA_HEADER_ROWS = 24
+
+LIV_TERMS = {
+    "current": "Current",
+    "voltage": "Voltage",
+    "temperature": "Temperature",
+    "channel 0": "0",
+    "channel 1": "1",
+    "channel 2": "2",
+    "channel 3": "3"
+}
+
+WLM_TERMS = {
+    "current": "Current",
+    "voltage": "Voltage",
+    "temperature": "Temperature",
+    "wavelength": "Wavelength",
+    "channel 0": "0",
+    "channel 1": "1",
+    "channel 2": "2",
+    "channel 3": "3"
+}
+
+
+def read_lines(path, skiprows=SCYLLA_HEADER_ROWS):
+    """Read the file once and return its lines below the header block (blank lines dropped)."""
+    with open(path, "r", newline="") as f:
+        lines = f.read().splitlines()
+    return [line for line in lines[skiprows:] if line.strip()]
+
+
+def split_label(line):
+    """Split a row into (label, values text). The label is stripped of whitespace and quotes."""
+    label, sep, values = line.partition(",")
+    return label.strip().strip('"').strip(), values
+
+
+def parse_values(values):
+    """
+    Convert the comma-separated values of one row to a contiguous float64 array.
+
+    Uses NumPy's C tokenizer; rows with empty or non-numeric cells fall back to pd.to_numeric(errors='coerce') so the
+    result matches the old per-row conversion (bad cells become NaN).
+    """
+    n_fields = values.count(",") + 1 if values else 0
+    if n_fields == 0:
+        return np.empty(0, dtype=np.float64)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            arr = np.fromstring(values, dtype=np.float64, sep=",")
+        if arr.size == n_fields:
+            return arr
+    except (ValueError, DeprecationWarning):
+        pass
+    cells = pd.Series(values.split(","), dtype=object).str.strip()
+    return pd.to_numeric(cells, errors="coerce").to_numpy(dtype=np.float64)
+
+
+def find_labelled_rows(lines, search_terms):
+    """
+    Single scan over the label column. Returns {key: line index or None} where each key maps to the first line whose
+    label contains its search term (case insensitive).
+    """
+    pending = {key: term.lower() for key, term in search_terms.items()}
+    indices = {key: None for key in search_terms}
+    width = None
+    for i, line in enumerate(lines):
+        n_fields = line.count(",") + 1
+        if width is None:
+            width = n_fields
+        elif n_fields > width:
+            continue  # would have been dropped by on_bad_lines="skip"
+        label = split_label(line)[0].lower()
+        for key, term in list(pending.items()):
+            if term in label:
+                indices[key] = i
+                del pending[key]
+        if not pending:
+            break
+    return indices
+
+
+def read_scylla_rows(path, search_terms, skiprows=SCYLLA_HEADER_ROWS):
+    """
+    Read the labelled rows of a Scylla LIV/WLM csv in one pass.
+
+    Parameters
+    ----------
+    path : str or Path
+        Raw measurement csv.
+    search_terms : dict
+        {key: term} pairs, e.g. LIV_TERMS or WLM_TERMS.
+    skiprows : int
+        Number of header rows above the data block.
+
+    Returns
+    -------
+    rows : dict
+        {key: float64 ndarray or None}. Rows are padded with NaN (or trimmed) to the width of the data block so all
+        arrays of one file share the same length.
+    """
+    lines = read_lines(path, skiprows)
+    indices = find_labelled_rows(lines, search_terms)
+    width = (lines[0].count(",") if lines else 0)
+
+    rows = {}
+    for key, idx in indices.items():
+        if idx is None:
+            rows[key] = None
+            continue
+        arr = parse_values(split_label(lines[idx])[1])
+        if arr.size < width:
+            arr = np.concatenate([arr, np.full(width - arr.size, np.nan)])
+        rows[key] = np.ascontiguousarray(arr[:width], dtype=np.float64)
+    return rows
+
+
+OSA_LABELS = {
+    "Current (A)": "current",
+    "Temperature (C)": "temperature",
+    "Wavelength (nm)": "wavelength",
+    "Optical power (dBm)": "power"
+}
+
+
+def read_osa_sweeps(path, skiprows=SCYLLA_HEADER_ROWS):
+    """
+    Read every sweep of a Scylla OSA csv in a single pass over the file.
+
+    Each sweep is stored as four consecutive rows (Current (A), Temperature (C), Wavelength (nm), Optical power (dBm)).
+    The label column is scanned once to count sweeps and points, then each spectrum row is decoded straight into a
+    preallocated matrix. The k-th occurrence of each label belongs to sweep k.
+
+    Returns
+    -------
+    sweeps : dict
+        "current" (n_sweeps,) in A, "temperature" (n_sweeps,) in C,
+        "wavelength" and "power" (n_sweeps x n_points) float64, NaN padded past each sweep's length,
+        "n_points" (n_sweeps,) int, number of valid points in each sweep.
+    """
+    lines = read_lines(path, skiprows)
+
+    rows = {key: [] for key in OSA_LABELS.values()}
+    n_points = 0
+    for i, line in enumerate(lines):
+        label, values = split_label(line)
+        key = OSA_LABELS.get(label)
+        if key is None:
+            continue
+        rows[key].append(i)
+        if key in ("wavelength", "power"):
+            n_points = max(n_points, values.count(",") + 1)
+
+    n_sweeps = min(len(idx) for idx in rows.values())
+    current = np.full(n_sweeps, np.nan)
+    temperature = np.full(n_sweeps, np.nan)
+    wavelength = np.full((n_sweeps, n_points), np.nan)
+    power = np.full((n_sweeps, n_points), np.nan)
+    lengths = np.zeros(n_sweeps, dtype=int)
+
+    for k in range(n_sweeps):
+        current[k] = parse_values(split_label(lines[rows["current"][k]])[1])[0]
+        temperature[k] = parse_values(split_label(lines[rows["temperature"][k]])[1])[0]
+        wl = parse_values(split_label(lines[rows["wavelength"][k]])[1])
+        pw = parse_values(split_label(lines[rows["power"][k]])[1])
+        n = min(wl.size, pw.size)
+        wavelength[k, :n] = wl[:n]
+        power[k, :n] = pw[:n]
+        lengths[k] = n
+
+    return {
+        "current": current,
+        "temperature": temperature,
+        "wavelength": wavelength,
+        "power": power,
+        "n_points": lengths
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    for f in sys.argv[1:]:
+        rows = read_scylla_rows(f, WLM_TERMS)
+        for key, arr in rows.items():
+            print(f"{key}: {None if arr is None else arr.shape}")
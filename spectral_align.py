@@ -0,0 +1,221 @@
+import numpy as np
+from scipy.fft import rfft, irfft, next_fast_len
+from scipy.signal import find_peaks
+
+"""
+    FFT-based comparison of spectra (e.g. on-chip vs benchtop in compONvsOFF.py), without matching individual peaks.
+
+    Both spectra are resampled onto a uniform wavelength grid, detrended (a low-order polynomial baseline is subtracted,
+    so e.g. on-chip power that rises with current does not swamp the fringes), standardised and then:
+            - spectral_offset: the cross-correlation (via FFT) of two spectra gives the wavelength shift between them
+            - estimate_fsr:    the autocorrelation (via FFT) of one spectrum gives its free spectral range (the lag of
+                               the strongest repeat of the spectrum)
+    The cross-correlation is normalised by the overlap of the two spectra at each shift, so the score is 1 for identical
+    shapes whatever the overlap; the shift is chosen on that score weighted by the overlap, and only within half the
+    FSR of the reference (a periodic spectrum matches itself every FSR, so a shift is only defined modulo the FSR).
+    Both are O(n log n) in the number of grid points, so they work on million-point benchtop scans. Peak lags are
+    refined to a fraction of the grid step by a parabola through the three highest correlation points.
+
+    Usage:
+        offset_nm, score = spectral_offset(wl_benchtop, p_benchtop, wl_on_chip, p_on_chip)
+        fsr_nm, strength = estimate_fsr(wl_benchtop, p_benchtop)
+
+    [Author: Rhiannon H Evans]
+"""
+
+# Degree of the polynomial baseline subtracted from each spectrum before correlating (None: mean only)
+DETREND_DEGREE = 3
+# Smallest overlap of the two spectra (fraction of the shorter one) at which a shift is considered
+MIN_OVERLAP = 0.5
+# Shifts whose correlation is within this of the best are equally good (e.g. the repeats of a periodic spectrum); the
+# smallest of them is taken
+TIE_TOLERANCE = 0.02
+
+
+def grid_step(wavelength):
+    """Median spacing of the distinct wavelengths of a spectrum."""
+    steps = np.diff(np.unique(np.asarray(wavelength, dtype=float)[np.isfinite(wavelength)]))
+    if steps.size == 0:
+        raise ValueError("A spectrum needs at least two distinct wavelengths.")
+    return float(np.median(steps))
+
+
+def common_grid(*wavelengths, step=None):
+    """
+    Uniform grid over the wavelength range shared by all spectra, with the finest median spacing among them (or step).
+    """
+    lo = max(np.nanmin(w) for w in wavelengths)
+    hi = min(np.nanmax(w) for w in wavelengths)
+    if not hi > lo:
+        raise ValueError("The spectra do not overlap in wavelength.")
+    if step is None:
+        step = min(grid_step(w) for w in wavelengths)
+    return lo + step * np.arange(int(np.floor((hi - lo) / step)) + 1)
+
+
+def resample(wavelength, power, grid):
+    """Linear interpolation of a spectrum (any order, NaNs dropped) onto grid; NaN outside its wavelength range."""
+    wavelength = np.asarray(wavelength, dtype=float)
+    power = np.asarray(power, dtype=float)
+    keep = np.isfinite(wavelength) & np.isfinite(power)
+    order = np.argsort(wavelength[keep], kind="stable")
+    return np.interp(grid, wavelength[keep][order], power[keep][order], left=np.nan, right=np.nan)
+
+
+def detrend(power, degree=DETREND_DEGREE):
+    """Power minus its least-squares polynomial baseline of the given degree (NaN kept; mean only if degree is None)."""
+    power = np.asarray(power, dtype=float)
+    valid = np.isfinite(power)
+    if degree is None or valid.sum() <= degree + 1:
+        return power - np.nanmean(power) if valid.any() else power
+    x = np.linspace(-1, 1, power.size)  # scaled abscissa keeps the fit well conditioned
+    baseline = np.polynomial.polynomial.polyval(x, np.polynomial.polynomial.polyfit(x[valid], power[valid], degree))
+    return power - baseline
+
+
+def _standardise(power, degree=DETREND_DEGREE):
+    # Detrended, unit variance, and the mask of valid points; NaN (outside the spectrum) counts as 0 so it adds
+    # nothing to the correlation
+    centred = detrend(power, degree)
+    valid = np.isfinite(centred)
+    std = np.nanstd(centred) if valid.any() else 0.0
+    return np.nan_to_num(centred / std if std > 0 else centred), valid.astype(float)
+
+
+def _xcorr(x, y, n, nfft):
+    # Lags -(n-1) .. n-1: value at lag k = sum over i of x[i] * y[i + k]
+    corr = irfft(rfft(y, nfft) * np.conj(rfft(x, nfft)), nfft)
+    return np.concatenate([corr[nfft - (n - 1):], corr[:n]])
+
+
+def _refine_peak(values, k):
+    # Sub-sample position of the maximum at index k from a parabola through its neighbours
+    if 0 < k < len(values) - 1:
+        denom = values[k - 1] - 2 * values[k] + values[k + 1]
+        if denom < 0:
+            return k + 0.5 * (values[k - 1] - values[k + 1]) / denom
+    return float(k)
+
+
+def spectral_offset(ref_wavelength, ref_power, wavelength, power, step=None, max_offset=None,
+                    detrend_degree=DETREND_DEGREE, min_overlap=MIN_OVERLAP):
+    """
+    Wavelength shift of a spectrum relative to a reference spectrum, from their FFT cross-correlation on a common grid.
+
+    Parameters
+    ----------
+    ref_wavelength, ref_power : array_like
+        Reference spectrum (e.g. benchtop scan).
+    wavelength, power : array_like
+        Spectrum to align (e.g. on-chip spectrum).
+    step : float or None
+        Grid step (nm); the finer of the two median spacings if None.
+    max_offset : float or None
+        Largest shift (nm) to consider. If None, half the FSR of the reference (estimate_fsr), or any shift within the
+        overlap if the reference shows no periodicity; np.inf always searches the whole overlap.
+    detrend_degree : int or None
+        Degree of the polynomial baseline removed from both spectra (DETREND_DEGREE by default).
+    min_overlap : float
+        Shifts at which the spectra overlap by less than this fraction of the shorter one are not considered.
+
+    Returns
+    -------
+    offset : float
+        Shift (nm): positive if the spectrum lies at longer wavelengths than the reference.
+    score : float
+        Correlation over the overlap at that shift (1 = identical shape, NaN if no shift has enough overlap). The shift
+        is the best of these correlations weighted by the overlap, so a shift at which little of the spectra overlaps
+        does not win on a few well-matched points.
+    """
+    grid = common_grid(ref_wavelength, wavelength, step=step)
+    step = grid[1] - grid[0] if grid.size > 1 else 1.0
+    a, mask_a = _standardise(resample(ref_wavelength, ref_power, grid), detrend_degree)
+    b, mask_b = _standardise(resample(wavelength, power, grid), detrend_degree)
+    n = grid.size
+    if max_offset is None:
+        fsr, _ = estimate_fsr(ref_wavelength, ref_power, detrend_degree=detrend_degree)
+        max_offset = fsr / 2 if np.isfinite(fsr) else np.inf
+
+    nfft = next_fast_len(2 * n - 1, real=True)
+    corr = _xcorr(a, b, n, nfft)
+    # Energy of each spectrum over the points it shares with the other at every lag, so each lag is normalised by
+    # its own overlap (a Pearson-like coefficient instead of a sum that shrinks with the overlap)
+    energy_a = _xcorr(a * a, mask_b, n, nfft)
+    energy_b = _xcorr(mask_a, b * b, n, nfft)
+    overlap = np.rint(_xcorr(mask_a, mask_b, n, nfft))
+    lags = np.arange(-(n - 1), n)
+    usable = (overlap >= min_overlap * min(mask_a.sum(), mask_b.sum())) & (energy_a > 0) & (energy_b > 0)
+    usable &= np.abs(lags) * step <= max_offset
+    if not usable.any():
+        return np.nan, np.nan
+    with np.errstate(invalid="ignore", divide="ignore"):
+        corr = np.where(usable, corr / np.sqrt(np.abs(energy_a * energy_b)), -np.inf)
+    weighted = np.where(usable, corr * overlap / overlap[usable].max(), -np.inf)
+
+    # Smallest shift among the (near) best, moved up to its local maximum
+    candidates = np.flatnonzero(weighted >= weighted.max() - TIE_TOLERANCE)
+    k = int(candidates[np.argmin(np.abs(lags[candidates]))])
+    while k + 1 < weighted.size and weighted[k + 1] > weighted[k]:
+        k += 1
+    while k > 0 and weighted[k - 1] > weighted[k]:
+        k -= 1
+    return (lags[0] + _refine_peak(weighted, k)) * step, float(corr[k])
+
+
+def estimate_fsr(wavelength, power, step=None, min_fsr=None, max_fsr=None, min_strength=0.1,
+                 detrend_degree=DETREND_DEGREE):
+    """
+    Free spectral range of a periodic spectrum from its FFT autocorrelation.
+
+    Parameters
+    ----------
+    wavelength, power : array_like
+        Spectrum (any order; resampled onto a uniform grid).
+    step : float or None
+        Grid step (nm); the median spacing of the spectrum if None.
+    min_fsr, max_fsr : float or None
+        Range (nm) to search. By default from where the autocorrelation first drops below zero (the end of the
+        central peak) to half the spectrum width.
+    min_strength : float
+        Weakest autocorrelation peak accepted as a period.
+    detrend_degree : int or None
+        Degree of the polynomial baseline removed before the autocorrelation (DETREND_DEGREE by default); without it a
+        rising or falling spectrum correlates with itself at every lag and harmonics of the FSR win.
+
+    Returns
+    -------
+    fsr : float
+        Free spectral range (nm), NaN if the spectrum shows no periodicity.
+    strength : float
+        Autocorrelation at the FSR (1 = perfectly periodic).
+    """
+    wavelength = np.asarray(wavelength, dtype=float)
+    if step is None:
+        step = grid_step(wavelength)
+    grid = np.nanmin(wavelength) + step * np.arange(int(np.floor((np.nanmax(wavelength) - np.nanmin(wavelength)) / step)) + 1)
+    a, _ = _standardise(resample(wavelength, power, grid), detrend_degree)
+    n = grid.size
+
+    nfft = next_fast_len(2 * n - 1, real=True)
+    spectrum = rfft(a, nfft)
+    acf = irfft(spectrum * np.conj(spectrum), nfft)[:n]
+    if not acf[0] > 0:
+        return np.nan, np.nan
+    acf = acf / acf[0]
+
+    if min_fsr is None:
+        below = np.flatnonzero(acf < 0)
+        first_lag = int(below[0]) if below.size else n
+    else:
+        first_lag = max(1, int(np.ceil(min_fsr / step)))
+    last_lag = min(n - 1, int(np.floor(max_fsr / step)) if max_fsr is not None else n // 2)
+    if last_lag <= first_lag:
+        return np.nan, np.nan
+
+    peaks, _ = find_peaks(acf[first_lag:last_lag + 1])
+    if peaks.size == 0:
+        return np.nan, np.nan
+    k = first_lag + int(peaks[np.argmax(acf[first_lag + peaks])])
+    if acf[k] < min_strength:
+        return np.nan, float(acf[k])
+    return _refine_peak(acf, k) * step, float(acf[k])
@@ -0,0 +1,255 @@
+import json
+from pathlib import Path
+import numpy as np
+from OSAclass import spectral_map
+from campaign_store import file_stamp
+
+"""
+    Archive of every OSA spectrum of a campaign, for analyses across devices (e.g. all spectra at 50 mA) without loading
+    every _new.mat. The archive is a folder 'OSA_spectra' in the parent folder with three append-only .npy files that
+    are read memory-mapped, so a query only touches the spectra it returns:
+            - power.npy: the valid points of every sweep, back to back (float64, dBm)
+            - wavelength.npy: the wavelength axes (nm), one per device when its sweeps share a grid, else one per sweep
+            - index.npy: one row per sweep (IDtag, sweep, current, temperature, offset and length of its power and of
+              its wavelength axis, valid), searched as a numpy structured array
+    A device that is appended again keeps its old spectra in the files, but their rows are marked invalid.
+    'devices.json' records the .mat each device came from. Only one process may write to an archive at a time (the
+    multi_osa driver appends from the main process).
+
+    Usage:
+        archive = SpectralArchive(archive_path(parent_dir))
+        archive.append(idtag, osa_data, source=mat_path)        # or OSAclass(csv, archive=archive)
+        rows = archive.select(current_mA=50)                    # index rows of all devices at 50 mA
+        wavelength, power = archive.read(rows)                  # n_rows x n_points, NaN padded
+
+    [Author: Rhiannon H Evans]
+"""
+
+ARCHIVE_VERSION = 1
+
+INDEX_DTYPE = np.dtype([
+    ("idtag", "U64"),
+    ("sweep", "<i4"),
+    ("current_mA", "<f8"),
+    ("temperature_C", "<f8"),
+    ("start", "<i8"),
+    ("length", "<i8"),
+    ("wl_start", "<i8"),
+    ("wl_length", "<i8"),
+    ("valid", "?"),
+])
+
+# Fixed size of the .npy headers, so the row count can be rewritten in place as the files grow
+_HEADER_SIZE = 512
+_MAGIC = b"\x93NUMPY\x01\x00"
+
+
+def archive_path(parent_path):
+    """Spectral archive folder in the parent folder."""
+    return Path(parent_path) / "OSA_spectra"
+
+
+def _header(dtype, n_rows):
+    # .npy version 1.0 header of a 1-D array, padded with spaces to _HEADER_SIZE bytes
+    text = repr({"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (n_rows,)})
+    text = text.ljust(_HEADER_SIZE - len(_MAGIC) - 3) + "\n"
+    return _MAGIC + len(text).to_bytes(2, "little") + text.encode("latin1")
+
+
+class _AppendableArray:
+    """A 1-D .npy file that grows by appending elements (the header is rewritten with the new length)."""
+
+    def __init__(self, path, dtype):
+        self.path = Path(path)
+        self.dtype = np.dtype(dtype)
+        if not self.path.exists():
+            with open(self.path, "wb") as f:
+                f.write(_header(self.dtype, 0))
+        with open(self.path, "rb") as f:
+            np.lib.format.read_magic(f)
+            shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+            if f.tell() != _HEADER_SIZE or dtype != self.dtype:
+                raise ValueError(f"{self.path} is not a spectral archive file")
+        self.n_rows = shape[0]
+
+    def append(self, values):
+        """Append values and return the offset of the first one."""
+        return self.extend([values])
+
+    def extend(self, chunks):
+        """Append the values of each chunk in turn (one chunk in memory at a time) and return the offset of the first."""
+        start = end = self.n_rows
+        with open(self.path, "r+b") as f:
+            # Bytes past the recorded length (an interrupted append) are overwritten
+            f.seek(_HEADER_SIZE + start * self.dtype.itemsize)
+            for chunk in chunks:
+                chunk = np.ascontiguousarray(chunk, dtype=self.dtype)
+                f.write(chunk.tobytes())
+                end += chunk.size
+            f.seek(0)
+            f.write(_header(self.dtype, end))
+        self.n_rows = end
+        return start
+
+    def view(self, mode="r"):
+        """Memory-mapped view of all elements."""
+        if self.n_rows == 0:
+            return np.empty(0, dtype=self.dtype)
+        return np.load(self.path, mmap_mode=mode)
+
+
+class SpectralArchive:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._power = _AppendableArray(self.path / "power.npy", "<f8")
+        self._wavelength = _AppendableArray(self.path / "wavelength.npy", "<f8")
+        self._index = _AppendableArray(self.path / "index.npy", INDEX_DTYPE)
+        self._devices_file = self.path / "devices.json"
+        self._devices = self._read_devices()
+        self._changed = False
+
+    def _read_devices(self):
+        try:
+            with open(self._devices_file, "r") as f:
+                devices = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if devices.get("version") != ARCHIVE_VERSION:
+            print(f"Ignoring device list of {self.path} written by another version")
+            return {}
+        return devices["devices"]
+
+    # --- devices ---
+    def idtags(self):
+        return list(self._devices)
+
+    def __contains__(self, idtag):
+        return idtag in self._devices
+
+    def __len__(self):
+        return len(self._devices)
+
+    def is_current(self, idtag, source):
+        """True if the spectra of idtag come from source and that file has not changed since."""
+        entry = self._devices.get(idtag)
+        if entry is None or entry["source"] != str(source):
+            return False
+        try:
+            return entry["stat"] == file_stamp(source)
+        except OSError:
+            return False
+
+    # --- writing ---
+    def append(self, idtag, data, source=None):
+        """
+        Add the spectra of a device (or replace them) from its OSA data: the dict saved by OSAclass, or a _new.mat
+        loaded with scipy.io.loadmat (current_mA, temperature_C, optical_power_dBm, wavelength_nm[, sweep_lengths]).
+        The device list is written by flush()/close().
+        """
+        if len(idtag) > INDEX_DTYPE["idtag"].itemsize // 4:
+            raise ValueError(f"IDtag too long for the spectral archive: {idtag}")
+        wavelength, power, lengths = spectral_map(data, copy=False)
+        n_sweeps = len(lengths)
+        currents = np.asarray(data["current_mA"], dtype=float).ravel()
+        temperatures = np.asarray(data["temperature_C"], dtype=float).ravel()
+
+        rows = np.zeros(n_sweeps, dtype=INDEX_DTYPE)
+        rows["idtag"] = idtag
+        rows["sweep"] = np.arange(n_sweeps)
+        rows["current_mA"] = currents[:n_sweeps]
+        rows["temperature_C"] = temperatures[:n_sweeps]
+        rows["length"] = rows["wl_length"] = lengths
+        rows["valid"] = True
+
+        # Written one sweep at a time, so no copy of the device's spectra is made
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(int)
+        rows["start"] = self._power.extend(power[k, :n] for k, n in enumerate(lengths)) + offsets
+        shared = n_sweeps and (wavelength.strides[0] == 0 or np.array_equal(
+            wavelength, np.broadcast_to(wavelength[0], wavelength.shape), equal_nan=True))
+        if shared:
+            # Shared grid: one axis for the whole device
+            rows["wl_start"] = self._wavelength.append(wavelength[0, :lengths.max()])
+        else:
+            rows["wl_start"] = self._wavelength.extend(wavelength[k, :n] for k, n in enumerate(lengths)) + offsets
+
+        if idtag in self._devices:
+            index = self._index.view("r+")
+            index["valid"][index["idtag"] == idtag] = False
+            index.flush()
+            del index
+        self._index.append(rows)
+        self._devices[idtag] = {
+            "source": None if source is None else str(source),
+            "stat": None if source is None else file_stamp(source),
+        }
+        self._changed = True
+
+    def flush(self):
+        """Write the device list (failures are reported, not raised)."""
+        if not self._changed:
+            return
+        try:
+            with open(self._devices_file, "w") as f:
+                json.dump({"version": ARCHIVE_VERSION, "devices": self._devices}, f)
+            self._changed = False
+        except OSError as e:
+            print(f"Warning: could not write spectral archive device list {self._devices_file}: {e}")
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- reading ---
+    def index(self):
+        """Index rows of every valid sweep (a structured array, see INDEX_DTYPE)."""
+        index = self._index.view()
+        return index[index["valid"]]
+
+    def select(self, idtags=None, current_mA=None, sweep=None, atol=0.5):
+        """
+        Index rows of the valid sweeps that match every given filter.
+
+        Parameters
+        ----------
+        idtags : str or iterable of str or None
+            Devices to keep.
+        current_mA : float or None
+            Keep the sweeps whose current is within atol (mA) of this value.
+        sweep : int or None
+            Keep this sweep number of each device.
+        """
+        rows = self.index()
+        keep = np.ones(len(rows), dtype=bool)
+        if idtags is not None:
+            keep &= np.isin(rows["idtag"], [idtags] if isinstance(idtags, str) else list(idtags))
+        if current_mA is not None:
+            keep &= np.isclose(rows["current_mA"], current_mA, rtol=0, atol=atol)
+        if sweep is not None:
+            keep &= rows["sweep"] == sweep
+        return rows[keep]
+
+    def spectrum(self, row):
+        """(wavelength, power) of one index row, as read-only memory-mapped views."""
+        wavelength = self._wavelength.view()[row["wl_start"]:row["wl_start"] + row["wl_length"]]
+        power = self._power.view()[row["start"]:row["start"] + row["length"]]
+        return wavelength, power
+
+    def read(self, rows):
+        """
+        Spectra of the given index rows as two n_rows x n_points matrices (wavelength, power), NaN padded past the
+        end of shorter sweeps. Only these spectra are read from disk.
+        """
+        n_points = int(rows["length"].max()) if len(rows) else 0
+        wavelength = np.full((len(rows), n_points), np.nan)
+        power = np.full((len(rows), n_points), np.nan)
+        wl_all, pw_all = self._wavelength.view(), self._power.view()
+        for k, row in enumerate(rows):
+            wavelength[k, :row["wl_length"]] = wl_all[row["wl_start"]:row["wl_start"] + row["wl_length"]]
+            power[k, :row["length"]] = pw_all[row["start"]:row["start"] + row["length"]]
+        return wavelength, power
@@ -0,0 +1,158 @@
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from campaign_store import file_stamp
+
+"""
+    Columnar index of the scalar results of every processed device (thresholds, peak power and where it occurs, fit
+    coefficients, power at fixed currents, ...), one row per IDtag, in '<kind>_summary.npz' in the parent folder.
+
+    Each processor (LIVclass, WLMclass, OSAclass) builds its row with summary_row; the multi_* drivers append the rows
+    and save the index once per run. Scalar comparisons (threshold box plots, bar charts) then read this one small
+    file instead of the full arrays of every device:
+
+        summary = SummaryIndex(summary_path(parent_dir, "LIV")).frame()   # DataFrame indexed by IDtag
+        summary["ch1_threshold"]
+
+    Columns are float (NaN where a device has no value), plus the IDtag and the .mat each row came from.
+
+    [Author: Rhiannon H Evans]
+"""
+
+SUMMARY_VERSION = 1
+
+# Currents (mA) at which the power of every channel is kept in the summary, with the current of the nearest point
+POWER_CURRENTS = (25, 50)
+
+_META = ("__version__", "IDtag", "source", "source_stat")
+
+
+def summary_path(parent_path, kind):
+    """Summary index of one measurement type (e.g. "LIV", "WLM", "OSA") in the parent folder."""
+    return Path(parent_path) / f"{kind}_summary.npz"
+
+
+def _scalar(value):
+    # float of a numeric value with one element (scalar, [x] or a (1, 1) array from loadmat), NaN if empty/None,
+    # None if it is not a scalar
+    if value is None:
+        return np.nan
+    array = np.asarray(value)
+    if array.dtype.kind not in "biuf":
+        return None
+    if array.size == 0:
+        return np.nan
+    return float(array.ravel()[0]) if array.size == 1 else None
+
+
+def summary_row(data, power_currents=None):
+    """
+    Summary row of one device from its data dict (as saved to .mat, or loaded back with scipy.io.loadmat).
+
+    Parameters
+    ----------
+    data : mapping
+        {name: value}. Numeric scalars are kept as they are, '<name>_coeffs' arrays become '<name>_coeffs_<k>'
+        columns (highest power first, as np.polyfit) and everything else (arrays, strings) is left out.
+    power_currents : sequence of float or None
+        Currents (mA) at which to keep 'channel_<n>' and 'channel_<n>_log' (from the 'current' array, in mA), as
+        '<channel>_at_<I>mA', with the current of the point nearest to I as 'current_near_<I>mA'.
+
+    Returns
+    -------
+    row : dict
+        {column: float}
+    """
+    row = {}
+    for name, value in data.items():
+        if name.startswith("__"):
+            continue
+        if name.endswith("_coeffs"):
+            for k, c in enumerate(np.asarray(value, dtype=float).ravel()):
+                row[f"{name}_{k}"] = float(c)
+            continue
+        scalar = _scalar(value)
+        if scalar is not None:
+            row[name] = scalar
+
+    if power_currents and "current" in data:
+        current = np.asarray(data["current"], dtype=float).ravel()
+        channels = [name for name in data if name.startswith("channel_")]
+        for target in power_currents:
+            label = f"{target:g}mA"
+            if current.size == 0 or np.isnan(current).all():
+                row[f"current_near_{label}"] = np.nan
+                for name in channels:
+                    row[f"{name}_at_{label}"] = np.nan
+                continue
+            k = int(np.nanargmin(np.abs(current - target)))
+            row[f"current_near_{label}"] = float(current[k])
+            for name in channels:
+                values = np.asarray(data[name], dtype=float).ravel() if data[name] is not None else np.empty(0)
+                row[f"{name}_at_{label}"] = float(values[k]) if k < values.size else np.nan
+    return row
+
+
+class SummaryIndex:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.rows = {}      # IDtag: {column: float}
+        self.sources = {}   # IDtag: (source path, file stamp) or (None, None)
+        if self.path.exists():
+            self._load()
+
+    def _load(self):
+        try:
+            with np.load(self.path, allow_pickle=False) as z:
+                if int(z["__version__"]) != SUMMARY_VERSION:
+                    print(f"Ignoring summary index {self.path} written by another version")
+                    return
+                columns = {name: z[name] for name in z.files if name not in _META}
+                idtags, sources, stats = z["IDtag"].tolist(), z["source"].tolist(), z["source_stat"].tolist()
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable summary index {self.path}: {e}")
+            return
+        for k, idtag in enumerate(idtags):
+            self.rows[idtag] = {name: float(values[k]) for name, values in columns.items()}
+            self.sources[idtag] = (sources[k] or None, stats[k] if sources[k] else None)
+
+    def __contains__(self, idtag):
+        return idtag in self.rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def is_current(self, idtag, source):
+        """True if the row of idtag came from source and that file has not changed since."""
+        path, stat = self.sources.get(idtag, (None, None))
+        if path != str(source):
+            return False
+        try:
+            return stat == file_stamp(source)
+        except OSError:
+            return False
+
+    def append(self, idtag, row, source=None):
+        """Add (or replace) the row of a device; call save() to write the index."""
+        self.rows[idtag] = dict(row)
+        self.sources[idtag] = (None, None) if source is None else (str(source), file_stamp(source))
+
+    def save(self):
+        """Write the whole index as one column per array (failures are reported, not raised)."""
+        idtags = list(self.rows)
+        names = list(dict.fromkeys(name for row in self.rows.values() for name in row))
+        columns = {name: np.array([self.rows[idtag].get(name, np.nan) for idtag in idtags], dtype=float)
+                   for name in names}
+        sources = [self.sources[idtag][0] or "" for idtag in idtags]
+        stats = np.array([self.sources[idtag][1] or [0, 0] for idtag in idtags], dtype=np.int64).reshape(-1, 2)
+        try:
+            with open(self.path, "wb") as f:
+                np.savez(f, __version__=np.array(SUMMARY_VERSION), IDtag=np.array(idtags, dtype=str),
+                         source=np.array(sources, dtype=str), source_stat=stats, **columns)
+        except OSError as e:
+            print(f"Warning: could not write summary index {self.path}: {e}")
+
+    def frame(self, idtags=None):
+        """DataFrame of the summary indexed by IDtag (rows of idtags in that order, NaN for unknown devices)."""
+        frame = pd.DataFrame.from_dict(self.rows, orient="index", dtype=float)
+        return frame if idtags is None else frame.reindex(list(idtags))
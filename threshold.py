@@ -14,51 +14,372 @@ import numpy as np
 import matplotlib.pyplot as plt
 from collections import Counter
 import os
+from scipy.signal import savgol_filter
+from render import FigureSpec, InlineRenderer, show_figure
+
+
+
+def fit_idvdi(I,V, base_name=None, save_dir=None, render_plots=True, renderer=None, threshold=None, iv=None):
+    """
+    Differential resistance analysis of one IV curve (see batch_iv_analysis), with the I*dV/dI plot.
+
+    Parameters
+    ----------
+    I, V : array_like
+        Current (mA) and voltage (V).
+    base_name, save_dir : str or None
+        Plot file name prefix and folder; if either is None the plot is shown instead of saved.
+    threshold : float or None
+        Threshold current (mA), used for the I*dV/dI kink and marked on the plot.
+    iv : dict or None
+        batch_iv_analysis result of this curve if it was already analysed in a batch with others (computed here if None).
+
+    Returns
+    -------
+    results : dict
+        Scalars series_resistance (ohm), turn_on_voltage (V) and IdVdI_kink (V), NaN where they cannot be computed.
+    """
+    I = np.asarray(I, dtype=float)
+    V = np.asarray(V, dtype=float)
+    if iv is None:
+        iv = batch_iv_analysis(I, V, thresholds=np.nan if threshold is None else threshold)
+    results = {name: float(iv[name]) for name in IV_SCALARS}
+    print(f"Series resistance: {results['series_resistance']:.2f} ohm, turn-on voltage: {results['turn_on_voltage']:.3f} V, "
+          f"I*dV/dI kink: {results['IdVdI_kink']:.4f} V")
+    if not render_plots:
+        return results
+
+    # Plot (saved as svg and png if an output folder is given, otherwise shown with plt.show())
+    save = base_name is not None and save_dir is not None
+    paths = [os.path.join(save_dir, base_name + "_I_dVdIcurve.svg"),
+             os.path.join(save_dir, base_name + "_I_dVdIcurve.png")] if save else []
+    fig = FigureSpec(paths, figsize=(8, 5), tight_layout=True)
+    ax = fig.axes[0]
+    ax.plot(I, iv["I_dVdI"], label='I*dV/dI', alpha=0.6)
+    ax.plot(I, iv["I_dVdI_smooth"], 'r--', label='Smoothed')
+    if threshold is not None and np.isfinite(threshold):
+        ax.axvline(threshold, color='gray', linestyle=':', label=f'Threshold: {threshold:.2f} mA')
+    ax.set_xlabel('Current (mA)')
+    ax.set_ylabel('I*dV/dI (V)')
+    ax.set_title('Differential vs Current')
+    ax.legend()
+    #ax.set_xlim(0,15)
+    ax.grid(True)
+
+    if save:
+        (renderer if renderer is not None else InlineRenderer()).submit(fig)
+    else:
+        show_figure(fig)
+
+    return results
+
+def line_fit(x, y, weights):
+    """Weighted least-squares line along the last axis; returns intercept, slope (NaN where fewer than 2 distinct points)."""
+    n = weights.sum(axis=-1)
+    sx = (weights * x).sum(axis=-1)
+    sy = (weights * y).sum(axis=-1)
+    sxx = (weights * x * x).sum(axis=-1)
+    sxy = (weights * x * y).sum(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (n * sxy - sx * sy) / (n * sxx - sx * sx)
+        intercept = (sy - slope * sx) / n
+    return intercept, slope
+
+
+def batch_gradient(y, x):
+    """
+    dy/dx along the last axis of NaN padded rows: the second-order central difference of np.gradient inside each
+    row, one-sided differences at the ends of the valid points.
+    """
+    y, x = np.broadcast_arrays(np.asarray(y, dtype=float), np.asarray(x, dtype=float))
+    pad = [(0, 0)] * (y.ndim - 1) + [(1, 1)]
+    yp = np.pad(y, pad, constant_values=np.nan)
+    xp = np.pad(x, pad, constant_values=np.nan)
+    y_prev, y_next = yp[..., :-2], yp[..., 2:]
+    hs = x - xp[..., :-2]
+    hd = xp[..., 2:] - x
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        central = (hs**2 * y_next + (hd**2 - hs**2) * y - hd**2 * y_prev) / (hs * hd * (hd + hs))
+        forward = (y_next - y) / hd
+        backward = (y - y_prev) / hs
+    has_prev = ~np.isnan(y_prev) & ~np.isnan(hs)
+    has_next = ~np.isnan(y_next) & ~np.isnan(hd)
+    return np.where(has_prev & has_next, central, np.where(has_next, forward, np.where(has_prev, backward, np.nan)))
+
+
+def band_smooth(y, points=5):
+    """Centred moving average over `points` samples along the last axis, ignoring NaNs (NaN stays NaN)."""
+    y = np.asarray(y, dtype=float)
+    half = points // 2
+    valid = ~np.isnan(y)
+    pad = [(0, 0)] * (y.ndim - 1) + [(half + 1, half)]
+    sums = np.cumsum(np.pad(np.where(valid, y, 0.0), pad), axis=-1)
+    counts = np.cumsum(np.pad(valid.astype(float), pad), axis=-1)
+    width = 2 * half + 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = (sums[..., width:] - sums[..., :-width]) / (counts[..., width:] - counts[..., :-width])
+    return np.where(valid, mean, np.nan)
+
+
+# Scalar outputs of batch_iv_analysis (saved to the LIV .mat files)
+IV_SCALARS = ("series_resistance", "turn_on_voltage", "IdVdI_kink")
+
+
+def batch_iv_analysis(I, V, thresholds=None, fit_fraction=0.3, smooth_points=5, kink_points=4):
+    """
+    Differential resistance analysis of a batch of IV curves (replaces the per-file spline fit of I*dV/dI).
+
+    Parameters
+    ----------
+    I, V : array_like
+        Current (mA) and voltage (V), shape (..., points), NaN padded.
+    thresholds : array_like or None
+        Threshold current (mA) of each curve, shape I.shape[:-1] (or broadcastable); NaN/None skips the kink.
+    fit_fraction : float
+        The series resistance line is fitted to the points in the top fit_fraction of each curve's current range.
+    smooth_points : int
+        Width of the moving average applied to I*dV/dI (for plotting).
+    kink_points : int
+        Points on each side of the threshold used for the line fits of the kink.
+
+    Returns
+    -------
+    results : dict
+            - dV_dI (ohm), I_dVdI (V), I_dVdI_smooth (V): arrays like I
+            - series_resistance (ohm): slope of V(I) at high current
+            - turn_on_voltage (V):     V(I) line extrapolated to zero current
+            - IdVdI_kink (V):          drop of I*dV/dI across the threshold (line fits either side, evaluated at threshold)
+    """
+    I, V = np.broadcast_arrays(np.asarray(I, dtype=float), np.asarray(V, dtype=float))
+    valid = ~np.isnan(I) & ~np.isnan(V)
+    I = np.where(valid, I, np.nan)
+
+    dV_dI = batch_gradient(V, I)  # V/mA
+    I_dVdI = I * dV_dI
+
+    # Series resistance and turn-on voltage from a line through the high-current part of V(I)
+    I_lo = np.where(valid, I, np.inf).min(axis=-1, keepdims=True)
+    I_hi = np.where(valid, I, -np.inf).max(axis=-1, keepdims=True)
+    high = valid & (I >= I_hi - fit_fraction * (I_hi - I_lo))
+    turn_on, slope = line_fit(np.where(high, I, 0.0), np.where(high, V, 0.0), high.astype(float))
+
+    # Kink: the kink_points nearest points below and at/above the threshold, in current order
+    th = np.broadcast_to(np.asarray(np.nan if thresholds is None else thresholds, dtype=float), I.shape[:-1])
+    order = np.argsort(np.where(valid, I, np.inf), axis=-1, kind="stable")
+    I_sorted = np.take_along_axis(I, order, axis=-1)
+    y_sorted = np.take_along_axis(I_dVdI, order, axis=-1)
+    usable = ~np.isnan(I_sorted) & np.isfinite(y_sorted)
+    split = (usable & (I_sorted < th[..., None])).sum(axis=-1, keepdims=True)
+    pos = np.arange(I.shape[-1])
+    below = usable & (pos >= split - kink_points) & (pos < split)
+    above = usable & (pos >= split) & (pos < split + kink_points)
+
+    def value_at_threshold(side):
+        a, b = line_fit(np.where(side, I_sorted, 0.0), np.where(side, y_sorted, 0.0), side.astype(float))
+        return a + b * th
+
+    return {
+        "dV_dI": dV_dI * 1000,
+        "I_dVdI": I_dVdI,
+        "I_dVdI_smooth": band_smooth(I_dVdI, smooth_points),
+        "series_resistance": (slope * 1000)[()],
+        "turn_on_voltage": turn_on[()],
+        "IdVdI_kink": (value_at_threshold(below) - value_at_threshold(above))[()],
+    }
+
+def stack_padded(rows, length=None):
+    """
+    Stack 1D sweeps of different lengths into one float array, padded with NaN at the end of each row.
+
+    Parameters
+    ----------
+    rows : list of array_like
+        Sweeps (e.g. current or power of several devices).
+    length : int or None
+        Number of points per row (longest sweep if None).
+    """
+    rows = [np.asarray(r, dtype=float).ravel() for r in rows]
+    length = length if length is not None else max((r.size for r in rows), default=0)
+    out = np.full((len(rows), length), np.nan)
+    for k, r in enumerate(rows):
+        out[k, :min(r.size, length)] = r[:length]
+    return out
+
+
+def broadcast_sweeps(I, power):
+    """
+    Broadcast current against power for batch routines. A (devices, points) current array is applied to every channel
+    of a (devices, channels, points) power array. Returns float arrays of the same shape.
+    """
+    power = np.asarray(power, dtype=float)
+    I = np.asarray(I, dtype=float)
+    if I.ndim == power.ndim - 1 and I.ndim > 1:
+        I = I[..., None, :]
+    return np.broadcast_arrays(I, power)
+
+
+def _first_argmax(values, valid):
+    # np.argmax over the valid positions of each row, including its rule that the first NaN wins
+    nan_hit = np.isnan(values) & valid
+    best = np.argmax(np.where(valid & ~nan_hit, values, -np.inf), axis=-1)
+    return np.where(nan_hit.any(axis=-1), np.argmax(nan_hit, axis=-1), best)
+
+
+def batch_thresholds(I, power, i_min=4, i_max=20):
+    """
+    Threshold currents of many LI sweeps at once (vectorized form of the run_liv threshold search).
+
+    For each sweep, the points with i_min < I < i_max are kept (in order), and the derivatives of log(power) are taken
+    between consecutive kept points. The threshold is the current at the maximum second derivative; the maximum jump is
+    the current at the maximum |first derivative|. Sweeps starting at or above i_max, or with too few points in the
+    window, give NaN.
+
+    Parameters
+    ----------
+    I : array_like
+        Current (mA), shape (..., points). A (devices, points) array is broadcast over the channel axis of a
+        (devices, channels, points) power array. NaN padding (ragged sweeps) is ignored.
+    power : array_like
+        Channel power (mW), shape (..., points), NaN padded.
+    i_min, i_max : float
+        Current window (mA) for the search.
+
+    Returns
+    -------
+    threshold_2nd, threshold_1st : ndarray
+        Threshold current and maximum-jump current (mA), shape power.shape[:-1] (scalars for a single sweep).
+    """
+    I, power = broadcast_sweeps(I, power)
+    if power.shape[-1] < 3:
+        # Pad very short sweeps so the derivative arrays are never empty (NaN current is outside the window)
+        pad = [(0, 0)] * (power.ndim - 1) + [(0, 3 - power.shape[-1])]
+        I = np.pad(I, pad, constant_values=np.nan)
+        power = np.pad(power, pad, constant_values=np.nan)
+
+    starts_high = I[..., 0] >= i_max
+
+    # Only the columns that hold window points in some sweep are needed
+    in_window = (I > i_min) & (I < i_max)
+    used = in_window.reshape(-1, in_window.shape[-1]).any(axis=0)
+    if used.any():
+        lo = int(np.argmax(used))
+        hi = len(used) - int(np.argmax(used[::-1]))
+        if hi - lo < 3:  # keep at least 3 columns so the derivative arrays are not empty
+            hi = min(len(used), lo + 3)
+            lo = hi - 3
+        I, power, in_window = I[..., lo:hi], power[..., lo:hi], in_window[..., lo:hi]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        L = np.log(power)
+    n = in_window.sum(axis=-1)[..., None]
+    starts = in_window[..., 1:] & ~in_window[..., :-1]
+    contiguous = (starts.sum(axis=-1) + in_window[..., 0] <= 1).all()
+
+    if contiguous:
+        # Usual case (monotonic sweeps): the window is one run of points, so derivatives can be taken in place
+        I_sub, L_sub = I, L
+        valid1 = in_window[..., 1:] & in_window[..., :-1]
+        valid2 = valid1[..., 1:] & valid1[..., :-1]
+    else:
+        # Move the points inside the window to the front of each row (stable, so their order is kept)
+        order = np.argsort(~in_window, axis=-1, kind="stable")
+        I_sub = np.take_along_axis(I, order, axis=-1)
+        L_sub = np.take_along_axis(L, order, axis=-1)
+        valid1 = np.arange(I.shape[-1] - 1) < n - 1
+        valid2 = np.arange(I.shape[-1] - 2) < n - 2
+
+    with np.errstate(invalid="ignore"):
+        d1 = np.diff(L_sub, axis=-1)
+        d2 = np.diff(d1, axis=-1)
+
+    idx2 = _first_argmax(d2, valid2)[..., None]
+    idx1 = _first_argmax(np.abs(d1), valid1)[..., None]
+    threshold_2nd = np.take_along_axis(I_sub[..., 2:], idx2, axis=-1)[..., 0]
+    threshold_1st = np.take_along_axis(I_sub[..., 1:], idx1, axis=-1)[..., 0]
+
+    threshold_2nd = np.where(starts_high | (n[..., 0] < 3), np.nan, threshold_2nd)
+    threshold_1st = np.where(starts_high | (n[..., 0] < 2), np.nan, threshold_1st)
+    return threshold_2nd[()], threshold_1st[()]
+
+
+def _savgol_window(n, window):
+    # Largest odd window <= n (at least 3), as in the original elbow finder
+    w = min(window, n if n % 2 == 1 else n - 1)
+    if w < 3:
+        w = 3
+    if w % 2 == 0:
+        w += 1
+    return w
+
+
+def find_elbow_smoothed(data, window=7, polyorder=2, lengths=None):
+    """
+    Elbow of each curve: smooth with a Savitzky-Golay filter along the last axis, then take the index just after the
+    largest step between consecutive smoothed points.
+
+    Parameters
+    ----------
+    data : array_like
+        One curve (N,) or a batch of curves (..., N). Curves shorter than N are NaN padded at the end.
+    window : int
+        Savitzky-Golay window; reduced to the largest odd value <= the curve length (and at least 3).
+    polyorder : int
+        Savitzky-Golay polynomial order.
+    lengths : array_like of int or None
+        Number of points of each curve (counted from the non-NaN values if None).
+
+    Returns
+    -------
+    elbow : int, ndarray of int or None
+        Index of the elbow in each curve, -1 where a curve has fewer than 3 points (for a single curve: an int, or None).
+    """
+    arr = np.asarray(data, dtype=float)
+    single = arr.ndim == 1
+    if single and arr.size < 3:
+        return None
+    rows = arr.reshape(-1, arr.shape[-1])
+    if lengths is None:
+        lengths = (~np.isnan(rows)).sum(axis=-1)
+    lengths = np.broadcast_to(np.asarray(lengths, dtype=int).ravel(), (len(rows),))
+
+    elbow = np.full(len(rows), -1)
+    # One vectorized filter per distinct curve length (a batch from one station usually has one or two lengths)
+    for n in np.unique(lengths):
+        if n < 3:
+            continue
+        sel = lengths == n
+        w = _savgol_window(n, window)
+        smooth = savgol_filter(rows[sel, :n], window_length=w, polyorder=min(polyorder, w - 1), axis=-1)
+        steps = np.diff(smooth, axis=-1)
+        steps = np.where(np.isnan(steps), -np.inf, steps)
+        idx = np.argmax(steps, axis=-1) + 1
+        elbow[sel] = np.where(np.isneginf(steps).all(axis=-1), -1, idx)
+
+    if single:
+        return int(elbow[0]) if elbow[0] >= 0 else None
+    return elbow.reshape(arr.shape[:-1])
+
+
+def run_liv(I,channel, base_name=None, save_dir=None, ch_i = 1, render_plots=True, renderer=None, thresholds=None):
+
+    I = np.asarray(I, dtype=float)
+    channel = np.asarray(channel, dtype=float)
+    # Find the maximum second derivative (threshold) and/or first derivative (maximum jump), unless precomputed
+    # with batch_thresholds
+    if thresholds is None:
+        thresholds = batch_thresholds(I, channel)
+    threshold_current_2nd, threshold_current_1st = (None if np.isnan(t) else t for t in thresholds)
+    if I[0] >= 20:
+        print("Warning: Current starts at or above 20mA, skipping threshold analysis.")
+    if threshold_current_2nd is not None:
+        print(f"Threshold (second derivative max) at I = {threshold_current_2nd:.3f} mA")
+    if threshold_current_1st is not None:
+        print(f"Maximum jump (first derivative max) at I = {threshold_current_1st:.3f} mA")
 
-
-
-def fit_idvdi(I,V, base_name=None, save_dir=None):
-    from scipy.interpolate import UnivariateSpline
-    from scipy.signal import argrelextrema
-
-    # Calculate dV/dI
-    dV_dI = np.gradient(V, I)
-    I_dVdI = I*dV_dI 
-
-    # Fit a smooth curve
-    spline = UnivariateSpline(I, I_dVdI, s=0.001)  # s is smoothing factor
-    I_fit = np.linspace(I.min(), I.max(), 2000)
-    I_dVdI_fit = spline(I_fit)
-
-
-    # Plot
-    fig = plt.figure(figsize=(8, 5))
-    plt.plot(I, I_dVdI, label='I*dV/dI', alpha=0.6)
-    plt.plot(I_fit, I_dVdI_fit, 'r--', label='Spline Fit')
-    plt.xlabel('Current (mA)')
-    plt.ylabel('I*dV/dI (V)')
-    plt.title('Differential vs Current')
-    plt.legend()
-    #plt.xlim(0,15)
-    plt.grid(True)
-    plt.tight_layout()
-    #plt.show()
-
-    if base_name is not None and save_dir is not None:
-        # Save the differential resistance plot
-        svg_filename3 = base_name + "_I_dVdIcurve.svg"
-        save_path_svg3 = os.path.join(save_dir, svg_filename3)
-        fig.savefig(save_path_svg3, format="svg", bbox_inches="tight")
-        print(f"Saved dV/dI curve svg to {save_path_svg3}")
-
-        png_filename3 = base_name + "_I_dVdIcurve.png"
-        save_path_png3 = os.path.join(save_dir, png_filename3)
-        fig.savefig(save_path_png3, format="png", bbox_inches="tight")
-        print(f"Saved I*dV/dI curve png to {save_path_png3}")
-
-    return
-
-def run_liv(I,channel, base_name=None, save_dir=None, ch_i = 1):
+    # Metrics only: skip all derivative and LI figures
+    if not render_plots:
+        return threshold_current_2nd
 
     L=np.log(channel)
     #print(I)
@@ -68,32 +389,24 @@ def run_liv(I,channel, base_name=None, save_dir=None, ch_i = 1):
     I_sub = I[mask]
     L_sub = L[mask]
     #print(f"Subtracted I: {I_sub}")
-    # Compute first and second derivatives
+    # Compute first and second derivatives (for the plots; the thresholds come from batch_thresholds)
     d1 = np.diff(L_sub)
     d2 = np.diff(d1)
     # The x-axis for the first and second derivatives
     I_d1 = I_sub[1:]
     I_d2 = I_sub[2:]
-    # Find the index of the maximum second derivative (threshold) and/or first derivative (maximum jump)
-    if I.iloc[0] >= 20:
-        print("Warning: Current starts at or above 20mA, skipping threshold analysis.")
-        threshold_current_1st = None
-        threshold_current_2nd = None
-    else:
-        threshold_idx_2nd = np.argmax(d2)
-        threshold_current_2nd = I_d2.iloc[threshold_idx_2nd]
-        print(f"Threshold (second derivative max) at I = {threshold_current_2nd:.3f} mA")
-        threshold_idx_1st = np.argmax(np.abs(d1))
-        threshold_current_1st = I_d1.iloc[threshold_idx_1st]
-        print(f"Maximum jump (first derivative max) at I = {threshold_current_1st:.3f} mA")
-    
-
 
     #PLOT second and first derivatives
+    save = base_name is not None and save_dir is not None
+    if renderer is None:
+        renderer = InlineRenderer()
 
-    if base_name is not None and save_dir is not None and threshold_current_2nd is not None:
-        # Create a new figure with two subplots side by side for fig2 and fig3
-        fig_combined, (ax2, ax3) = plt.subplots(1, 2, figsize=(14, 6))
+    if save and threshold_current_2nd is not None:
+        # Create a new figure with two subplots side by side for fig2 and fig3 (saved as SVG and PNG)
+        fig_combined = FigureSpec([os.path.join(save_dir, base_name + f"_derivatives_ch{ch_i}.svg"),
+                                   os.path.join(save_dir, base_name + f"_derivatives_ch{ch_i}.png")],
+                                  ncols=2, figsize=(14, 6), tight_layout=True)
+        ax2, ax3 = fig_combined.axes
 
         # Plot second derivative on the left
         ax2.plot(I_d2, d2, marker='o', label='Second derivative')
@@ -115,19 +428,9 @@ def run_liv(I,channel, base_name=None, save_dir=None, ch_i = 1):
         ax3.legend()
         ax3.grid(True)
 
-        fig_combined.tight_layout()
-
-        # Save the combined figure as SVG and PNG
-        svg_filename_combined = base_name + f"_derivatives_ch{ch_i}.svg"
-        save_path_svg_combined = os.path.join(save_dir, svg_filename_combined)
-        fig_combined.savefig(save_path_svg_combined, format="svg", bbox_inches="tight")
-        print(f"Saved combined derivatives plot to {save_path_svg_combined}")
-
-        png_filename_combined = base_name + f"_derivatives_ch{ch_i}.png"
-        save_path_png_combined = os.path.join(save_dir, png_filename_combined)
-        fig_combined.savefig(save_path_png_combined, format="png", bbox_inches="tight")
-        print(f"Saved combined derivatives plot to {save_path_png_combined}")
-    else:
+        renderer.submit(fig_combined)
+    elif not save:
+        # Interactive use (no output folder): separate pyplot figures
         # Plot the second derivative
         fig2 = plt.figure(figsize=(8, 6))
         plt.plot(I_d2, d2, marker='o', label='Second derivative')
@@ -152,8 +455,12 @@ def run_liv(I,channel, base_name=None, save_dir=None, ch_i = 1):
 
     
 
-    if base_name is not None and save_dir is not None:
-        fig_combined, (ax2, ax3) = plt.subplots(1, 2, figsize=(14, 6))
+    if save:
+        # Save the channel plot as SVG and PNG files in the output folder
+        fig_combined = FigureSpec([os.path.join(save_dir, base_name + f"_LI_ch{ch_i}.svg"),
+                                   os.path.join(save_dir, base_name + f"_LI_ch{ch_i}.png")],
+                                  ncols=2, figsize=(14, 6), tight_layout=True)
+        ax2, ax3 = fig_combined.axes
 
         # Plot LI (LOG) curve in dBm
         ax2.plot(I, L, marker='o', label='Power (dBm)')
@@ -175,19 +482,7 @@ def run_liv(I,channel, base_name=None, save_dir=None, ch_i = 1):
         ax3.legend()
         ax3.grid(True)
 
-        fig_combined.tight_layout()
-
-        # Save the channel plot as an SVG file in the output folder
-        svg_filename = base_name + f"_LI_ch{ch_i}.svg"
-        save_path_svg = os.path.join(save_dir, svg_filename)
-        fig_combined.savefig(save_path_svg, format="svg", bbox_inches="tight")
-        print(f"Saved channel {ch_i} plot to {save_path_svg}")
-
-        # Save the channel plot as an PNG file in the output folder
-        png_filename = base_name + f"_LI_ch{ch_i}.png"
-        save_path_png = os.path.join(save_dir, png_filename)
-        fig_combined.savefig(save_path_png, format="png", bbox_inches="tight")
-        print(f"Saved channel {ch_i} plot to {save_path_png}")
+        renderer.submit(fig_combined)
     else:
 
         fig1 = plt.figure(figsize=(8, 6))
@@ -0,0 +1,170 @@
+import warnings
+import numpy as np
+import threshold as thresh
+
+"""
+    Threshold-current engine: a registry of threshold estimators that each run over a whole batch of LI curves, and a
+    consensus of their results.
+
+    Every estimator takes current I (mA) and power (mW) arrays of shape (..., points) (NaN padded, current broadcast as
+    in threshold.broadcast_sweeps) and returns one threshold current (mA) per curve, NaN where it cannot tell.
+    Registered estimators:
+            - second_derivative:    max of the 2nd derivative of log(power) between 4 and 20 mA (same as run_liv)
+            - linear_extrapolation: zero-power intercept of a line fitted to the above-threshold LI curve
+            - smoothed_elbow:       largest step of the Savitzky-Golay smoothed log(power) between 4 and 20 mA
+                                    (threshold.find_elbow_smoothed)
+            - piecewise:            break point of the best two-segment linear fit of the LI curve
+
+    Usage:
+        results = estimate_thresholds(current_mA, power_mW)   # {name: array, ..., "consensus": array}
+
+    New estimators are added with the @estimator("name") decorator.
+
+    [Author: Rhiannon H Evans]
+"""
+
+ESTIMATORS = {}
+
+
+def estimator(name):
+    """Register a batch threshold estimator under name."""
+    def register(func):
+        ESTIMATORS[name] = func
+        return func
+    return register
+
+
+def _rising_part(I, power):
+    # Points of each curve up to (and including) its peak power, i.e. before any thermal rollover
+    valid = ~np.isnan(I) & ~np.isnan(power)
+    filled = np.where(valid, power, -np.inf)
+    peak_idx = np.argmax(filled, axis=-1)[..., None]
+    peak = np.take_along_axis(filled, peak_idx, axis=-1)
+    rising = valid & (np.arange(power.shape[-1]) <= peak_idx)
+    return rising, peak
+
+
+@estimator("second_derivative")
+def second_derivative(I, power, i_min=4, i_max=20):
+    """Threshold at the maximum second derivative of log(power) in the i_min-i_max window (see batch_thresholds)."""
+    return thresh.batch_thresholds(I, power, i_min, i_max)[0]
+
+
+@estimator("linear_extrapolation")
+def linear_extrapolation(I, power, low_fraction=0.2):
+    """
+    Fit a line to the above-threshold LI curve (points from low_fraction of the peak power up to the peak, so rollover
+    is excluded) and return the current where it reaches zero power.
+    """
+    I, power = thresh.broadcast_sweeps(I, power)
+    rising, peak = _rising_part(I, power)
+    above = rising & (power >= low_fraction * peak)
+    intercept, slope = thresh.line_fit(np.where(above, I, 0.0), np.where(above, power, 0.0), above.astype(float))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        threshold = -intercept / slope
+    has_I = ~np.isnan(I)
+    in_range = ((slope > 0) & (threshold >= np.where(has_I, I, np.inf).min(axis=-1))
+                & (threshold <= np.where(has_I, I, -np.inf).max(axis=-1)))
+    return np.where(in_range, threshold, np.nan)
+
+
+@estimator("smoothed_elbow")
+def smoothed_elbow(I, power, i_min=4, i_max=20, window=7, polyorder=2):
+    """Current at the largest step of the Savitzky-Golay smoothed log(power) in the i_min-i_max window."""
+    I, power = thresh.broadcast_sweeps(I, power)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        L = np.log(power)
+
+    # Move the usable window points to the front of each row (in order) and NaN the rest
+    keep = (I > i_min) & (I < i_max) & np.isfinite(L)
+    order = np.argsort(~keep, axis=-1, kind="stable")
+    n = keep.sum(axis=-1)
+    I_sub = np.take_along_axis(I, order, axis=-1)
+    L_sub = np.where(np.arange(I.shape[-1]) < n[..., None], np.take_along_axis(L, order, axis=-1), np.nan)
+
+    idx = thresh.find_elbow_smoothed(L_sub, window=window, polyorder=polyorder, lengths=n)
+    elbow_I = np.take_along_axis(I_sub, np.maximum(idx, 0)[..., None], axis=-1)[..., 0]
+    return np.where((idx >= 0) & (I[..., 0] < i_max), elbow_I, np.nan)[()]
+
+
+@estimator("piecewise")
+def piecewise(I, power, min_points=3):
+    """
+    Best two-segment linear fit of the LI curve up to its peak (all split points evaluated at once from cumulative
+    sums). The threshold is where the two lines cross, or the split point if they do not cross between the segments.
+    """
+    I, power = thresh.broadcast_sweeps(I, power)
+    rising, _ = _rising_part(I, power)
+    w = rising.astype(float)
+    x = np.where(rising, I, 0.0)
+    y = np.where(rising, power, 0.0)
+
+    def prefix(a):
+        # Sums over the first c columns, for c = 0 .. points
+        return np.concatenate([np.zeros(a.shape[:-1] + (1,)), np.cumsum(a, axis=-1)], axis=-1)
+
+    sums = [prefix(a) for a in (w, x, y, x * x, x * y, y * y)]
+    totals = [s[..., -1:] for s in sums]
+
+    def sse(n, sx, sy, sxx, sxy, syy):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            vxx = sxx - sx * sx / n
+            vxy = sxy - sx * sy / n
+            vyy = syy - sy * sy / n
+            return vyy - vxy * vxy / vxx
+
+    left = sums
+    right = [t - s for t, s in zip(totals, sums)]
+    cost = sse(*left) + sse(*right)
+    ok = (left[0] >= min_points) & (right[0] >= min_points) & np.isfinite(cost)
+    cost = np.where(ok, cost, np.inf)
+    split = np.argmin(cost, axis=-1)[..., None]
+    found = np.take_along_axis(ok, split, axis=-1)[..., 0]
+
+    def fit_at(parts):
+        n, sx, sy, sxx, sxy, _ = (np.take_along_axis(p, split, axis=-1)[..., 0] for p in parts)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = (n * sxy - sx * sy) / (n * sxx - sx * sx)
+        return (sy - slope * sx) / n, slope
+
+    (a_left, b_left), (a_right, b_right) = fit_at(left), fit_at(right)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossing = (a_right - a_left) / (b_left - b_right)
+
+    # Use the crossing if the right segment is steeper and the lines meet within the fitted current range,
+    # otherwise the current of the first point of the right segment
+    right_part = rising & (np.arange(I.shape[-1]) >= split)
+    split_I = np.where(right_part, I, np.inf).min(axis=-1)
+    inside = ((b_right > b_left) & (crossing >= np.where(rising, I, np.inf).min(axis=-1))
+              & (crossing <= np.where(rising, I, -np.inf).max(axis=-1)))
+    threshold = np.where(inside, crossing, split_I)
+    return np.where(found, threshold, np.nan)[()]
+
+
+def estimate_thresholds(I, power, estimators=None):
+    """
+    Run threshold estimators over a batch of LI curves and combine them.
+
+    Parameters
+    ----------
+    I : array_like
+        Current (mA), shape (..., points); (devices, points) is broadcast over the channel axis of power.
+    power : array_like
+        Power (mW), shape (..., points), NaN padded.
+    estimators : list of str or None
+        Names from ESTIMATORS to run (all registered estimators if None).
+
+    Returns
+    -------
+    results : dict
+        {name: thresholds (mA), shape power.shape[:-1]} for each estimator, plus "consensus": the median of the
+        estimators that gave a value for each curve.
+    """
+    names = list(ESTIMATORS) if estimators is None else list(estimators)
+    results = {name: np.asarray(ESTIMATORS[name](I, power), dtype=float) for name in names}
+    stacked = np.stack([results[name] for name in names])
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN curves give NaN
+        results["consensus"] = np.nanmedian(stacked, axis=0)
+    return results